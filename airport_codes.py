@@ -19,39 +19,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from dagster import (
-    execute_pipeline,
-    pipeline,
-    ModeDefinition
-)
-from menu import Menu
-
-from db_toolkit.misc import (
-    get_file_path,
-    test_file_path,
-    load_yaml,
-)
-from load_cvs_node import (
-    load_csv_from_zip,
-    combine_csv_from_dict
-)
-from dagster_toolkit.postgres import postgres_warehouse_resource
-from dagster_toolkit.mongo import (
-    mongo_warehouse_resource,
-    download_from_mongo
-)
-from dagster_toolkit.environ import (
-    EnvironmentDict
-)
-from upload_node import (
-    upload_to_mongo,
-    upload_to_postgres
-)
-from process_node import process_unlocode
-from constants import (
-    COL_CHANGE, COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_DIVISION,
-    COL_FUNCTION, COL_STATUS, COL_DATE, COL_IATA, COL_COORD, COL_REMARK
-)
+import argparse
+import os
+import os.path as path
+import sys
+
+from constants import METRICS_FILE_ENV
 
 """
     For information regarding UN/LOCODE, see 
@@ -59,54 +32,77 @@ from constants import (
     For information regarding the data format, see 
     https://unece.org/DAM/cefact/locode/UNLOCODE_Manual.pdf and 
     '2021-1 UNLOCODE SecretariatNotes.pdf' in data/loc211csv.zip
-"""
-
-
-@pipeline(
-    mode_defs=[
-        ModeDefinition(
-            # attach resources to pipeline
-            resource_defs={
-                'mongo_warehouse': mongo_warehouse_resource
-            }
-        )
-    ]
-)
-def csv_to_mongo_pipeline():
-    df_dict = load_csv_from_zip()
-    df = combine_csv_from_dict(df_dict)
-    upload_to_mongo(df)
-
-
-@pipeline(
-    mode_defs=[
-        ModeDefinition(
-            # attach resources to pipeline
-            resource_defs={
-                'postgres_warehouse': postgres_warehouse_resource,
-                'mongo_warehouse': mongo_warehouse_resource
-            }
-        )
-    ]
-)
-def mongo_to_postgres_pipeline():
-    raw = download_from_mongo()
-    processed = process_unlocode(raw)
-    upload_to_postgres(processed)
-
 
-if __name__ == '__main__':
-
-    # get path to config file
-    app_cfg_path = 'config.yaml'  # default in project root
-    if not test_file_path(app_cfg_path):
-        # no default so look for in environment or from console
-        app_cfg_path = get_file_path('AC_CFG',
-                                     'AirportCodes configuration file')
-        if app_cfg_path is None:
-            exit(0)
+    The pipelines and their dependencies (dagster, the toolkits, pandas, etc.)
+    are only imported once a pipeline is selected, so startup, e.g. for
+    '--help', is fast.
+"""
 
-    app_cfg = load_yaml(app_cfg_path)
+# environment variable specifying the configuration file
+CFG_ENV: str = 'AC_CFG'
+# default configuration file, in project root
+DEFAULT_CFG: str = 'config.yaml'
+
+# subcommands, as (name, function in jobs, menu text)
+COMMANDS: list = [
+    ('csv-to-mongo', 'execute_csv_to_mongo_pipeline',
+     "Save UN/LOCODE raw data to MongoDb"),
+    ('csv-to-mongo-stream', 'execute_csv_to_mongo_stream_pipeline',
+     "Stream UN/LOCODE raw data to MongoDb"),
+    ('mongo-to-postgres', 'execute_mongo_to_postgres_pipeline',
+     "Process UN/LOCODE raw data from MongoDb, and save to Postgres"),
+    ('csv-to-mongo-sync', 'execute_csv_to_mongo_sync_pipeline',
+     "Synchronise UN/LOCODE raw data changes to MongoDb"),
+    ('mongo-to-postgres-sync', 'execute_mongo_to_postgres_sync_pipeline',
+     "Process UN/LOCODE raw data from MongoDb, and synchronise changes "
+     "to Postgres"),
+    ('csv-to-postgres', 'execute_csv_to_postgres_pipeline',
+     "Process UN/LOCODE data directly from zip file, and save to Postgres"),
+    ('csv-to-export', 'execute_csv_to_export_pipeline',
+     "Process UN/LOCODE data directly from zip file, and export to Parquet "
+     "and SQLite files"),
+    ('csv-to-postgres-by-function', 'execute_csv_to_postgres_by_function_pipeline',
+     "Process UN/LOCODE data for all functions from zip file, and save to "
+     "Postgres"),
+    ('releases-to-postgres', 'execute_releases_to_postgres_pipeline',
+     "Load UN/LOCODE releases from zip files into the versioned Postgres store"),
+    ('mongo-to-indexes', 'execute_mongo_to_indexes_pipeline',
+     "Process UN/LOCODE raw data from MongoDb, and build lookup indexes"),
+]
+
+
+def get_config_path(cfg_arg, interactive):
+    """
+    Get the path to the configuration file; from the command line, the
+    default file in the project root or the environment, in that order
+    :param cfg_arg: path specified on the command line or None
+    :param interactive: prompt for the path from the console if not found
+    :return: path or None if not found
+    :rtype: str
+    """
+    if cfg_arg is not None:
+        return cfg_arg if path.isfile(cfg_arg) else None
+    if path.isfile(DEFAULT_CFG):
+        return DEFAULT_CFG
+    if interactive:
+        from db_toolkit.misc import get_file_path
+
+        # look for in environment or from console
+        return get_file_path(CFG_ENV, 'AirportCodes configuration file')
+    cfg_path = os.environ.get(CFG_ENV)
+    return cfg_path if cfg_path is not None and path.isfile(cfg_path) else None
+
+
+def load_config(cfg_path):
+    """
+    Load and check the configuration
+    :param cfg_path: path to configuration file
+    :return: configuration
+    :rtype: dict
+    """
+    from db_toolkit.misc import load_yaml
+
+    app_cfg = load_yaml(cfg_path)
 
     if app_cfg is not None:
         # check some basic configs exist
@@ -115,76 +111,93 @@ if __name__ == '__main__':
             if key not in app_cfg.keys():
                 raise EnvironmentError(f'Missing {key} configuration key')
     else:
-        raise EnvironmentError(f'Missing configuration')
-
-    # resource entries for run_config
-    postgres_warehouse = {'config': {'postgres_cfg': app_cfg['postgresdb']}}
-    mongo_warehouse = {'config': {'mongo_cfg': app_cfg['mongodb']}}
-
-    # names of columns in UN/LOCODE data
-    unlocode_header = (
-        COL_CHANGE,
-        COL_LO,
-        COL_CODE,
-        COL_LOCAL,
-        COL_NAME,
-        COL_DIVISION,
-        COL_FUNCTION,
-        COL_STATUS,
-        COL_DATE,
-        COL_IATA,
-        COL_COORD,
-        COL_REMARK
-    )
-    # field not required from mongo
-    exclude_fields = {'_id': 0, COL_CHANGE: 0, COL_DIVISION: 0, COL_STATUS: 0,
-                      COL_DATE: 0, COL_REMARK: 0}
-
-
-    def execute_csv_to_mongo_pipeline():
-        """
-        Execute the pipeline to upload the UN/LOCODE data from the zipped csv
-        files to mongoDB
-        """
-        # environment dictionary
-        env_dict = EnvironmentDict() \
-            .add_solid_input('load_csv_from_zip', 'zip_path',
-                             app_cfg['airport_codes']['unlocode_zip']) \
-            .add_solid_input('load_csv_from_zip', 'pattern',
-                             r'.*UNLOCODE CodeListPart\d*\.csv') \
-            .add_solid_input('load_csv_from_zip', 'encoding', 'latin_1') \
-            .add_solid_input('load_csv_from_zip', 'header', unlocode_header) \
-            .add_resource('mongo_warehouse', mongo_warehouse) \
-            .build()
-        result = execute_pipeline(csv_to_mongo_pipeline, run_config=env_dict)
-        assert result.success
-
-
-    def execute_mongo_to_postgres_pipeline():
-        """
-        Execute the pipeline to retrieve the data from mongoDB, process and
-        save the result to Postgres
-        """
-        # environment dictionary
-        env_dict = EnvironmentDict() \
-            .add_solid_input('download_from_mongo', 'sel_filter', {}) \
-            .add_solid_input('download_from_mongo', 'projection',
-                             exclude_fields) \
-            .add_resource('postgres_warehouse', postgres_warehouse) \
-            .add_resource('mongo_warehouse', mongo_warehouse) \
-            .build()
-        result = execute_pipeline(mongo_to_postgres_pipeline,
-                                  run_config=env_dict)
-        assert result.success
+        raise EnvironmentError('Missing configuration')
+
+    # optional Prometheus text format file for solid metrics
+    if 'metrics_file' in app_cfg['airport_codes']:
+        os.environ[METRICS_FILE_ENV] = app_cfg['airport_codes']['metrics_file']
+
+    return app_cfg
 
 
+def run_command(function, app_cfg):
+    """
+    Execute the pipeline of a subcommand
+    :param function: name of the function in jobs
+    :param app_cfg: configuration
+    :return: True if the pipeline executed successfully
+    :rtype: bool
+    """
+    # deferred so only the selected command pays for the heavy imports
+    import jobs
+
+    return getattr(jobs, function)(app_cfg)
+
+
+def open_menu(app_cfg):
+    """
+    Open the interactive menu
+    :param app_cfg: configuration
+    """
+    from menu import Menu
+
+    def menu_option(function):
+        def execute():
+            assert run_command(function, app_cfg)
+        return execute
+
     menu = Menu()
     menu.set_options([
-        ("Save UN/LOCODE raw data to MongoDb", execute_csv_to_mongo_pipeline),
-        ("Process UN/LOCODE raw data from MongoDb, and save to Postgres",
-         execute_mongo_to_postgres_pipeline),
+        (text, menu_option(function)) for _, function, text in COMMANDS
+    ] + [
         ("Exit", Menu.CLOSE)
     ])
     menu.set_title("UN/LOCODE Data Processing Menu")
     menu.set_title_enabled(True)
     menu.open()
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    :param argv: command line arguments; None to use sys.argv
+    :return: exit code; 0 if the pipeline executed successfully
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(
+        description='UN/LOCODE data processing. If no command is specified, '
+                    'the interactive menu is opened.')
+    parser.add_argument('-c', '--config', default=None,
+                        help=f'configuration file; default {DEFAULT_CFG} in '
+                             f'the project root or the {CFG_ENV} environment '
+                             f'variable')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    for name, function, text in COMMANDS:
+        subparsers.add_parser(name, help=text, description=text) \
+            .set_defaults(function=function)
+    args = parser.parse_args(argv)
+
+    interactive = args.command is None
+    cfg_path = get_config_path(args.config, interactive)
+    if cfg_path is None:
+        if args.config is not None:
+            parser.error(f'configuration file not found: {args.config}')
+        if interactive:
+            return 0
+        parser.error(f'configuration file not found, specify with --config '
+                     f'or {CFG_ENV}')
+
+    try:
+        app_cfg = load_config(cfg_path)
+    except EnvironmentError as error:
+        parser.error(f'invalid configuration file {cfg_path}: {error}')
+
+    if interactive:
+        open_menu(app_cfg)
+        return 0
+
+    return 0 if run_command(args.function, app_cfg) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    File artifacts of processed UN/LOCODE data, for consumers which do not
+    query the central database. The export directory holds
+
+        parquet/lo=<country code>/part-0.parquet
+            Parquet dataset, hive partitioned by country code, with row group
+            statistics
+        airports.sqlite
+            self-contained SQLite database, indexed on iata, country code and
+            name; the name index is case insensitive, so is used by queries
+            such as "WHERE name = ? COLLATE NOCASE"
+        manifest.json
+            row counts and sha256 checksums of the files, written last
+
+    The data is written incrementally from a sequence of DataFrames, so it
+    may be exported while it is processed. Each artifact is built under a
+    temporary name and moved into place when complete.
+"""
+
+import hashlib
+import json
+import os
+import os.path as path
+import shutil
+import sqlite3
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from constants import (
+    COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_IATA, COL_COORD, COL_LAT, COL_LON
+)
+
+MANIFEST_VERSION: int = 1
+PARQUET_DIR: str = 'parquet'
+SQLITE_FILE: str = 'airports.sqlite'
+MANIFEST_FILE: str = 'manifest.json'
+SQLITE_TABLE: str = 'airports'
+# maximum number of rows per Parquet row group
+DEFAULT_ROW_GROUP_SIZE: int = 10000
+
+# exported DataFrame columns and their types; the 'code' column is only
+# exported if present
+EXPORT_SCHEMA: list = [
+    (COL_LO, pa.string()), (COL_CODE, pa.string()), (COL_LOCAL, pa.string()),
+    (COL_NAME, pa.string()), (COL_IATA, pa.string()), (COL_COORD, pa.string()),
+    ('country', pa.string()), (COL_LAT, pa.float64()), (COL_LON, pa.float64()),
+]
+# SQLite table columns, as per the Postgres airport_codes table
+SQLITE_COLUMNS: dict = {
+    COL_LO: 'country_code TEXT NOT NULL', COL_CODE: 'code TEXT',
+    COL_LOCAL: 'name_local TEXT', COL_NAME: 'name TEXT', COL_IATA: 'iata TEXT',
+    COL_COORD: 'geo_coord TEXT', 'country': 'country TEXT',
+    COL_LAT: 'latitude REAL', COL_LON: 'longitude REAL',
+}
+SQLITE_INDEXES: dict = {
+    f'{SQLITE_TABLE}_iata_idx': 'iata',
+    f'{SQLITE_TABLE}_country_code_idx': 'country_code',
+    f'{SQLITE_TABLE}_name_idx': 'name COLLATE NOCASE',
+}
+
+# file read size when calculating checksums
+_CHECKSUM_BLOCK: int = 1024 * 1024
+
+
+def file_checksum(file_path):
+    """
+    Calculate the sha256 checksum of a file
+    :param file_path: path to file
+    :return: hex digest
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as fhandle:
+        for block in iter(lambda: fhandle.read(_CHECKSUM_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _replace(tmp_path, final_path):
+    """
+    Move a file or directory into place, replacing any existing one
+    :param tmp_path: path to move
+    :param final_path: destination path
+    """
+    if path.isdir(final_path):
+        shutil.rmtree(final_path)
+    os.replace(tmp_path, final_path)
+
+
+class ParquetPartitionWriter:
+    """
+    Writer of a Parquet dataset partitioned by country code. Rows are
+    buffered per country and written as a row group once the buffer reaches
+    the row group size, so readers may prune by country using the partition
+    directories and by code or iata using the row group statistics. The rows
+    of a row group are sorted by code.
+    """
+
+    def __init__(self, dataset_path, schema, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        """
+        Initialise the writer
+        :param dataset_path: path of the dataset directory
+        :param schema: pyarrow Schema of the DataFrame columns, including the
+                       partition column
+        :param row_group_size: maximum number of rows per row group
+        """
+        self.dataset_path = dataset_path
+        # the partition column is encoded in the directory name
+        self.schema = schema.remove(schema.get_field_index(COL_LO))
+        self.row_group_size = row_group_size
+        self._buffers = {}
+        self._buffered = {}
+        self._writers = {}
+        self._files = {}
+
+    def write(self, df):
+        """
+        Add rows to the dataset
+        :param df: DataFrame in the process_unlocode format
+        """
+        for country_code, group in df.groupby(COL_LO, sort=False, observed=True):
+            self._buffers.setdefault(country_code, []).append(group)
+            self._buffered[country_code] = \
+                self._buffered.get(country_code, 0) + len(group)
+            if self._buffered[country_code] >= self.row_group_size:
+                self._flush(country_code)
+
+    def _flush(self, country_code):
+        """
+        Write the rows buffered for a country as row groups
+        :param country_code: country code
+        """
+        df = pd.concat(self._buffers.pop(country_code))
+        del self._buffered[country_code]
+        if COL_CODE in df.columns:
+            df = df.sort_values(COL_CODE, kind='stable')
+        table = pa.Table.from_pandas(df[self.schema.names], schema=self.schema,
+                                     preserve_index=False)
+
+        writer = self._writers.get(country_code)
+        if writer is None:
+            partition = path.join(self.dataset_path, f'{COL_LO}={country_code}')
+            os.makedirs(partition, exist_ok=True)
+            file_path = path.join(partition, 'part-0.parquet')
+            writer = pq.ParquetWriter(file_path, self.schema, write_statistics=True)
+            self._writers[country_code] = writer
+            self._files[country_code] = {'path': file_path, 'rows': 0}
+        writer.write_table(table, row_group_size=self.row_group_size)
+        self._files[country_code]['rows'] += len(df)
+
+    def close(self):
+        """
+        Write the remaining buffered rows and close the files
+        :return: list of dicts of the path and number of rows of each file, in
+                 country code order
+        :rtype: list
+        """
+        for country_code in list(self._buffers):
+            self._flush(country_code)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        return [self._files[country_code] for country_code in sorted(self._files)]
+
+
+class SqliteWriter:
+    """
+    Writer of a SQLite database of airports. The indexes are created once all
+    rows are inserted, and the database is built without a journal as it is
+    discarded if incomplete.
+    """
+
+    def __init__(self, db_path, columns):
+        """
+        Initialise the writer
+        :param db_path: path of the database file
+        :param columns: list of DataFrame columns to write
+        """
+        self.db_path = db_path
+        self.columns = columns
+        self.rows = 0
+        if path.exists(db_path):
+            os.remove(db_path)
+        self._connection = sqlite3.connect(db_path)
+        self._connection.execute('PRAGMA journal_mode = OFF')
+        self._connection.execute('PRAGMA synchronous = OFF')
+        self._connection.execute(
+            f'CREATE TABLE {SQLITE_TABLE} '
+            f'({", ".join(SQLITE_COLUMNS[column] for column in columns)})')
+        self._insert = f'INSERT INTO {SQLITE_TABLE} VALUES ' \
+                       f'({", ".join(["?"] * len(columns))})'
+
+    def write(self, df):
+        """
+        Add rows to the database
+        :param df: DataFrame in the process_unlocode format
+        """
+        values = df[self.columns].astype(object)
+        values = values.where(values.notna(), None)
+        self._connection.executemany(self._insert,
+                                     values.itertuples(index=False, name=None))
+        self.rows += len(df)
+
+    def close(self):
+        """
+        Create the indexes and close the database
+        :return: dict of the path and number of rows of the database
+        :rtype: dict
+        """
+        for name, column in SQLITE_INDEXES.items():
+            self._connection.execute(f'CREATE INDEX {name} ON {SQLITE_TABLE} ({column})')
+        self._connection.execute('ANALYZE')
+        self._connection.commit()
+        self._connection.close()
+        return {'path': self.db_path, 'rows': self.rows}
+
+
+def export_frames(frames, export_dir, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Export processed UN/LOCODE data to a partitioned Parquet dataset and a
+    SQLite database, and write a manifest of the files
+    :param frames: iterable of DataFrames in the process_unlocode format
+    :param export_dir: path of the export directory
+    :param row_group_size: maximum number of rows per Parquet row group
+    :return: manifest
+    :rtype: dict
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    parquet_tmp = path.join(export_dir, f'{PARQUET_DIR}.tmp')
+    sqlite_tmp = path.join(export_dir, f'{SQLITE_FILE}.tmp')
+    if path.isdir(parquet_tmp):
+        shutil.rmtree(parquet_tmp)
+
+    parquet_writer = None
+    sqlite_writer = None
+    columns = None
+    for df in frames:
+        if parquet_writer is None:
+            # the columns are fixed by the first frame
+            columns = [column for column, _ in EXPORT_SCHEMA if column in df.columns]
+            schema = pa.schema([(column, data_type) for column, data_type
+                                in EXPORT_SCHEMA if column in columns])
+            parquet_writer = ParquetPartitionWriter(parquet_tmp, schema,
+                                                    row_group_size=row_group_size)
+            sqlite_writer = SqliteWriter(sqlite_tmp, columns)
+        if len(df) > 0:
+            parquet_writer.write(df)
+            sqlite_writer.write(df)
+
+    if parquet_writer is None:
+        raise ValueError('No data to export')
+
+    parquet_files = parquet_writer.close()
+    sqlite_file = sqlite_writer.close()
+    os.makedirs(parquet_tmp, exist_ok=True)
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'rows': sqlite_file['rows'],
+        'columns': columns,
+        'parquet': {
+            'path': PARQUET_DIR,
+            'partition_column': COL_LO,
+            'rows': sum(entry['rows'] for entry in parquet_files),
+            'files': [{
+                'path': path.join(PARQUET_DIR, path.relpath(entry['path'], parquet_tmp))
+                .replace(os.sep, '/'),
+                'rows': entry['rows'],
+                'sha256': file_checksum(entry['path']),
+            } for entry in parquet_files],
+        },
+        'sqlite': {
+            'path': SQLITE_FILE,
+            'table': SQLITE_TABLE,
+            'rows': sqlite_file['rows'],
+            'indexes': list(SQLITE_INDEXES),
+            'sha256': file_checksum(sqlite_tmp),
+        },
+    }
+
+    # move the artifacts into place, and write the manifest last so its
+    # presence marks a complete export
+    manifest_path = path.join(export_dir, MANIFEST_FILE)
+    if path.exists(manifest_path):
+        os.remove(manifest_path)
+    _replace(parquet_tmp, path.join(export_dir, PARQUET_DIR))
+    _replace(sqlite_tmp, path.join(export_dir, SQLITE_FILE))
+    with open(f'{manifest_path}.tmp', 'w') as fhandle:
+        json.dump(manifest, fhandle, indent=2)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+
+    return manifest
+
+
+def verify_export(export_dir):
+    """
+    Verify the files of an export against its manifest
+    :param export_dir: path of the export directory
+    :return: list of the paths of files which are missing or do not match
+             their checksum; empty if the export is valid
+    :rtype: list
+    """
+    with open(path.join(export_dir, MANIFEST_FILE)) as fhandle:
+        manifest = json.load(fhandle)
+    invalid = []
+    for entry in manifest['parquet']['files'] + [manifest['sqlite']]:
+        file_path = path.join(export_dir, entry['path'])
+        if not path.isfile(file_path) or file_checksum(file_path) != entry['sha256']:
+            invalid.append(entry['path'])
+    return invalid
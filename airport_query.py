@@ -0,0 +1,341 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Read side of the airport_codes table. Lookups share a bounded pool of
+    connections, with the statements prepared once per connection, and an
+    optional LRU cache of results with a time to live. The cache is cleared
+    when the loaders notify that the table has been loaded.
+
+    e.g.
+        query = AirportQuery(app_cfg['postgresdb'], cache_size=10000)
+        query.by_iata('DUB')
+        query.by_iatas(['DUB', 'ORK', 'SNN'])
+        query.by_locode('IE', 'DUB')
+        query.close()
+"""
+
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+from constants import LOAD_CHANNEL
+
+DEFAULT_MAX_CONNECTIONS: int = 10
+DEFAULT_CACHE_TTL: float = 300.0
+
+# airport_codes table columns returned by lookups
+AIRPORT_COLUMNS: list = ['country_code', 'code', 'name_local', 'name', 'iata',
+                         'geo_coord', 'country', 'latitude', 'longitude']
+Airport = namedtuple('Airport', AIRPORT_COLUMNS)
+
+# prepared statements, as name: (parameter types, query clause); single key
+# lookups are batches of one, so share the plans of the batch lookups
+STATEMENTS: dict = {
+    'airport_by_iatas': ('text[]', 'WHERE iata = ANY($1)'),
+    'airport_by_locodes': ('text[], text[]',
+                           'WHERE (country_code, code) IN '
+                           '(SELECT * FROM unnest($1, $2))'),
+    'airport_by_countries': ('text[]', 'WHERE country_code = ANY($1)'),
+}
+
+
+class TTLCache:
+    """
+    Thread safe LRU cache whose entries expire after a time to live
+    """
+
+    def __init__(self, maxsize, ttl=DEFAULT_CACHE_TTL):
+        """
+        Initialise the cache
+        :param maxsize: maximum number of entries
+        :param ttl: time to live of entries in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get an entry
+        :param key: key
+        :return: tuple of True and the value if found, otherwise False and None
+        :rtype: tuple
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def put(self, key, value):
+        """
+        Add an entry, evicting the least recently used entry if full
+        :param key: key
+        :param value: value
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all entries
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class AirportQuery:
+    """
+    Pooled, prepared statement lookups of the airport_codes table
+    """
+
+    def __init__(self, postgres_cfg, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 cache_size=0, cache_ttl=DEFAULT_CACHE_TTL, table='airport_codes'):
+        """
+        Initialise the query API
+        :param postgres_cfg: Postgres configuration, as per doc/sample.yaml
+        :param max_connections: number of pooled connections; lookups wait for
+                                a free connection
+        :param cache_size: maximum number of cached results; 0 to disable
+        :param cache_ttl: time to live of cached results in seconds
+        :param table: table name
+        """
+        self.table = table
+        # the pool closes connections returned above its minimum, which would
+        # discard their prepared statements, so all connections are kept open
+        self._pool = ThreadedConnectionPool(max_connections, max_connections,
+                                            **postgres_cfg)
+        self._available = threading.BoundedSemaphore(max_connections)
+        # connections with prepared statements; an entry is removed when its
+        # connection is discarded
+        self._prepared = weakref.WeakKeyDictionary()
+        self._prepared_lock = threading.Lock()
+
+        self._cache = None
+        self._listener = None
+        self._listener_lock = threading.Lock()
+        if cache_size > 0:
+            self._cache = TTLCache(cache_size, ttl=cache_ttl)
+            # loads are notified on a dedicated connection
+            self._listener = psycopg2.connect(**postgres_cfg)
+            self._listener.autocommit = True
+            with self._listener.cursor() as cursor:
+                cursor.execute(f'LISTEN {LOAD_CHANNEL}')
+
+    def _prepare(self, connection):
+        """
+        Prepare the statements on a connection, if not already prepared
+        :param connection: database connection
+        """
+        with self._prepared_lock:
+            prepared = connection in self._prepared
+        if not prepared:
+            columns = ', '.join(AIRPORT_COLUMNS)
+            with connection.cursor() as cursor:
+                for name, (types, clause) in STATEMENTS.items():
+                    cursor.execute(f'PREPARE {name} ({types}) AS '
+                                   f'SELECT {columns} FROM {self.table} {clause}')
+            with self._prepared_lock:
+                self._prepared[connection] = True
+
+    def _execute(self, name, *params):
+        """
+        Execute a prepared statement on a pooled connection
+        :param name: statement name
+        :param params: statement parameters
+        :return: list of Airport
+        :rtype: list
+        """
+        with self._available:
+            connection = self._pool.getconn()
+            try:
+                connection.autocommit = True
+                self._prepare(connection)
+                with connection.cursor() as cursor:
+                    placeholders = ', '.join(['%s'] * len(params))
+                    cursor.execute(f'EXECUTE {name} ({placeholders})', params)
+                    return [Airport(*row) for row in cursor.fetchall()]
+            except psycopg2.Error:
+                # discard the connection, as its state is unknown
+                with self._prepared_lock:
+                    self._prepared.pop(connection, None)
+                self._pool.putconn(connection, close=True)
+                connection = None
+                raise
+            finally:
+                if connection is not None:
+                    self._pool.putconn(connection)
+
+    def _check_loads(self):
+        """
+        Clear the cache if a load of the table has been notified
+        """
+        if self._listener is not None:
+            with self._listener_lock:
+                self._listener.poll()
+                if len(self._listener.notifies) > 0:
+                    self._listener.notifies.clear()
+                    self._cache.clear()
+
+    def _lookup_many(self, kind, keys, name, params):
+        """
+        Look up multiple keys, querying the keys not in the cache with a
+        single statement
+        :param kind: kind of lookup, used in the cache key
+        :param keys: list of keys
+        :param name: statement name
+        :param params: function returning the statement parameters of a list
+                       of keys
+        :return: dict of lists of Airport, keyed by key
+        :rtype: dict
+        """
+        results = {}
+        missing = []
+        if self._cache is not None:
+            self._check_loads()
+            for key in dict.fromkeys(keys):
+                found, value = self._cache.get((kind, key))
+                if found:
+                    results[key] = value
+                else:
+                    missing.append(key)
+        else:
+            missing = list(dict.fromkeys(keys))
+
+        if len(missing) > 0:
+            fetched = {key: [] for key in missing}
+            for airport in self._execute(name, *params(missing)):
+                fetched[kind_key(kind, airport)].append(airport)
+            if self._cache is not None:
+                for key, value in fetched.items():
+                    self._cache.put((kind, key), value)
+            results.update(fetched)
+
+        return results
+
+    def by_iata(self, iata):
+        """
+        Look up the airports with an IATA code
+        :param iata: IATA code, e.g. 'DUB'
+        :return: list of Airport
+        :rtype: list
+        """
+        return self.by_iatas([iata])[iata]
+
+    def by_iatas(self, iatas):
+        """
+        Look up the airports with any of a list of IATA codes
+        :param iatas: list of IATA codes
+        :return: dict of lists of Airport, keyed by IATA code
+        :rtype: dict
+        """
+        return self._lookup_many('iata', iatas, 'airport_by_iatas',
+                                 lambda keys: (keys,))
+
+    def by_locode(self, country_code, code):
+        """
+        Look up the airports with a UN/LOCODE
+        :param country_code: ISO 3166 alpha-2 country code, e.g. 'IE'
+        :param code: location code, e.g. 'DUB'
+        :return: list of Airport
+        :rtype: list
+        """
+        return self.by_locodes([(country_code, code)])[(country_code, code)]
+
+    def by_locodes(self, locodes):
+        """
+        Look up the airports with any of a list of UN/LOCODEs
+        :param locodes: list of tuples of country code and code
+        :return: dict of lists of Airport, keyed by tuple of country code and
+                 code
+        :rtype: dict
+        """
+        return self._lookup_many('locode', [tuple(locode) for locode in locodes],
+                                 'airport_by_locodes',
+                                 lambda keys: ([key[0] for key in keys],
+                                               [key[1] for key in keys]))
+
+    def by_country(self, country_code):
+        """
+        Look up the airports in a country
+        :param country_code: ISO 3166 alpha-2 country code, e.g. 'IE'
+        :return: list of Airport
+        :rtype: list
+        """
+        return self.by_countries([country_code])[country_code]
+
+    def by_countries(self, country_codes):
+        """
+        Look up the airports in any of a list of countries
+        :param country_codes: list of ISO 3166 alpha-2 country codes
+        :return: dict of lists of Airport, keyed by country code
+        :rtype: dict
+        """
+        return self._lookup_many('country', country_codes, 'airport_by_countries',
+                                 lambda keys: (keys,))
+
+    def invalidate(self):
+        """
+        Clear the cache
+        """
+        if self._cache is not None:
+            self._cache.clear()
+
+    def close(self):
+        """
+        Close all connections
+        """
+        self._pool.closeall()
+        self._prepared.clear()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+
+def kind_key(kind, airport):
+    """
+    Get the key of an airport for a kind of lookup
+    :param kind: kind of lookup; 'iata', 'locode' or 'country'
+    :param airport: Airport
+    :return: key
+    """
+    if kind == 'iata':
+        return airport.iata
+    if kind == 'locode':
+        return airport.country_code, airport.code
+    return airport.country_code
@@ -0,0 +1,108 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+
+from dagster import solid, resource, Field, Permissive, StringSource
+
+from instrumentation import instrumented
+from async_pipeline import (
+    mongo_to_postgres,
+    motor_collection,
+    postgres_connection,
+    DEFAULT_QUEUE_SIZE
+)
+from download_node import DEFAULT_CURSOR_BATCH
+
+
+def _connection_schema(cfg_key):
+    # the password may be sourced from an environment variable, so it is not
+    # held in the run config, which is persisted in run storage
+    return {cfg_key: Permissive({'password': Field(StringSource, is_required=False)})}
+
+
+@resource(config_schema=_connection_schema('mongo_cfg'))
+def async_mongo_settings(init_context):
+    """
+    Connection settings of the mongoDB server, for the motor driver
+    :param init_context: resource initialisation context
+    :return: mongoDB configuration, as per doc/sample.yaml
+    :rtype: dict
+    """
+    return init_context.resource_config['mongo_cfg']
+
+
+@resource(config_schema=_connection_schema('postgres_cfg'))
+def async_postgres_settings(init_context):
+    """
+    Connection settings of the Postgres server, for the asyncpg driver
+    :param init_context: resource initialisation context
+    :return: Postgres configuration, as per doc/sample.yaml
+    :rtype: dict
+    """
+    return init_context.resource_config['postgres_cfg']
+
+
+async def _mongo_to_postgres(mongo_cfg, postgres_cfg, **kwargs):
+    client, collection = motor_collection(mongo_cfg)
+    connection = await postgres_connection(postgres_cfg)
+    try:
+        return await mongo_to_postgres(collection, connection, **kwargs)
+    finally:
+        # tidy up
+        await connection.close()
+        client.close()
+
+
+@solid(required_resource_keys={'async_mongo_settings', 'async_postgres_settings'})
+@instrumented
+def stream_mongo_to_postgres(context, projection, server_filter=True,
+                             batch_size=DEFAULT_CURSOR_BATCH,
+                             queue_size=DEFAULT_QUEUE_SIZE, trigram_indexes=False):
+    """
+    Stream UN/LOCODE data from mongoDB server, process and load the result to
+    Postgres server, with the download, processing and upload of batches
+    overlapping. The asynchronous motor and asyncpg drivers are used, so the
+    connections are made from the settings provided by the
+    async_mongo_settings and async_postgres_settings resources.
+    :param context: execution context
+    :param projection: fields to include/exclude
+    :param server_filter: apply the airport filter on the server; if False all
+                          entries are downloaded
+    :param batch_size: number of documents per batch
+    :param queue_size: maximum number of batches waiting between stages
+    :param trigram_indexes: create pg_trgm indexes on the name columns
+    :return: number of records uploaded
+    :rtype: int
+    """
+    stats = asyncio.run(_mongo_to_postgres(
+        context.resources.async_mongo_settings,
+        context.resources.async_postgres_settings, projection=projection,
+        server_filter=server_filter, batch_size=batch_size,
+        queue_size=queue_size, trigram_indexes=trigram_indexes))
+
+    context.log.info(f'Uploaded {stats["written"]} of {stats["read"]} records in '
+                     f'{stats["batches"]} batches in {stats["elapsed_s"]:.3f}s; '
+                     f'busy read {stats["read_s"]:.3f}s, '
+                     f'process {stats["process_s"]:.3f}s, '
+                     f'write {stats["write_s"]:.3f}s')
+
+    return stats['written']
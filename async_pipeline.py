@@ -0,0 +1,303 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Asyncio execution of the mongoDB to Postgres pipeline. Batches of
+    documents are read from mongoDB, processed and written to Postgres by
+    concurrent stages linked by bounded queues, so the stages overlap and a
+    slow stage applies backpressure to the stages before it.
+
+    The stages only require a collection providing an asynchronous find()
+    cursor and a connection providing asyncpg's execute(), transaction() and
+    copy_records_to_table(), so may be run against local stand-ins. The motor
+    and asyncpg drivers are only imported by the connection helpers.
+"""
+
+import asyncio
+import time
+
+import pandas as pd
+
+from download_node import airport_filter, DEFAULT_CURSOR_BATCH
+from process_node import process_batch
+from upload_node import (
+    staging_table_sql,
+    staging_swap_sql,
+    postgres_tuples,
+    POSTGRES_COLUMNS
+)
+from constants import (
+    COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_IATA, COL_COORD, LOAD_CHANNEL
+)
+
+# maximum number of batches waiting between stages
+DEFAULT_QUEUE_SIZE: int = 4
+# Postgres table columns corresponding to POSTGRES_COLUMNS
+POSTGRES_TABLE_COLUMNS: list = ['country_code', 'code', 'name_local', 'name',
+                                'iata', 'geo_coord', 'country', 'latitude',
+                                'longitude']
+# DataFrame columns loaded as empty strings rather than NULL
+NOT_NULL_COLUMNS: list = [COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_IATA,
+                          COL_COORD]
+
+# end of stream marker
+_END = object()
+
+
+async def mongo_source(collection, sel_filter, projection,
+                       batch_size=DEFAULT_CURSOR_BATCH):
+    """
+    Asynchronous generator yielding panda DataFrames of consecutive batches of
+    documents. The documents are sorted by country code and code, so country
+    headings precede the entries of their country, as required by
+    process_batch.
+    :param collection: motor AsyncIOMotorCollection
+    :param sel_filter: query filter
+    :param projection: fields to include/exclude
+    :param batch_size: number of documents per DataFrame
+    :return: asynchronous generator of panda DataFrames
+    """
+    cursor = collection.find(sel_filter, projection=projection,
+                             batch_size=batch_size) \
+        .sort([(COL_LO, 1), (COL_CODE, 1)])
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield pd.DataFrame.from_records(batch)
+            batch = []
+    if len(batch) > 0:
+        yield pd.DataFrame.from_records(batch)
+
+
+class PostgresStagingSink:
+    """
+    Sink which loads batches into the staging table of a table using COPY,
+    and replaces the table with it on completion, in a single transaction
+    """
+
+    def __init__(self, connection, table='airport_codes', trigram_indexes=False):
+        """
+        Initialise the sink
+        :param connection: asyncpg Connection
+        :param table: table name
+        :param trigram_indexes: create pg_trgm indexes on the name columns
+        """
+        self.connection = connection
+        self.table = table
+        self.trigram_indexes = trigram_indexes
+        self.uploaded = 0
+        self._transaction = None
+
+    async def open(self):
+        """
+        Start the transaction and create the staging table
+        """
+        self._transaction = self.connection.transaction()
+        await self._transaction.start()
+        for statement in staging_table_sql(self.table):
+            await self.connection.execute(statement)
+
+    async def write(self, df):
+        """
+        Load a batch into the staging table
+        :param df: DataFrame in the process_unlocode format
+        """
+        if len(df) > 0:
+            # missing values are loaded as empty strings as per
+            # copy_to_postgres, other than country names and coordinates
+            values = df[POSTGRES_COLUMNS].astype(object)
+            values[NOT_NULL_COLUMNS] = values[NOT_NULL_COLUMNS].fillna('')
+            await self.connection.copy_records_to_table(
+                f'{self.table}_staging', records=postgres_tuples(values, POSTGRES_COLUMNS),
+                columns=POSTGRES_TABLE_COLUMNS)
+            self.uploaded += len(df)
+
+    async def close(self):
+        """
+        Index the staging table, replace the table with it and commit
+        """
+        for statement in staging_swap_sql(self.table,
+                                          trigram_indexes=self.trigram_indexes):
+            await self.connection.execute(statement)
+        await self.connection.execute(f'NOTIFY {LOAD_CHANNEL}')
+        await self._transaction.commit()
+
+    async def abort(self):
+        """
+        Rollback the transaction, leaving the table unchanged
+        """
+        if self._transaction is not None:
+            await self._transaction.rollback()
+
+
+async def run_stages(source, process, sink, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Run a source, processing and sink stage concurrently, linked by bounded
+    queues. Processing is CPU bound so is run in the default executor, to
+    overlap with the I/O of the other stages.
+    :param source: asynchronous iterable of panda DataFrames
+    :param process: function to process a DataFrame, returning a DataFrame
+    :param sink: object with an asynchronous write(df) method
+    :param queue_size: maximum number of batches waiting between stages
+    :return: dict of statistics; number of batches, rows read and written,
+             and the busy time of each stage and the total elapsed time in
+             seconds
+    :rtype: dict
+    """
+    loop = asyncio.get_running_loop()
+    raw_queue = asyncio.Queue(maxsize=queue_size)
+    processed_queue = asyncio.Queue(maxsize=queue_size)
+    stats = {'batches': 0, 'read': 0, 'written': 0,
+             'read_s': 0.0, 'process_s': 0.0, 'write_s': 0.0, 'elapsed_s': 0.0}
+
+    async def produce():
+        iterator = source.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                df = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            stats['read_s'] += time.perf_counter() - start
+            stats['batches'] += 1
+            stats['read'] += len(df)
+            # blocks while the queue is full, applying backpressure
+            await raw_queue.put(df)
+        await raw_queue.put(_END)
+
+    async def transform():
+        while True:
+            df = await raw_queue.get()
+            if df is _END:
+                break
+            start = time.perf_counter()
+            df = await loop.run_in_executor(None, process, df)
+            stats['process_s'] += time.perf_counter() - start
+            await processed_queue.put(df)
+        await processed_queue.put(_END)
+
+    async def consume():
+        while True:
+            df = await processed_queue.get()
+            if df is _END:
+                break
+            start = time.perf_counter()
+            await sink.write(df)
+            stats['write_s'] += time.perf_counter() - start
+            stats['written'] += len(df)
+
+    start = time.perf_counter()
+    tasks = [asyncio.ensure_future(coro) for coro in [produce(), transform(), consume()]]
+    try:
+        # a failed stage would leave the others blocked on its queue, so
+        # cancel them
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    stats['elapsed_s'] = time.perf_counter() - start
+
+    return stats
+
+
+async def mongo_to_postgres(collection, connection, projection, server_filter=True,
+                            batch_size=DEFAULT_CURSOR_BATCH,
+                            queue_size=DEFAULT_QUEUE_SIZE, trigram_indexes=False):
+    """
+    Stream the UN/LOCODE data from mongoDB, process and load the result to
+    Postgres, replacing the airport_codes table
+    :param collection: motor AsyncIOMotorCollection
+    :param connection: asyncpg Connection
+    :param projection: fields to include/exclude
+    :param server_filter: apply the airport filter on the server; if False all
+                          entries are downloaded
+    :param batch_size: number of documents per batch
+    :param queue_size: maximum number of batches waiting between stages
+    :param trigram_indexes: create pg_trgm indexes on the name columns
+    :return: dict of statistics, as per run_stages
+    :rtype: dict
+    """
+    country_codes = {}
+    seen = set()
+
+    def process(df):
+        return process_batch(df, country_codes, seen, keep_code=True)
+
+    source = mongo_source(collection, airport_filter() if server_filter else {},
+                          projection, batch_size=batch_size)
+    sink = PostgresStagingSink(connection, trigram_indexes=trigram_indexes)
+    await sink.open()
+    try:
+        stats = await run_stages(source, process, sink, queue_size=queue_size)
+    except BaseException:
+        await sink.abort()
+        raise
+    await sink.close()
+
+    return stats
+
+
+def motor_collection(mongo_cfg):
+    """
+    Get a motor collection, as specified by the mongoDB configuration
+    :param mongo_cfg: mongoDB configuration, as per doc/sample.yaml
+    :return: tuple of motor AsyncIOMotorClient and AsyncIOMotorCollection
+    :rtype: tuple
+    """
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    options = {}
+    for cfg_key, option in [('port', 'port'), ('username', 'username'),
+                            ('password', 'password'), ('auth_source', 'authSource'),
+                            ('ssl', 'tls'), ('replica_set', 'replicaSet'),
+                            ('max_idle_time_ms', 'maxIdleTimeMS'),
+                            ('app_name', 'appname'), ('retry_writes', 'retryWrites')]:
+        if cfg_key in mongo_cfg:
+            options[option] = mongo_cfg[cfg_key]
+    client = AsyncIOMotorClient(mongo_cfg['server'], **options)
+    return client, client[mongo_cfg['dbname']][mongo_cfg['collection']]
+
+
+async def postgres_connection(postgres_cfg):
+    """
+    Get an asyncpg connection, as specified by the Postgres configuration. If
+    no password is configured, asyncpg sources it from the PGPASSWORD
+    environment variable or the password file.
+    :param postgres_cfg: Postgres configuration, as per doc/sample.yaml
+    :return: asyncpg Connection
+    :raises ValueError: if the user or dbname is not configured
+    """
+    missing = [cfg_key for cfg_key in ['user', 'dbname'] if not postgres_cfg.get(cfg_key)]
+    if len(missing) > 0:
+        raise ValueError(f'Postgres configuration is missing {", ".join(missing)}')
+
+    import asyncpg
+
+    return await asyncpg.connect(user=postgres_cfg['user'],
+                                 password=postgres_cfg.get('password'),
+                                 database=postgres_cfg['dbname'],
+                                 host=postgres_cfg.get('host'),
+                                 port=postgres_cfg.get('port'))
@@ -0,0 +1,410 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Benchmark suite for the pipeline solids.
+
+    Each solid is run against the bundled UN/LOCODE release and synthetic
+    scale-ups of it, in a separate process so peak memory is measured per
+    stage. The input of a stage is prepared before it is measured, and its
+    peak memory is the peak RSS during the stage above the RSS once the input
+    is prepared. mongoDB stages run against mongomock, and Postgres stages against
+    a throwaway local server when a connection string is given in the
+    AC_BENCH_POSTGRES environment variable (otherwise they are skipped).
+    The startup time of the command line interface is also measured, as it
+    is run from scheduled jobs.
+
+    Usage:
+        python benchmark.py [--scales 1 10 100] [--baseline FILE] [--save]
+                            [--threshold 0.2]
+"""
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import os.path as path
+import subprocess
+import sys
+import tempfile
+import time
+from queue import Empty
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from constants import (
+    COL_CHANGE, COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_DIVISION,
+    COL_FUNCTION, COL_STATUS, COL_DATE, COL_IATA, COL_COORD, COL_REMARK
+)
+from load_cvs_node import read_csv_dict_from_zip, combine_frames
+from instrumentation import reset_peak_rss, rss_bytes
+
+UNLOCODE_ZIP: str = 'data/loc211csv.zip'
+PATTERN: str = r'.*UNLOCODE CodeListPart\d*\.csv'
+ENCODING: str = 'latin_1'
+HEADER: tuple = (
+    COL_CHANGE, COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_DIVISION,
+    COL_FUNCTION, COL_STATUS, COL_DATE, COL_IATA, COL_COORD, COL_REMARK
+)
+# fields not downloaded from mongo
+EXCLUDE_FIELDS: list = [COL_CHANGE, COL_DIVISION, COL_STATUS, COL_DATE,
+                        COL_REMARK]
+BASELINE: str = 'bench_baseline.json'
+POSTGRES_ENV: str = 'AC_BENCH_POSTGRES'
+STARTUP_STAGE: str = 'cli_startup'
+STARTUP_RUNS: int = 5
+# maximum time in seconds for a stage to run
+STAGE_TIMEOUT: int = 3600
+MB: int = 1024 * 1024
+
+
+class MongomockClient:
+    """
+    Stand-in for the db_toolkit mongoDB client, backed by mongomock
+    """
+
+    def __init__(self):
+        import mongomock
+        self.collection = mongomock.MongoClient().db.collection
+
+    def get_collection(self):
+        return self.collection
+
+    def insert_many(self, entries):
+        return self.collection.insert_many(entries)
+
+    def close_connection(self):
+        pass
+
+
+class PostgresClient:
+    """
+    Stand-in for the db_toolkit Postgres client, connected to a local server
+    """
+
+    def __init__(self, dsn):
+        import psycopg2
+        self.connection = psycopg2.connect(dsn)
+
+    def cursor(self):
+        return self.connection.cursor()
+
+    def commit(self):
+        self.connection.commit()
+
+    def close_connection(self):
+        self.connection.close()
+
+
+class StandInResource:
+    """
+    Resource returning a stand-in client
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def get_connection(self, context):
+        return self.factory()
+
+
+def make_scaled_zip(zip_path, scale, work_dir):
+    """
+    Create a synthetic release by replicating the entries of a release; the
+    names of the copies are suffixed so they are not dropped as duplicates
+    :param zip_path: path to source zip file
+    :param scale: number of copies
+    :param work_dir: directory to create the zip file in
+    :return: path to synthetic zip file
+    :rtype: str
+    """
+    if scale == 1:
+        return zip_path
+
+    scaled_path = path.join(work_dir, f'scaled_{scale}x.zip')
+    frames = read_csv_dict_from_zip(zip_path, PATTERN, ENCODING, HEADER)
+    with ZipFile(scaled_path, 'w', compression=ZIP_DEFLATED) as zip_file:
+        for filename, df in frames.items():
+            with zip_file.open(filename, 'w') as csv_file:
+                for copy in range(scale):
+                    scaled = df
+                    if copy > 0:
+                        scaled = df.assign(**{
+                            col: df[col].where(df[COL_CODE] == '', df[col] + f' {copy}')
+                            for col in [COL_LOCAL, COL_NAME]})
+                    csv_file.write(scaled.to_csv(header=False, index=False)
+                                   .encode(ENCODING, 'replace'))
+    return scaled_path
+
+
+def prepare_input(stage, zip_path):
+    """
+    Prepare the input of a stage, outside of the measured section
+    :param stage: stage name
+    :param zip_path: path to zip file
+    :return: input
+    """
+    if stage == 'load_csv_from_zip':
+        return zip_path
+    df_dict = read_csv_dict_from_zip(zip_path, PATTERN, ENCODING, HEADER)
+    if stage == 'combine_csv_from_dict':
+        return df_dict
+    df = combine_frames(df_dict)
+    if stage == 'upload_to_mongo':
+        return df
+    df = df.drop(columns=EXCLUDE_FIELDS)
+    if stage in ('process_unlocode', 'process_unlocode_fused'):
+        return df
+
+    from dagster import build_solid_context
+    from process_node import process_unlocode
+    output = process_unlocode(build_solid_context(), df, keep_code=True)
+    # instrumented solids return an Output
+    return getattr(output, 'value', output)
+
+
+def input_rows(stage, data):
+    """
+    Get the number of input rows of a stage
+    :param stage: stage name
+    :param data: stage input, or output for load_csv_from_zip
+    :return: number of rows
+    :rtype: int
+    """
+    if isinstance(data, dict):
+        return sum(len(df) for df in data.values())
+    return len(data)
+
+
+def run_stage(stage, zip_path):
+    """
+    Run and measure a stage; runs in a child process. Peak memory is measured
+    from the RSS once the input is prepared; where the peak RSS can not be
+    reset, it is the increase of the peak over that of preparing the input,
+    so is a lower bound.
+    :param stage: stage name
+    :param zip_path: path to zip file
+    :return: measurements
+    :rtype: dict
+    """
+    from dagster import build_solid_context
+    from load_cvs_node import load_csv_from_zip, combine_csv_from_dict
+    from process_node import process_unlocode
+    from upload_node import upload_to_mongo, upload_to_postgres
+
+    data = prepare_input(stage, zip_path)
+
+    resources = {}
+    if stage == 'upload_to_mongo':
+        resources['mongo_warehouse'] = StandInResource(MongomockClient)
+    elif stage == 'upload_to_postgres':
+        dsn = os.environ[POSTGRES_ENV]
+        resources['postgres_warehouse'] = StandInResource(lambda: PostgresClient(dsn))
+    context = build_solid_context(resources=resources)
+
+    solid_fns = {
+        'load_csv_from_zip': lambda: load_csv_from_zip(
+            context, zip_path=data, pattern=PATTERN, encoding=ENCODING, header=HEADER),
+        'combine_csv_from_dict': lambda: combine_csv_from_dict(context, df_dict=data),
+        'process_unlocode': lambda: process_unlocode(context, df=data),
+        'process_unlocode_fused': lambda: process_unlocode(context, df=data, fused=True),
+        'upload_to_mongo': lambda: upload_to_mongo(context, df=data),
+        'upload_to_postgres': lambda: upload_to_postgres(context, df=data),
+    }
+
+    # exclude the memory released after preparing the input
+    gc.collect()
+    peak_reset = reset_peak_rss()
+    input_rss, _ = rss_bytes(peak_reset)
+    start = time.perf_counter()
+    output = solid_fns[stage]()
+    # instrumented solids return an Output
+    output = getattr(output, 'value', output)
+    wall = time.perf_counter() - start
+    _, peak_rss = rss_bytes(peak_reset)
+
+    rows = input_rows(stage, output if stage == 'load_csv_from_zip' else data)
+
+    return {
+        'wall_s': wall,
+        'peak_rss_mb': max(peak_rss - input_rss, 0) / MB,
+        'input_rss_mb': input_rss / MB,
+        'rows': rows,
+        'rows_per_s': rows / wall if wall > 0 else 0.0,
+    }
+
+
+def _run_stage_child(queue, stage, zip_path):
+    queue.put(run_stage(stage, zip_path))
+
+
+def measure(stage, zip_path, timeout=STAGE_TIMEOUT):
+    """
+    Run a stage in a fresh process, so peak memory is attributable to it
+    :param stage: stage name
+    :param zip_path: path to zip file
+    :param timeout: maximum time in seconds for the stage to run
+    :return: measurements
+    :rtype: dict
+    :raises RuntimeError: if the stage fails or times out
+    """
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_stage_child, args=(queue, stage, zip_path))
+    process.start()
+    deadline = time.monotonic() + timeout
+    result = None
+    try:
+        # poll, so a child which dies without a result is detected promptly
+        while result is None:
+            try:
+                result = queue.get(timeout=1)
+            except Empty:
+                if not process.is_alive():
+                    # the result may have been put just before exiting
+                    try:
+                        result = queue.get(timeout=1)
+                    except Empty:
+                        break
+                elif time.monotonic() > deadline:
+                    raise RuntimeError(f'{stage} timed out after {timeout} s')
+        process.join(timeout=max(deadline - time.monotonic(), 1))
+    finally:
+        if process.is_alive():
+            process.terminate()
+            process.join()
+    if result is None or process.exitcode != 0:
+        raise RuntimeError(f'{stage} failed with exit code {process.exitcode}')
+    return result
+
+
+def measure_startup(runs=STARTUP_RUNS):
+    """
+    Measure the startup time of the command line interface, as the best of a
+    number of runs of 'airport_codes.py --help'
+    :param runs: number of runs
+    :return: measurements
+    :rtype: dict
+    """
+    script = path.join(path.dirname(path.abspath(__file__)), 'airport_codes.py')
+    walls = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, '--help'], check=True,
+                       stdout=subprocess.DEVNULL)
+        walls.append(time.perf_counter() - start)
+    # peak memory of the children is not reported, as it includes the memory
+    # of this process inherited before exec
+    return {
+        'wall_s': min(walls),
+        'peak_rss_mb': 0.0,
+        'input_rss_mb': 0.0,
+        'rows': 0,
+        'rows_per_s': 0.0,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results to a baseline
+    :param results: current results
+    :param baseline: baseline results
+    :param threshold: allowed fractional increase in wall time and peak memory
+    :return: list of regression descriptions
+    :rtype: list
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in ['wall_s', 'peak_rss_mb']:
+            base = baseline[key][metric]
+            if base > 0 and result[metric] > base * (1 + threshold):
+                regressions.append(f'{key} {metric}: {result[metric]:.3f} vs '
+                                   f'{base:.3f} baseline')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline solids')
+    parser.add_argument('--zip', default=UNLOCODE_ZIP, help='UN/LOCODE release zip')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='synthetic scale-ups to run')
+    parser.add_argument('--stages', nargs='+', default=None, help='stages to run')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline JSON file')
+    parser.add_argument('--save', action='store_true',
+                        help='save the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fractional increase treated as a regression')
+    parser.add_argument('--timeout', type=int, default=STAGE_TIMEOUT,
+                        help='maximum time in seconds for a stage to run')
+    args = parser.parse_args()
+
+    stages = args.stages or [STARTUP_STAGE, 'load_csv_from_zip',
+                             'combine_csv_from_dict', 'process_unlocode',
+                             'process_unlocode_fused',
+                             'upload_to_mongo', 'upload_to_postgres']
+    if POSTGRES_ENV not in os.environ and 'upload_to_postgres' in stages:
+        print(f'Skipping upload_to_postgres, {POSTGRES_ENV} not set')
+        stages.remove('upload_to_postgres')
+
+    results = {}
+    failures = []
+    if STARTUP_STAGE in stages:
+        stages.remove(STARTUP_STAGE)
+        results[STARTUP_STAGE] = measure_startup()
+        print(f'{STARTUP_STAGE:32} {results[STARTUP_STAGE]["wall_s"]:9.3f} s')
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for scale in args.scales:
+            zip_path = make_scaled_zip(args.zip, scale, work_dir)
+            for stage in stages:
+                key = f'{stage}@{scale}x'
+                try:
+                    results[key] = measure(stage, zip_path, timeout=args.timeout)
+                except RuntimeError as exc:
+                    print(f'FAILED {key}: {exc}')
+                    failures.append(key)
+                    continue
+                print(f'{key:32} {results[key]["wall_s"]:9.3f} s '
+                      f'{results[key]["peak_rss_mb"]:9.1f} MB peak '
+                      f'{results[key]["rows_per_s"]:12.0f} rows/s')
+
+    regressions = []
+    if path.exists(args.baseline):
+        with open(args.baseline) as fhandle:
+            regressions = compare(results, json.load(fhandle), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+
+    if args.save:
+        if len(failures) > 0:
+            print(f'Baseline not saved, {len(failures)} stages failed')
+        else:
+            with open(args.baseline, 'w') as fhandle:
+                json.dump(results, fhandle, indent=2, sort_keys=True)
+            print(f'Saved baseline to {args.baseline}')
+
+    return 1 if len(regressions) > 0 or len(failures) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Compact binary snapshot of processed UN/LOCODE data for in-process code
+    lookups. The file holds sorted fixed-width code arrays and a string pool,
+    and is memory-mapped by the reader, so it is shared between forked
+    workers without copying.
+
+    File layout:
+        magic (4 bytes), version (uint32), header length (uint32),
+        JSON header of section offsets, 8-byte aligned sections
+"""
+
+import json
+import mmap
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from constants import COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_IATA
+from delta_sync import dedup_by_key
+
+MAGIC: bytes = b'ACLT'
+VERSION: int = 1
+PREAMBLE = struct.Struct('<4sII')
+ALIGNMENT: int = 8
+
+# string fields held in the string pool
+POOL_FIELDS: list = [COL_NAME, COL_LOCAL, 'country']
+
+LookupRecord = namedtuple('LookupRecord',
+                          [COL_LO, COL_CODE, COL_IATA] + POOL_FIELDS)
+
+
+def _encode_fixed(values, width):
+    """
+    Encode strings as a fixed-width byte array
+    :param values: array-like of strings
+    :param width: width in bytes
+    :return: numpy array of dtype S<width>
+    :rtype: numpy.ndarray
+    """
+    return np.array([str(value).encode('ascii', 'replace')[:width]
+                     for value in values], dtype=f'S{width}')
+
+
+def _encode_pool(values):
+    """
+    Encode strings as a utf-8 pool and offsets
+    :param values: array-like of strings; missing values are stored as empty
+    :return: tuple of (pool bytes array, uint32 offsets array of len + 1)
+    :rtype: tuple
+    """
+    encoded = [b'' if value is None or value != value else
+               str(value).encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def write_lookup(df, lookup_path):
+    """
+    Write a lookup snapshot of processed UN/LOCODE data
+    :param df: DataFrame, as produced by process_unlocode with keep_code set
+    :param lookup_path: path to save snapshot to
+    :return: number of records written
+    :rtype: int
+    """
+    if COL_CODE not in df.columns:
+        raise ValueError(f"Lookup requires the '{COL_CODE}' column, process "
+                         f"the data with keep_code set")
+
+    df = dedup_by_key(df)
+    df = df.assign(_locode=df[COL_LO].astype(str) + df[COL_CODE].astype(str)) \
+        .sort_values('_locode', kind='stable')
+
+    sections = {
+        'locode': _encode_fixed(df['_locode'], 5),
+        'iata': _encode_fixed(df[COL_IATA], 3),
+    }
+    # iata codes are not unique, so keep a sorted copy and its permutation
+    iata_order = np.argsort(sections['iata'], kind='stable').astype(np.uint32)
+    sections['iata_sorted'] = sections['iata'][iata_order]
+    sections['iata_order'] = iata_order
+    for field in POOL_FIELDS:
+        pool, offsets = _encode_pool(df[field])
+        sections[f'{field}_pool'] = pool
+        sections[f'{field}_offsets'] = offsets
+
+    # calculate section offsets relative to the start of the data
+    header = {'count': len(df), 'sections': {}}
+    offset = 0
+    for name, array in sections.items():
+        header['sections'][name] = [offset, array.dtype.str, len(array)]
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (-(PREAMBLE.size + len(header_bytes)) % ALIGNMENT)
+
+    with open(lookup_path, 'wb') as fhandle:
+        fhandle.write(PREAMBLE.pack(MAGIC, VERSION, len(header_bytes)))
+        fhandle.write(header_bytes)
+        for array in sections.values():
+            fhandle.write(array.tobytes())
+            fhandle.write(b'\0' * (-array.nbytes % ALIGNMENT))
+
+    return len(df)
+
+
+class CodeLookup:
+    """
+    Reader of a lookup snapshot. The arrays are views on the memory-mapped
+    file, so no per-record objects are created until a record is requested.
+    """
+
+    def __init__(self, lookup_path):
+        """
+        Open a lookup snapshot
+        :param lookup_path: path to snapshot
+        """
+        with open(lookup_path, 'rb') as fhandle:
+            self._mmap = mmap.mmap(fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_len = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'Invalid lookup file: {lookup_path}')
+        header = json.loads(self._mmap[PREAMBLE.size:PREAMBLE.size + header_len])
+        data_start = PREAMBLE.size + header_len
+
+        self.count = header['count']
+        for name, (offset, dtype, length) in header['sections'].items():
+            setattr(self, f'_{name}', np.frombuffer(
+                self._mmap, dtype=np.dtype(dtype), count=length,
+                offset=data_start + offset))
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """
+        Close the snapshot; any arrays obtained from it become invalid
+        """
+        for name in list(vars(self)):
+            if name.startswith('_') and name != '_mmap':
+                delattr(self, name)
+        self._mmap.close()
+
+    def _string(self, field, index):
+        """
+        Get a string from the string pool
+        :param field: pool field name
+        :param index: record index
+        :return: string
+        :rtype: str
+        """
+        offsets = getattr(self, f'_{field}_offsets')
+        pool = getattr(self, f'_{field}_pool')
+        return pool[offsets[index]:offsets[index + 1]].tobytes().decode('utf-8')
+
+    def record(self, index):
+        """
+        Get a record
+        :param index: record index
+        :return: record
+        :rtype: LookupRecord
+        """
+        locode = self._locode[index].decode('ascii')
+        return LookupRecord(locode[:2], locode[2:],
+                            self._iata[index].decode('ascii'),
+                            *[self._string(field, index) for field in POOL_FIELDS])
+
+    def find_locode(self, locode):
+        """
+        Find the index of a UN/LOCODE, e.g. 'IEDUB'
+        :param locode: UN/LOCODE, i.e. country code followed by location code
+        :return: record index or -1 if not found
+        :rtype: int
+        """
+        key = locode.encode('ascii')
+        index = int(np.searchsorted(self._locode, key))
+        if index < self.count and self._locode[index] == key:
+            return index
+        return -1
+
+    def find_locodes(self, locodes):
+        """
+        Find the indices of a batch of UN/LOCODEs
+        :param locodes: array-like of UN/LOCODEs
+        :return: array of record indices, -1 where not found
+        :rtype: numpy.ndarray
+        """
+        keys = np.asarray(locodes, dtype='S5')
+        indices = np.searchsorted(self._locode, keys)
+        found = indices < self.count
+        found[found] = self._locode[indices[found]] == keys[found]
+        return np.where(found, indices, -1)
+
+    def find_iata(self, iata):
+        """
+        Find the indices of an IATA code; a code may be used by more than one
+        location
+        :param iata: IATA code
+        :return: array of record indices
+        :rtype: numpy.ndarray
+        """
+        key = iata.encode('ascii')
+        start = np.searchsorted(self._iata_sorted, key, side='left')
+        end = np.searchsorted(self._iata_sorted, key, side='right')
+        return self._iata_order[start:end].astype(np.intp)
+
+    def get(self, lo, code):
+        """
+        Get the record for a country and location code
+        :param lo: country code
+        :param code: location code
+        :return: record or None if not found
+        :rtype: LookupRecord
+        """
+        index = self.find_locode(f'{lo}{code}')
+        return self.record(index) if index >= 0 else None
+
+    def get_iata(self, iata):
+        """
+        Get the records for an IATA code
+        :param iata: IATA code
+        :return: list of records
+        :rtype: list
+        """
+        return [self.record(index) for index in self.find_iata(iata)]
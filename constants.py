@@ -55,6 +55,21 @@ COL_IATA: str = 'iata'
 COL_COORD: str = 'geo_coord'
 # reasons for the change
 COL_REMARK: str = 'remark'
+# columns of UN/LOCODE data, in order
+UNLOCODE_COLUMNS: list = [COL_CHANGE, COL_LO, COL_CODE, COL_LOCAL, COL_NAME,
+                          COL_DIVISION, COL_FUNCTION, COL_STATUS, COL_DATE,
+                          COL_IATA, COL_COORD, COL_REMARK]
+
+# Columns derived from UN/LOCODE
+# latitude in decimal degrees, derived from COL_COORD
+COL_LAT: str = 'latitude'
+# longitude in decimal degrees, derived from COL_COORD
+COL_LON: str = 'longitude'
+
+# columns consumed by process_unlocode, and the compact dtypes to load them as
+PROCESS_COLUMNS: list = [COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_FUNCTION,
+                         COL_IATA, COL_COORD]
+PROCESS_DTYPES: dict = {COL_LO: 'category', COL_FUNCTION: 'category'}
 
 FUNCTION_PORT: str = '1'         # port, as defined in Rec. 16
 FUNCTION_RAIL: str = '2'         # rail terminal
@@ -66,3 +81,47 @@ FUNCTION_FIXED: str = '7'        # fixed transport functions (e.g. oil platform)
 FUNCTION_BORDER: str = 'B'       # border crossing
 FUNCTION_UNKNOWN: str = '0'      # function not known, to be specified
 
+# bit flags representing the functions of an entry, as decoded from COL_FUNCTION
+FUNCTION_BITS: dict = {
+    FUNCTION_PORT: 0x01,
+    FUNCTION_RAIL: 0x02,
+    FUNCTION_ROAD: 0x04,
+    FUNCTION_AIRPORT: 0x08,
+    FUNCTION_POST: 0x10,
+    FUNCTION_MULTIMODAL: 0x20,
+    FUNCTION_FIXED: 0x40,
+    FUNCTION_BORDER: 0x80,
+}
+# Postgres tables for the entries of each function
+FUNCTION_TABLES: dict = {
+    FUNCTION_PORT: 'port_codes',
+    FUNCTION_RAIL: 'rail_terminal_codes',
+    FUNCTION_ROAD: 'road_terminal_codes',
+    FUNCTION_AIRPORT: 'airport_codes',
+    FUNCTION_POST: 'postal_exchange_codes',
+    FUNCTION_MULTIMODAL: 'multimodal_codes',
+    FUNCTION_FIXED: 'fixed_transport_codes',
+    FUNCTION_BORDER: 'border_crossing_codes',
+}
+
+
+# change indicators presented in the COL_CHANGE column
+CHANGE_ADDED: str = '+'             # added entry
+CHANGE_NAME: str = '#'              # change in the name
+CHANGE_OTHER: str = '|'             # other change in the entry
+CHANGE_OTHER_LATIN: str = '¦'       # other change, as decoded from latin_1
+CHANGE_REMOVED: str = 'X'           # entry to be removed in next issue
+CHANGE_REFERENCE: str = '='         # reference entry
+CHANGE_UNCHANGED: str = ''          # no change
+
+# change indicators which represent an update to an entry
+CHANGES_UPSERT: tuple = (CHANGE_ADDED, CHANGE_NAME, CHANGE_OTHER,
+                         CHANGE_OTHER_LATIN)
+
+# environment variable specifying the Prometheus text format file for solid
+# metrics
+METRICS_FILE_ENV: str = 'AC_METRICS_FILE'
+
+# Postgres notification channel notified when the airport_codes table has been
+# loaded
+LOAD_CHANNEL: str = 'airport_codes_loaded'
@@ -0,0 +1,141 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Helpers to calculate the delta between a UN/LOCODE release and the
+    currently stored data, using 'lo' + 'code' as the key and the change
+    indicator to identify removed entries.
+"""
+
+import pandas as pd
+
+from constants import (
+    COL_CHANGE, COL_LO, COL_CODE, COL_NAME,
+    CHANGE_REMOVED, CHANGES_UPSERT
+)
+
+# key of an entry; entries without a 'code' value (country headings and
+# references) are further identified by name
+KEY_FIELDS: list = [COL_LO, COL_CODE]
+UNCODED_KEY_FIELDS: list = [COL_LO, COL_CODE, COL_NAME]
+
+
+def is_removed(df):
+    """
+    Get a mask of the entries marked for removal
+    :param df: DataFrame containing data
+    :return: boolean Series
+    :rtype: panda.Series
+    """
+    if COL_CHANGE not in df.columns:
+        return df[COL_LO] != df[COL_LO]     # all False
+    return df[COL_CHANGE].str.upper() == CHANGE_REMOVED
+
+
+def is_changed(df):
+    """
+    Get a mask of the entries marked as added or modified
+    :param df: DataFrame containing data
+    :return: boolean Series
+    :rtype: panda.Series
+    """
+    if COL_CHANGE not in df.columns:
+        return df[COL_LO] == df[COL_LO]     # all True
+    return df[COL_CHANGE].isin(CHANGES_UPSERT)
+
+
+def key_frame(df):
+    """
+    Get the keys of the entries in a DataFrame
+    :param df: DataFrame containing data
+    :return: panda DataFrame of key columns
+    :rtype: panda.DataFrame
+    """
+    keys = df[KEY_FIELDS].copy()
+    if COL_NAME in df.columns:
+        keys[COL_NAME] = df[COL_NAME].where(df[COL_CODE] == '', '')
+    return keys
+
+
+def coded_entries(df):
+    """
+    Get the entries with a 'code' value. Entries without one, i.e. country
+    headings and references to entries of other countries (e.g.
+    'Cayenne = GF CAY'), are not identified by 'lo' + 'code' so are excluded
+    from stores keyed on it.
+    :param df: DataFrame containing data
+    :return: panda DataFrame
+    :rtype: panda.DataFrame
+    """
+    return df[df[COL_CODE].notna() & (df[COL_CODE] != '')]
+
+
+def dedup_by_key(df):
+    """
+    Remove entries with duplicate keys. Where an entry marked for removal and
+    its replacement share a key, the replacement is kept.
+    :param df: DataFrame containing data
+    :return: panda DataFrame
+    :rtype: panda.DataFrame
+    """
+    removed = is_removed(df)
+    # removals first, then keep the last of each key
+    df = pd.concat([df[removed], df[~removed]])
+    return df[~key_frame(df).duplicated(keep='last')]
+
+
+def split_delta(df, changes_only=False):
+    """
+    Split a release into the entries to upsert and the entries to delete
+    :param df: DataFrame containing data
+    :param changes_only: only consider entries with a change indicator; the
+                         stored data must be the previous release
+    :return: tuple of (upsert DataFrame, delete DataFrame)
+    :rtype: tuple
+    """
+    df = dedup_by_key(df)
+    removed = is_removed(df)
+    upserts = df[~removed]
+    if changes_only:
+        upserts = upserts[is_changed(upserts)]
+    return upserts, df[removed]
+
+
+def entry_key(entry):
+    """
+    Get the key of an entry
+    :param entry: dict of entry values
+    :return: key tuple
+    :rtype: tuple
+    """
+    fields = KEY_FIELDS if entry.get(COL_CODE, '') != '' else UNCODED_KEY_FIELDS
+    return tuple(entry.get(field, '') for field in fields)
+
+
+def entry_filter(entry):
+    """
+    Get the mongoDB query filter matching an entry
+    :param entry: dict of entry values
+    :return: query filter
+    :rtype: dict
+    """
+    fields = KEY_FIELDS if entry.get(COL_CODE, '') != '' else UNCODED_KEY_FIELDS
+    return {field: entry.get(field, '') for field in fields}
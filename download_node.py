@@ -0,0 +1,209 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import re
+
+import pandas as pd
+from dagster import solid
+
+from instrumentation import instrumented
+from process_node import country_names, process_fused
+from constants import (
+    COL_CHANGE, COL_LO, COL_CODE, COL_LOCAL, COL_FUNCTION,
+    FUNCTION_AIRPORT, UNLOCODE_COLUMNS, CHANGES_UPSERT
+)
+
+# number of documents per cursor batch
+DEFAULT_CURSOR_BATCH: int = 5000
+
+
+def airport_filter(function=FUNCTION_AIRPORT):
+    """
+    Get the mongoDB query selecting the entries required by process_unlocode;
+    entries with the specified function and the country headings
+    :param function: function classifier code
+    :return: query filter
+    :rtype: dict
+    """
+    return {'$or': [function_filter(function), heading_filter()]}
+
+
+def function_filter(function=FUNCTION_AIRPORT):
+    """
+    Get the mongoDB query selecting the entries with a function
+    :param function: function classifier code
+    :return: query filter
+    :rtype: dict
+    """
+    # e.g. --34-6--
+    return {COL_FUNCTION: {'$regex': re.escape(function)}}
+
+
+def heading_filter():
+    """
+    Get the mongoDB query selecting the country headings
+    :return: query filter
+    :rtype: dict
+    """
+    # country headings have no 'code' value and a name starting with '.'
+    return {COL_CODE: '', COL_LOCAL: {'$regex': r'^\.'}}
+
+
+def changed_filter():
+    """
+    Get the mongoDB query selecting the coded entries marked as added or
+    modified
+    :return: query filter
+    :rtype: dict
+    """
+    return {COL_CHANGE: {'$in': list(CHANGES_UPSERT)}, COL_CODE: {'$ne': ''}}
+
+
+def projected_columns(projection):
+    """
+    Get the fields of UN/LOCODE documents returned with a projection
+    :param projection: fields to include/exclude
+    :return: list of fields
+    :rtype: list
+    """
+    projection = projection or {}
+    # _id is returned unless excluded, whether other fields are included or excluded
+    columns = ['_id'] if projection.get('_id', 1) else []
+    included = [key for key, value in projection.items() if value and key != '_id']
+    if len(included) > 0:
+        columns.extend(included)
+    else:
+        columns.extend([column for column in UNLOCODE_COLUMNS if column not in projection])
+    return columns
+
+
+def iter_cursor_frames(cursor, batch_size=DEFAULT_CURSOR_BATCH):
+    """
+    Generator yielding panda DataFrames of consecutive batches of documents
+    from a mongoDB cursor
+    :param cursor: pymongo Cursor
+    :param batch_size: number of documents per DataFrame
+    :return: generator of panda DataFrames
+    """
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield pd.DataFrame.from_records(batch)
+            batch = []
+    if len(batch) > 0:
+        yield pd.DataFrame.from_records(batch)
+
+
+@solid(required_resource_keys={'mongo_warehouse'})
+@instrumented
+def stream_airports_from_mongo(context, projection, server_filter=True,
+                               batch_size=DEFAULT_CURSOR_BATCH, keep_code=False):
+    """
+    Download UN/LOCODE data from mongoDB server and process it, as per
+    process_unlocode. The country headings are downloaded first, then the
+    entries are streamed from the cursor in batches and each batch is
+    processed as it is received, so only the processed airports are retained.
+    The airport predicate is applied by the server.
+    :param context: execution context
+    :param projection: fields to include/exclude
+    :param server_filter: apply the airport filter on the server; if False all
+                          entries are downloaded
+    :param batch_size: number of documents per cursor batch
+    :param keep_code: retain the 'code' column
+    :return: panda DataFrame in the process_unlocode format, in country code
+             order, which is empty if there are no matching documents
+    :rtype: panda.DataFrame
+    """
+    columns = projected_columns(projection)
+    country_codes = {}
+    seen = set()
+    processed = []
+    downloaded = 0
+    batches = 0
+
+    client = context.resources.mongo_warehouse.get_connection(context)
+
+    if client is not None:
+        try:
+            collection = client.get_collection()
+            headings = pd.DataFrame.from_records(
+                list(collection.find(heading_filter(), projection=projection)),
+                columns=columns)
+            country_codes.update(country_names(headings))
+
+            sel_filter = function_filter() if server_filter else {}
+            cursor = collection.find(sel_filter, projection=projection,
+                                     batch_size=batch_size)
+            for df in iter_cursor_frames(cursor, batch_size=batch_size):
+                downloaded += len(df)
+                batches += 1
+                processed.append(process_fused(df, country_codes=country_codes,
+                                               seen=seen, keep_code=keep_code))
+
+            context.log.info(f'Downloaded {len(headings)} country headings and '
+                             f'{downloaded} records in {batches} batches')
+
+        finally:
+            # tidy up
+            client.close_connection()
+
+    if len(processed) == 0:
+        processed.append(process_fused(pd.DataFrame(columns=columns, dtype=str),
+                                       keep_code=keep_code))
+    df = pd.concat(processed, ignore_index=True) \
+        .sort_values(COL_LO, kind='stable', ignore_index=True)
+
+    context.log.info(f'Processed data for {len(df)} airports')
+
+    return df
+
+
+@solid(required_resource_keys={'mongo_warehouse'})
+@instrumented
+def download_changed_keys(context):
+    """
+    Download the keys of the entries marked as added or modified from
+    mongoDB server, irrespective of function. Modified entries which have
+    lost the airport function are not in the processed data, so these
+    identify them when synchronising only the changes.
+    :param context: execution context
+    :return: panda DataFrame of 'lo' and 'code' columns
+    :rtype: panda.DataFrame
+    """
+    keys = []
+
+    client = context.resources.mongo_warehouse.get_connection(context)
+
+    if client is not None:
+        try:
+            collection = client.get_collection()
+            keys = list(collection.find(changed_filter(),
+                                        projection={COL_LO: 1, COL_CODE: 1, '_id': 0}))
+        finally:
+            # tidy up
+            client.close_connection()
+
+    df = pd.DataFrame.from_records(keys, columns=[COL_LO, COL_CODE])
+
+    context.log.info(f'Downloaded {len(df)} changed entry keys')
+
+    return df
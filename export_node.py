@@ -0,0 +1,52 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from dagster import solid
+from instrumentation import instrumented
+
+from airport_export import export_frames, DEFAULT_ROW_GROUP_SIZE
+from load_cvs_node import DEFAULT_CHUNK_SIZE
+
+
+@solid
+@instrumented
+def export_airports(context, df, export_dir, chunk_size=DEFAULT_CHUNK_SIZE,
+                    row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Export processed UN/LOCODE data to a Parquet dataset partitioned by
+    country code and a SQLite database, with a manifest of the files
+    :param context: execution context
+    :param df: DataFrame, as produced by process_unlocode
+    :param export_dir: path of the export directory
+    :param chunk_size: maximum number of rows written at a time
+    :param row_group_size: maximum number of rows per Parquet row group
+    :return: panda DataFrame
+    :rtype: panda.DataFrame
+    """
+    manifest = export_frames(
+        (df.iloc[start:start + chunk_size] for start in range(0, max(len(df), 1), chunk_size)),
+        export_dir, row_group_size=row_group_size)
+
+    context.log.info(f"Exported {manifest['rows']} airports to "
+                     f"{len(manifest['parquet']['files'])} Parquet partitions "
+                     f"and {manifest['sqlite']['path']} in {export_dir}")
+
+    return df
@@ -0,0 +1,184 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Spatial index of processed UN/LOCODE locations, for nearest neighbour and
+    radius queries. Locations are indexed in a KD-tree as unit-sphere vectors,
+    so euclidean (chord) distance is monotonic with great-circle distance.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from constants import COL_LO, COL_IATA, COL_LAT, COL_LON
+
+# mean earth radius in km
+EARTH_RADIUS_KM: float = 6371.0088
+
+
+def to_unit_vectors(lat, lon):
+    """
+    Convert latitudes/longitudes to unit-sphere vectors
+    :param lat: array-like of latitudes in decimal degrees
+    :param lon: array-like of longitudes in decimal degrees
+    :return: array of shape (n, 3)
+    :rtype: numpy.ndarray
+    """
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon),
+                            np.sin(lat)))
+
+
+def chord_to_km(chord):
+    """
+    Convert unit-sphere chord lengths to great-circle distances
+    :param chord: array-like of chord lengths
+    :return: distances in km
+    :rtype: numpy.ndarray
+    """
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def km_to_chord(km):
+    """
+    Convert great-circle distances to unit-sphere chord lengths
+    :param km: array-like of distances in km
+    :return: chord lengths
+    :rtype: numpy.ndarray
+    """
+    return 2 * np.sin(np.clip(np.asarray(km) / (2 * EARTH_RADIUS_KM), 0, np.pi / 2))
+
+
+class GeoIndex:
+    """
+    Spatial index of locations
+    """
+
+    def __init__(self, lat, lon, codes, countries):
+        """
+        Initialise the index
+        :param lat: array of latitudes in decimal degrees
+        :param lon: array of longitudes in decimal degrees
+        :param codes: array of location codes
+        :param countries: array of country codes
+        """
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.codes = np.asarray(codes)
+        self.countries = np.asarray(countries)
+        self.tree = cKDTree(to_unit_vectors(self.lat, self.lon))
+
+    def __len__(self):
+        return len(self.lat)
+
+    @classmethod
+    def from_frame(cls, df, code_col=COL_IATA, country_col=COL_LO):
+        """
+        Create an index from a DataFrame as produced by process_unlocode.
+        Locations without coordinates are not indexed.
+        :param df: panda DataFrame
+        :param code_col: column of location codes
+        :param country_col: column of country codes
+        :return: index
+        :rtype: GeoIndex
+        """
+        located = df[df[COL_LAT].notna() & df[COL_LON].notna()]
+        return cls(located[COL_LAT].to_numpy(), located[COL_LON].to_numpy(),
+                   located[code_col].to_numpy(dtype=str),
+                   located[country_col].to_numpy(dtype=str))
+
+    @classmethod
+    def load(cls, index_path):
+        """
+        Load an index saved by save()
+        :param index_path: path to index file
+        :return: index
+        :rtype: GeoIndex
+        """
+        with np.load(index_path, allow_pickle=False) as data:
+            return cls(data['lat'], data['lon'], data['codes'], data['countries'])
+
+    def save(self, index_path):
+        """
+        Save the index. The KD-tree is rebuilt on load, which takes a few
+        milliseconds for the full UN/LOCODE location set.
+        :param index_path: path to index file
+        """
+        with open(index_path, 'wb') as fhandle:
+            np.savez(fhandle, lat=self.lat, lon=self.lon, codes=self.codes,
+                     countries=self.countries)
+
+    def nearest(self, lat, lon, k=1):
+        """
+        Find the nearest locations to a batch of points
+        :param lat: latitude or array-like of latitudes in decimal degrees
+        :param lon: longitude or array-like of longitudes in decimal degrees
+        :param k: number of nearest locations
+        :return: tuple of (distances in km, location indices) arrays of shape
+                 (n, k); missing neighbours have an infinite distance and an
+                 index equal to len(self)
+        :rtype: tuple
+        """
+        chord, idx = self.tree.query(to_unit_vectors(np.atleast_1d(lat),
+                                                     np.atleast_1d(lon)),
+                                     k=k, workers=-1)
+        chord = np.asarray(chord).reshape(-1, k)
+        idx = np.asarray(idx).reshape(-1, k)
+        missing = np.isinf(chord)
+        distance = chord_to_km(np.where(missing, 0, chord))
+        distance[missing] = np.inf
+        return distance, idx
+
+    def within(self, lat, lon, radius_km):
+        """
+        Find the locations within a radius of a batch of points
+        :param lat: latitude or array-like of latitudes in decimal degrees
+        :param lon: longitude or array-like of longitudes in decimal degrees
+        :param radius_km: radius in km
+        :return: list of arrays of location indices, one per point
+        :rtype: list
+        """
+        results = self.tree.query_ball_point(
+            to_unit_vectors(np.atleast_1d(lat), np.atleast_1d(lon)),
+            r=float(km_to_chord(radius_km)), workers=-1, return_sorted=True)
+        return [np.asarray(result, dtype=np.intp) for result in results]
+
+    def to_frame(self, indices, distances=None):
+        """
+        Get the details of locations
+        :param indices: array-like of location indices
+        :param distances: optional array-like of distances in km
+        :return: panda DataFrame
+        :rtype: panda.DataFrame
+        """
+        indices = np.asarray(indices, dtype=np.intp)
+        df = pd.DataFrame({
+            COL_IATA: self.codes[indices],
+            COL_LO: self.countries[indices],
+            COL_LAT: self.lat[indices],
+            COL_LON: self.lon[indices],
+        })
+        if distances is not None:
+            df['distance_km'] = np.asarray(distances)
+        return df
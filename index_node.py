@@ -0,0 +1,85 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from dagster import solid
+from instrumentation import instrumented
+
+from geo_index import GeoIndex
+from code_lookup import write_lookup
+from name_search import NameSearch
+
+
+@solid
+@instrumented
+def build_geo_index(context, df, index_path):
+    """
+    Build a spatial index of processed UN/LOCODE data and save it to disk
+    :param context: execution context
+    :param df: DataFrame, as produced by process_unlocode
+    :param index_path: path to save index to
+    :return: panda DataFrame
+    :rtype: panda.DataFrame
+    """
+    index = GeoIndex.from_frame(df)
+    index.save(index_path)
+
+    context.log.info(f'Indexed {len(index)} of {len(df)} locations in {index_path}')
+
+    return df
+
+
+@solid
+@instrumented
+def build_code_lookup(context, df, lookup_path):
+    """
+    Build a memory-mappable code lookup snapshot of processed UN/LOCODE data
+    and save it to disk
+    :param context: execution context
+    :param df: DataFrame, as produced by process_unlocode with keep_code set
+    :param lookup_path: path to save snapshot to
+    :return: panda DataFrame
+    :rtype: panda.DataFrame
+    """
+    count = write_lookup(df, lookup_path)
+
+    context.log.info(f'Saved {count} codes to {lookup_path}')
+
+    return df
+
+
+@solid
+@instrumented
+def build_name_search(context, df, search_path):
+    """
+    Build a trigram name search index of UN/LOCODE data and save it to disk
+    :param context: execution context
+    :param df: DataFrame containing unprocessed data, so all locations are
+               indexed rather than just airports
+    :param search_path: path to save index to
+    :return: panda DataFrame
+    :rtype: panda.DataFrame
+    """
+    index = NameSearch.from_frame(df)
+    index.save(search_path)
+
+    context.log.info(f'Indexed {len(index)} names in {search_path}')
+
+    return df
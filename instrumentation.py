@@ -0,0 +1,215 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Per-solid performance instrumentation. Solids decorated with @instrumented
+    have their wall/CPU time, peak memory, row counts and bytes read/written
+    published as Dagster output metadata, and optionally written to a
+    Prometheus text format file specified by the AC_METRICS_FILE environment
+    variable.
+
+    The CPU time includes that of the worker processes the solid waited for.
+    On linux the peak memory is that of the solid alone, as the peak RSS of
+    the process is reset when the solid starts; elsewhere it is the peak of
+    the process, so only increases of it are attributable to the solid.
+"""
+
+import functools
+import os
+import os.path as path
+import re
+import resource
+import sys
+import threading
+import time
+
+import pandas as pd
+from dagster import Output
+from constants import METRICS_FILE_ENV
+
+METRIC_PREFIX: str = 'airport_codes_solid'
+
+# latest metrics of each solid, for the Prometheus text format file
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS of this process to its current RSS; only supported on
+    linux
+    :return: True if the peak was reset
+    :rtype: bool
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as fhandle:
+            fhandle.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def rss_bytes(peak_reset):
+    """
+    Get the RSS and peak RSS of this process
+    :param peak_reset: peak RSS was reset by reset_peak_rss()
+    :return: tuple of RSS and peak RSS in bytes
+    :rtype: tuple
+    """
+    if peak_reset:
+        with open('/proc/self/status') as fhandle:
+            status = fhandle.read()
+        rss, peak = [int(re.search(rf'{field}:\s+(\d+) kB', status).group(1)) * 1024
+                     for field in ['VmRSS', 'VmHWM']]
+    else:
+        # peak since the process started; ru_maxrss is in kilobytes on linux,
+        # bytes on macOS
+        rss_unit = 1 if sys.platform == 'darwin' else 1024
+        rss = peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit
+    return rss, peak
+
+
+def _child_cpu_seconds():
+    """
+    Get the CPU time of the terminated child processes which were waited for,
+    e.g. the workers of a ProcessPoolExecutor once it is shut down
+    :return: seconds
+    :rtype: float
+    """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def row_count(value):
+    """
+    Get the number of rows in a value
+    :param value: DataFrame, dictionary of DataFrames or other value
+    :return: number of rows or None if not applicable
+    :rtype: int
+    """
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, dict) and len(value) > 0 and \
+            all(isinstance(df, pd.DataFrame) for df in value.values()):
+        return sum(len(df) for df in value.values())
+    return None
+
+
+def byte_count(value):
+    """
+    Get the in-memory size of a value
+    :param value: DataFrame, dictionary of DataFrames or other value
+    :return: bytes or None if not applicable
+    :rtype: int
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, dict) and len(value) > 0 and \
+            all(isinstance(df, pd.DataFrame) for df in value.values()):
+        return sum(byte_count(df) for df in value.values())
+    return None
+
+
+def write_prometheus(metrics_file):
+    """
+    Write the latest metrics of all solids to a Prometheus text format file.
+    The file is replaced atomically, as required by the node exporter textfile
+    collector.
+    :param metrics_file: path to file
+    """
+    lines = []
+    with _registry_lock:
+        names = sorted({name for metrics in _registry.values() for name in metrics})
+        for name in names:
+            metric = f'{METRIC_PREFIX}_{name}'
+            lines.append(f'# TYPE {metric} gauge')
+            for solid_name, metrics in sorted(_registry.items()):
+                if metrics.get(name) is not None:
+                    lines.append(f'{metric}{{solid="{solid_name}"}} {metrics[name]}')
+
+    tmp_file = f'{metrics_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w') as fhandle:
+        fhandle.write('\n'.join(lines) + '\n')
+    os.replace(tmp_file, metrics_file)
+
+
+def instrumented(fn):
+    """
+    Decorator to instrument a solid compute function; apply beneath @solid.
+    The function's result is returned as an Output with the metrics attached
+    as metadata.
+    :param fn: solid compute function, with the execution context as the first
+               argument
+    :return: wrapped function
+    """
+
+    @functools.wraps(fn)
+    def wrapper(context, *args, **kwargs):
+        inputs = list(args) + list(kwargs.values())
+        rows_in = [rows for rows in map(row_count, inputs) if rows is not None]
+        bytes_in = [size for size in map(byte_count, inputs) if size is not None]
+        # files read, e.g. zip files
+        zip_path = kwargs.get('zip_path')
+        if zip_path is not None and path.exists(zip_path):
+            bytes_in.append(path.getsize(zip_path))
+
+        peak_reset = reset_peak_rss()
+        rss_before, _ = rss_bytes(peak_reset)
+        cpu_start = time.process_time()
+        child_cpu_start = _child_cpu_seconds()
+        wall_start = time.perf_counter()
+
+        result = fn(context, *args, **kwargs)
+
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        child_cpu = _child_cpu_seconds() - child_cpu_start
+        _, peak_rss = rss_bytes(peak_reset)
+
+        metrics = {
+            'wall_seconds': round(wall, 6),
+            'cpu_seconds': round(cpu + child_cpu, 6),
+            'child_cpu_seconds': round(child_cpu, 6),
+            'peak_rss_bytes': peak_rss,
+            'peak_rss_increase_bytes': max(peak_rss - rss_before, 0),
+            'rows_in': sum(rows_in) if len(rows_in) > 0 else None,
+            'rows_out': row_count(result) if row_count(result) is not None else
+            (result if isinstance(result, int) else None),
+            'bytes_in': sum(bytes_in) if len(bytes_in) > 0 else None,
+            'bytes_out': byte_count(result),
+        }
+        metrics = {name: value for name, value in metrics.items()
+                   if value is not None}
+
+        solid_name = getattr(context, 'solid_def', None)
+        solid_name = solid_name.name if solid_name is not None else fn.__name__
+        with _registry_lock:
+            _registry[solid_name] = metrics
+
+        metrics_file = os.environ.get(METRICS_FILE_ENV)
+        if metrics_file:
+            write_prometheus(metrics_file)
+
+        context.log.debug(f'{solid_name} metrics: {metrics}')
+
+        return Output(result, metadata=metrics)
+
+    return wrapper
@@ -0,0 +1,494 @@
+# The MIT License (MIT)
+# Copyright (c) 2019-2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+
+from dagster import execute_pipeline
+from dagster_toolkit.environ import (
+    EnvironmentDict
+)
+from load_cvs_node import DEFAULT_CHUNK_SIZE
+from mongo_writer import DEFAULT_BATCH_SIZE, DEFAULT_MAX_WORKERS
+from download_node import DEFAULT_CURSOR_BATCH
+from async_pipeline import DEFAULT_QUEUE_SIZE
+from airport_export import DEFAULT_ROW_GROUP_SIZE
+from pipelines import (
+    csv_to_mongo_pipeline,
+    cached_csv_to_mongo_pipeline,
+    csv_to_mongo_stream_pipeline,
+    csv_to_mongo_sync_pipeline,
+    mongo_to_postgres_pipeline,
+    mongo_to_postgres_copy_pipeline,
+    mongo_to_postgres_async_pipeline,
+    mongo_to_postgres_sync_pipeline,
+    csv_to_postgres_pipeline,
+    csv_to_postgres_archive_pipeline,
+    csv_to_export_pipeline,
+    csv_to_postgres_by_function_pipeline,
+    releases_to_postgres_pipeline,
+    mongo_to_indexes_pipeline
+)
+from constants import (
+    COL_CHANGE, COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_DIVISION,
+    COL_FUNCTION, COL_STATUS, COL_DATE, COL_IATA, COL_COORD, COL_REMARK,
+    PROCESS_COLUMNS, PROCESS_DTYPES
+)
+
+# names of columns in UN/LOCODE data
+UNLOCODE_HEADER: tuple = (
+    COL_CHANGE,
+    COL_LO,
+    COL_CODE,
+    COL_LOCAL,
+    COL_NAME,
+    COL_DIVISION,
+    COL_FUNCTION,
+    COL_STATUS,
+    COL_DATE,
+    COL_IATA,
+    COL_COORD,
+    COL_REMARK
+)
+# regex pattern to match the UN/LOCODE csv files in the zip file
+UNLOCODE_PATTERN: str = r'.*UNLOCODE CodeListPart\d*\.csv'
+# field not required from mongo
+EXCLUDE_FIELDS: dict = {'_id': 0, COL_CHANGE: 0, COL_DIVISION: 0, COL_STATUS: 0,
+                        COL_DATE: 0, COL_REMARK: 0}
+# incremental synchronisation requires the change indicator
+SYNC_EXCLUDE_FIELDS: dict = {key: val for key, val in EXCLUDE_FIELDS.items()
+                             if key != COL_CHANGE}
+# environment variables passing database passwords to env sourced resource config
+MONGO_PASSWORD_ENV: str = 'AC_MONGO_PASSWORD'
+POSTGRES_PASSWORD_ENV: str = 'AC_POSTGRES_PASSWORD'
+
+
+def postgres_resource(app_cfg):
+    """
+    Get the Postgres resource entry for run_config
+    :param app_cfg: application configuration
+    :return: resource entry
+    :rtype: dict
+    """
+    return {'config': {'postgres_cfg': app_cfg['postgresdb']}}
+
+
+def mongo_resource(app_cfg):
+    """
+    Get the mongoDB resource entry for run_config
+    :param app_cfg: application configuration
+    :return: resource entry
+    :rtype: dict
+    """
+    return {'config': {'mongo_cfg': app_cfg['mongodb']}}
+
+
+def env_password_resource(db_cfg, cfg_key, env_var):
+    """
+    Get a resource entry for run_config, with the password sourced from an
+    environment variable, so it is not held in the run config, which is
+    persisted in run storage
+    :param db_cfg: database configuration
+    :param cfg_key: resource config key of the database configuration
+    :param env_var: name of environment variable to pass the password in
+    :return: resource entry
+    :rtype: dict
+    """
+    db_cfg = dict(db_cfg)
+    if 'password' in db_cfg:
+        os.environ[env_var] = str(db_cfg['password'])
+        db_cfg['password'] = {'env': env_var}
+    return {'config': {cfg_key: db_cfg}}
+
+
+def execute_csv_to_mongo_pipeline(app_cfg):
+    """
+    Execute the pipeline to upload the UN/LOCODE data from the zipped csv
+    files to mongoDB. If chunked loading is configured, the files are
+    streamed to mongoDB in bounded-size chunks, otherwise if a cache
+    directory is configured, the parsed data is loaded from/saved to the
+    cache.
+    :param app_cfg: application configuration
+    :return: True if the pipeline executed successfully
+    :rtype: bool
+    """
+    ac_cfg = app_cfg['airport_codes']
+    if ac_cfg.get('chunked_load', False):
+        return execute_csv_to_mongo_stream_pipeline(app_cfg)
+    if 'cache_dir' in ac_cfg:
+        load_solid = 'load_csv_from_zip_cached'
+        pipeline_def = cached_csv_to_mongo_pipeline
+    else:
+        load_solid = 'load_csv_from_zip'
+        pipeline_def = csv_to_mongo_pipeline
+
+    # environment dictionary
+    env_dict = EnvironmentDict() \
+        .add_solid_input(load_solid, 'zip_path', ac_cfg['unlocode_zip']) \
+        .add_solid_input(load_solid, 'pattern', UNLOCODE_PATTERN) \
+        .add_solid_input(load_solid, 'encoding', 'latin_1') \
+        .add_solid_input(load_solid, 'header', UNLOCODE_HEADER) \
+        .add_solid_input(load_solid, 'workers',
+                         ac_cfg.get('load_workers', 1)) \
+        .add_solid_input('upload_to_mongo', 'batch_size',
+                         ac_cfg.get('mongo_batch_size', DEFAULT_BATCH_SIZE)) \
+        .add_solid_input('upload_to_mongo', 'max_workers',
+                         ac_cfg.get('mongo_workers', DEFAULT_MAX_WORKERS)) \
+        .add_resource('mongo_warehouse', mongo_resource(app_cfg))
+    # optional column projection and dtypes applied in the csv reader
+    for cfg_key, input_name in [('load_columns', 'columns'),
+                                ('load_dtypes', 'dtypes')]:
+        if cfg_key in ac_cfg:
+            env_dict.add_solid_input(load_solid, input_name, ac_cfg[cfg_key])
+    if 'cache_dir' in ac_cfg:
+        env_dict.add_solid_input(load_solid, 'cache_dir',
+                                 ac_cfg['cache_dir'])
+        # optional cache eviction limits
+        for cfg_key, input_name in [('cache_max_mb', 'max_cache_mb'),
+                                    ('cache_max_age_days', 'max_age_days')]:
+            if cfg_key in ac_cfg:
+                env_dict.add_solid_input(load_solid, input_name,
+                                         ac_cfg[cfg_key])
+    result = execute_pipeline(pipeline_def, run_config=env_dict.build())
+    return result.success
+
+
+def execute_csv_to_mongo_stream_pipeline(app_cfg):
+    """
+    Execute the pipeline to stream the UN/LOCODE data from the zipped csv
+    files to mongoDB in bounded-size chunks
+    :param app_cfg: application configuration
+    :return: True if the pipeline executed successfully
+    :rtype: bool
+    """
+    # environment dictionary
+    env_dict = EnvironmentDict() \
+        .add_solid_input('stream_csv_to_mongo', 'zip_path',
+                         app_cfg['airport_codes']['unlocode_zip']) \
+        .add_solid_input('stream_csv_to_mongo', 'pattern', UNLOCODE_PATTERN) \
+        .add_solid_input('stream_csv_to_mongo', 'encoding', 'latin_1') \
+        .add_solid_input('stream_csv_to_mongo', 'header', UNLOCODE_HEADER) \
+        .add_solid_input('stream_csv_to_mongo', 'chunk_size',
+                         app_cfg['airport_codes'].get('chunk_size',
+                                                      DEFAULT_CHUNK_SIZE)) \
+        .add_solid_input('stream_csv_to_mongo', 'batch_size',
+                         app_cfg['airport_codes'].get('mongo_batch_size',
+                                                      DEFAULT_BATCH_SIZE)) \
+        .add_solid_input('stream_csv_to_mongo', 'max_workers',
+                         app_cfg['airport_codes'].get('mongo_workers',
+                                                      DEFAULT_MAX_WORKERS)) \
+        .add_resource('mongo_warehouse', mongo_resource(app_cfg)) \
+        .build()
+    result = execute_pipeline(csv_to_mongo_stream_pipeline,
+                              run_config=env_dict)
+    return result.success
+
+
+def execute_mongo_to_postgres_pipeline(app_cfg):
+    """
+    Execute the pipeline to retrieve the data from mongoDB, process and
+    save the result to Postgres. If the Postgres load method is configured
+    as 'copy', the data is bulk loaded using COPY, or as 'async', the
+    download, processing and bulk load of batches overlap.
+    :param app_cfg: application configuration
+    :return: True if the pipeline executed successfully
+    :rtype: bool
+    """
+    ac_cfg = app_cfg['airport_codes']
+    if ac_cfg.get('postgres_load', 'insert') == 'async':
+        env_dict = EnvironmentDict() \
+            .add_solid_input('stream_mongo_to_postgres', 'projection',
+                             EXCLUDE_FIELDS) \
+            .add_solid_input('stream_mongo_to_postgres', 'server_filter',
+                             ac_cfg.get('server_filter', True)) \
+            .add_solid_input('stream_mongo_to_postgres', 'batch_size',
+                             ac_cfg.get('async_batch_size', DEFAULT_CURSOR_BATCH)) \
+            .add_solid_input('stream_mongo_to_postgres', 'queue_size',
+                             ac_cfg.get('async_queue_size', DEFAULT_QUEUE_SIZE)) \
+            .add_solid_input('stream_mongo_to_postgres', 'trigram_indexes',
+                             ac_cfg.get('postgres_trigram_indexes', False)) \
+            .add_resource('async_mongo_settings',
+                          env_password_resource(app_cfg['mongodb'], 'mongo_cfg',
+                                                MONGO_PASSWORD_ENV)) \
+            .add_resource('async_postgres_settings',
+                          env_password_resource(app_cfg['postgresdb'], 'postgres_cfg',
+                                                POSTGRES_PASSWORD_ENV)) \
+            .build()
+        result = execute_pipeline(mongo_to_postgres_async_pipeline,
+                                  run_config=env_dict)
+        return result.success
+
+    if app_cfg['airport_codes'].get('postgres_load', 'insert') == 'copy':
+        pipeline_def = mongo_to_postgres_copy_pipeline
+        upload_solid = 'copy_to_postgres'
+    else:
+        pipeline_def = mongo_to_postgres_pipeline
+        upload_solid = 'upload_to_postgres'
+
+    # environment dictionary
+    env_dict = EnvironmentDict() \
+        .add_solid_input('stream_airports_from_mongo', 'projection',
+                         EXCLUDE_FIELDS) \
+        .add_solid_input('stream_airports_from_mongo', 'server_filter',
+                         app_cfg['airport_codes'].get('server_filter', True)) \
+        .add_solid_input('stream_airports_from_mongo', 'batch_size',
+                         app_cfg['airport_codes'].get('download_batch_size',
+                                                      DEFAULT_CURSOR_BATCH)) \
+        .add_solid_input('stream_airports_from_mongo', 'keep_code', True) \
+        .add_solid_input(upload_solid, 'trigram_indexes',
+                         app_cfg['airport_codes'].get(
+                             'postgres_trigram_indexes', False)) \
+        .add_resource('postgres_warehouse', postgres_resource(app_cfg)) \
+        .add_resource('mongo_warehouse', mongo_resource(app_cfg)) \
+        .build()
+    result = execute_pipeline(pipeline_def, run_config=env_dict)
+    return result.success
+
+
+def execute_csv_to_mongo_sync_pipeline(app_cfg):
+    """
+    Execute the pipeline to incrementally synchronise the UN/LOCODE data
+    from the zipped csv files to mongoDB
+    :param app_cfg: application configuration
+    :return: True if the pipeline executed successfully
+    :rtype: bool
+    """
+    # environment dictionary
+    env_dict = EnvironmentDict() \
+        .add_solid_input('load_csv_from_zip', 'zip_path',
+                         app_cfg['airport_codes']['unlocode_zip']) \
+        .add_solid_input('load_csv_from_zip', 'pattern', UNLOCODE_PATTERN) \
+        .add_solid_input('load_csv_from_zip', 'encoding', 'latin_1') \
+        .add_solid_input('load_csv_from_zip', 'header', UNLOCODE_HEADER) \
+        .add_solid_input('load_csv_from_zip', 'workers',
+                         app_cfg['airport_codes'].get('load_workers', 1)) \
+        .add_solid_input('sync_to_mongo', 'changes_only',
+                         app_cfg['airport_codes'].get('changes_only', False)) \
+        .add_resource('mongo_warehouse', mongo_resource(app_cfg)) \
+        .build()
+    result = execute_pipeline(csv_to_mongo_sync_pipeline,
+                              run_config=env_dict)
+    return result.success
+
+
+def execute_mongo_to_postgres_sync_pipeline(app_cfg):
+    """
+    Execute the pipeline to retrieve the data from mongoDB, process and
+    incrementally synchronise the result to Postgres
+    :param app_cfg: application configuration
+    :return: True if the pipeline executed successfully
+    :rtype: bool
+    """
+    # environment dictionary
+    env_dict = EnvironmentDict() \
+        .add_solid_input('stream_airports_from_mongo', 'projection',
+                         SYNC_EXCLUDE_FIELDS) \
+        .add_solid_input('stream_airports_from_mongo', 'server_filter',
+                         app_cfg['airport_codes'].get('server_filter', True)) \
+        .add_solid_input('stream_airports_from_mongo', 'batch_size',
+                         app_cfg['airport_codes'].get('download_batch_size',
+                                                      DEFAULT_CURSOR_BATCH)) \
+        .add_solid_input('stream_airports_from_mongo', 'keep_code', True) \
+        .add_solid_input('sync_to_postgres', 'changes_only',
+                         app_cfg['airport_codes'].get('changes_only', False)) \
+        .add_resource('postgres_warehouse', postgres_resource(app_cfg)) \
+        .add_resource('mongo_warehouse', mongo_resource(app_cfg)) \
+        .build()
+    result = execute_pipeline(mongo_to_postgres_sync_pipeline,
+                              run_config=env_dict)
+    return result.success
+
+
+def execute_mongo_to_indexes_pipeline(app_cfg):
+    """
+    Execute the pipeline to retrieve the data from mongoDB, process and
+    build the lookup indexes
+    :param app_cfg: application configuration
+    :return: True if the pipeline executed successfully
+    :rtype: bool
+    """
+    # environment dictionary
+    env_dict = EnvironmentDict() \
+        .add_solid_input('download_from_mongo', 'sel_filter', {}) \
+        .add_solid_input('download_from_mongo', 'projection',
+                         EXCLUDE_FIELDS) \
+        .add_solid_input('process_unlocode', 'keep_code', True) \
+        .add_solid_input('process_unlocode', 'workers',
+                         app_cfg['airport_codes'].get('process_workers', 1)) \
+        .add_solid_input('process_unlocode', 'fused',
+                         app_cfg['airport_codes'].get('process_fused', False)) \
+        .add_solid_input('build_geo_index', 'index_path',
+                         app_cfg['airport_codes'].get('geo_index',
+                                                      'geo_index.npz')) \
+        .add_solid_input('build_code_lookup', 'lookup_path',
+                         app_cfg['airport_codes'].get('code_lookup',
+                                                      'code_lookup.bin')) \
+        .add_solid_input('build_name_search', 'search_path',
+                         app_cfg['airport_codes'].get('name_search',
+                                                      'name_search.npz')) \
+        .add_resource('mongo_warehouse', mongo_resource(app_cfg)) \
+        .build()
+    result = execute_pipeline(mongo_to_indexes_pipeline,
+                              run_config=env_dict)
+    return result.success
+
+
+def execute_csv_to_postgres_pipeline(app_cfg):
+    """
+    Execute the pipeline to load the UN/LOCODE data from the zipped csv
+    files, process and save the result to Postgres, without the mongoDB
+    round trip. If configured, the raw data is archived to mongoDB in
+    parallel.
+    :param app_cfg: application configuration
+    :return: True if the pipeline executed successfully
+    :rtype: bool
+    """
+    ac_cfg = app_cfg['airport_codes']
+    archive = ac_cfg.get('archive_to_mongo', False)
+
+    # environment dictionary
+    env_dict = EnvironmentDict() \
+        .add_solid_input('load_airports_from_zip', 'zip_path',
+                         ac_cfg['unlocode_zip']) \
+        .add_solid_input('load_airports_from_zip', 'pattern', UNLOCODE_PATTERN) \
+        .add_solid_input('load_airports_from_zip', 'encoding', 'latin_1') \
+        .add_solid_input('load_airports_from_zip', 'header', UNLOCODE_HEADER) \
+        .add_solid_input('load_airports_from_zip', 'chunk_size',
+                         ac_cfg.get('chunk_size', DEFAULT_CHUNK_SIZE)) \
+        .add_solid_input('load_airports_from_zip', 'columns', PROCESS_COLUMNS) \
+        .add_solid_input('load_airports_from_zip', 'dtypes', PROCESS_DTYPES) \
+        .add_solid_input('process_unlocode', 'keep_code', True) \
+        .add_solid_input('process_unlocode', 'workers',
+                         ac_cfg.get('process_workers', 1)) \
+        .add_solid_input('process_unlocode', 'fused',
+                         ac_cfg.get('process_fused', False)) \
+        .add_solid_input('copy_to_postgres', 'trigram_indexes',
+                         ac_cfg.get('postgres_trigram_indexes', False)) \
+        .add_resource('postgres_warehouse', postgres_resource(app_cfg))
+    if archive:
+        env_dict \
+            .add_solid_input('stream_csv_to_mongo', 'zip_path',
+                             ac_cfg['unlocode_zip']) \
+            .add_solid_input('stream_csv_to_mongo', 'pattern', UNLOCODE_PATTERN) \
+            .add_solid_input('stream_csv_to_mongo', 'encoding', 'latin_1') \
+            .add_solid_input('stream_csv_to_mongo', 'header', UNLOCODE_HEADER) \
+            .add_solid_input('stream_csv_to_mongo', 'chunk_size',
+                             ac_cfg.get('chunk_size', DEFAULT_CHUNK_SIZE)) \
+            .add_resource('mongo_warehouse', mongo_resource(app_cfg))
+    result = execute_pipeline(
+        csv_to_postgres_archive_pipeline if archive else csv_to_postgres_pipeline,
+        run_config=env_dict.build())
+    return result.success
+
+
+def execute_csv_to_export_pipeline(app_cfg):
+    """
+    Execute the pipeline to load the UN/LOCODE data from the zipped csv
+    files, process and export the result to Parquet and SQLite files
+    :param app_cfg: application configuration
+    :return: True if the pipeline executed successfully
+    :rtype: bool
+    """
+    ac_cfg = app_cfg['airport_codes']
+
+    # environment dictionary
+    env_dict = EnvironmentDict() \
+        .add_solid_input('load_airports_from_zip', 'zip_path',
+                         ac_cfg['unlocode_zip']) \
+        .add_solid_input('load_airports_from_zip', 'pattern', UNLOCODE_PATTERN) \
+        .add_solid_input('load_airports_from_zip', 'encoding', 'latin_1') \
+        .add_solid_input('load_airports_from_zip', 'header', UNLOCODE_HEADER) \
+        .add_solid_input('load_airports_from_zip', 'chunk_size',
+                         ac_cfg.get('chunk_size', DEFAULT_CHUNK_SIZE)) \
+        .add_solid_input('load_airports_from_zip', 'columns', PROCESS_COLUMNS) \
+        .add_solid_input('load_airports_from_zip', 'dtypes', PROCESS_DTYPES) \
+        .add_solid_input('process_unlocode', 'keep_code', True) \
+        .add_solid_input('process_unlocode', 'workers',
+                         ac_cfg.get('process_workers', 1)) \
+        .add_solid_input('process_unlocode', 'fused',
+                         ac_cfg.get('process_fused', False)) \
+        .add_solid_input('export_airports', 'export_dir',
+                         ac_cfg.get('export_dir', 'export')) \
+        .add_solid_input('export_airports', 'chunk_size',
+                         ac_cfg.get('chunk_size', DEFAULT_CHUNK_SIZE)) \
+        .add_solid_input('export_airports', 'row_group_size',
+                         ac_cfg.get('export_row_group_size', DEFAULT_ROW_GROUP_SIZE)) \
+        .build()
+
+    result = execute_pipeline(csv_to_export_pipeline, run_config=env_dict)
+    return result.success
+
+
+def execute_csv_to_postgres_by_function_pipeline(app_cfg):
+    """
+    Execute the pipeline to load the UN/LOCODE data from the zipped csv
+    files, process the entries of all transport functions in a single pass
+    and save the result to a Postgres table per function
+    :param app_cfg: application configuration
+    :return: True if the pipeline executed successfully
+    :rtype: bool
+    """
+    ac_cfg = app_cfg['airport_codes']
+
+    # environment dictionary
+    env_dict = EnvironmentDict() \
+        .add_solid_input('load_csv_from_zip', 'zip_path', ac_cfg['unlocode_zip']) \
+        .add_solid_input('load_csv_from_zip', 'pattern', UNLOCODE_PATTERN) \
+        .add_solid_input('load_csv_from_zip', 'encoding', 'latin_1') \
+        .add_solid_input('load_csv_from_zip', 'header', UNLOCODE_HEADER) \
+        .add_solid_input('load_csv_from_zip', 'workers', ac_cfg.get('load_workers', 1)) \
+        .add_solid_input('load_csv_from_zip', 'columns', PROCESS_COLUMNS) \
+        .add_solid_input('load_csv_from_zip', 'dtypes', PROCESS_DTYPES) \
+        .add_solid_input('process_unlocode_by_function', 'functions',
+                         ac_cfg.get('functions', None)) \
+        .add_solid_input('process_unlocode_by_function', 'keep_code', True) \
+        .add_solid_input('copy_partitions_to_postgres', 'trigram_indexes',
+                         ac_cfg.get('postgres_trigram_indexes', False)) \
+        .add_resource('postgres_warehouse', postgres_resource(app_cfg)) \
+        .build()
+
+    result = execute_pipeline(csv_to_postgres_by_function_pipeline, run_config=env_dict)
+    return result.success
+
+
+def execute_releases_to_postgres_pipeline(app_cfg):
+    """
+    Execute the pipeline to load the configured UN/LOCODE releases into the
+    versioned release store on Postgres
+    :param app_cfg: application configuration
+    :return: True if the pipeline executed successfully
+    :rtype: bool
+    """
+    ac_cfg = app_cfg['airport_codes']
+
+    # environment dictionary
+    env_dict = EnvironmentDict() \
+        .add_solid_input('ingest_releases', 'zip_paths',
+                         ac_cfg.get('release_zips', [ac_cfg['unlocode_zip']])) \
+        .add_solid_input('ingest_releases', 'pattern', UNLOCODE_PATTERN) \
+        .add_solid_input('ingest_releases', 'encoding', 'latin_1') \
+        .add_solid_input('ingest_releases', 'header', UNLOCODE_HEADER) \
+        .add_solid_input('ingest_releases', 'chunk_size',
+                         ac_cfg.get('chunk_size', DEFAULT_CHUNK_SIZE)) \
+        .add_resource('postgres_warehouse', postgres_resource(app_cfg)) \
+        .build()
+
+    result = execute_pipeline(releases_to_postgres_pipeline, run_config=env_dict)
+    return result.success
@@ -20,48 +20,217 @@
 # SOFTWARE.
 
 import re
+from concurrent.futures import ProcessPoolExecutor
 from zipfile import ZipFile
 import pandas as pd
 import os.path as path
 
 from dagster import solid
+from instrumentation import instrumented
+from process_node import required_rows_mask
+from release_cache import (
+    cache_key, load_cached_frame, store_cached_frame, evict_cache
+)
 
+# default number of rows per chunk when streaming csv files
+DEFAULT_CHUNK_SIZE: int = 10000
 
-@solid
-def load_csv_from_zip(context, zip_path, pattern, encoding, header):
+
+def csv_read_args(encoding, header, columns=None, dtypes=None):
     """
-    Load csv files from a zip file into a dictionary of panda DataFrames,
+    Get the arguments for pandas.read_csv, projecting and typing columns in the
+    reader so unused columns are never materialised
+    :param encoding: encoding to use when reading csv files
+    :param header: header to use
+    :param columns: list of columns to load; None to load all columns
+    :param dtypes: dict of column dtypes, e.g. {'lo': 'category'}; columns not
+                   specified are loaded as strings
+    :return: dict of arguments
+    :rtype: dict
+    """
+    # Namibia has the country code 'NA' which is treated as Nan by default, so disable default
+    args = {'encoding': encoding, 'names': header, 'keep_default_na': False}
+    if columns is not None:
+        args['usecols'] = list(columns)
+    # dtypes are inferred per chunk when streaming, so the same column may be
+    # parsed differently in different chunks, e.g. a date of '0501' as 501
+    args['dtype'] = {column: str for column in (header if columns is None else columns)}
+    if dtypes is not None:
+        args['dtype'].update({column: dtype for column, dtype in dtypes.items()
+                              if columns is None or column in columns})
+    return args
+
+
+def concat_frames(frames):
+    """
+    Concatenate panda DataFrames in a single operation. Categorical columns
+    are given a common set of categories first, as otherwise pandas falls back
+    to object dtype.
+    :param frames: list of panda DataFrames
+    :return: panda DataFrame
+    :rtype: panda.DataFrame
+    """
+    frames = list(frames)
+    for column in frames[0].columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+            categories = frames[0][column].cat.categories
+            for frame in frames[1:]:
+                categories = categories.union(frame[column].cat.categories)
+            dtype = pd.CategoricalDtype(categories)
+            frames = [frame.astype({column: dtype}) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def zip_csv_members(zip_file, pattern):
+    """
+    Get the names of the files in a zip file which match the specified
+    pattern, in archive order
+    :param zip_file: ZipFile
+    :param pattern: regex pattern to match csv files in zip file
+    :return: list of file names
+    :rtype: list
+    """
+    regex = re.compile(pattern)
+    return [file.filename for file in zip_file.infolist()
+            if regex.match(file.filename)]
+
+
+def read_csv_chunks_from_zip(zip_path, pattern, encoding, header,
+                             chunk_size=DEFAULT_CHUNK_SIZE, columns=None,
+                             dtypes=None):
+    """
+    Generator yielding bounded-size panda DataFrames read directly from the
+    csv files in a zip file, where the filename matches the specified pattern.
+    Only one chunk is held in memory at a time.
+    :param zip_path: path to zip file
+    :param pattern: regex pattern to match csv files in zip file
+    :param encoding: encoding to use when reading csv files
+    :param header: header to use
+    :param chunk_size: maximum number of rows per chunk
+    :param columns: list of columns to load; None to load all columns
+    :param dtypes: dict of column dtypes
+    :return: generator of panda DataFrames
+    """
+    # verify zip path
+    if not path.exists(zip_path):
+        raise ValueError(f'Invalid zip file path: {zip_path}')
+
+    with ZipFile(zip_path) as zip_file:
+        for filename in zip_csv_members(zip_file, pattern):
+            with zip_file.open(filename) as csv_file:
+                with pd.read_csv(csv_file, chunksize=chunk_size,
+                                 **csv_read_args(encoding, header, columns, dtypes)) as reader:
+                    for chunk in reader:
+                        yield chunk
+
+
+def read_csv_member(zip_path, filename, encoding, header, columns=None,
+                    dtypes=None):
+    """
+    Read a single csv file from a zip file into a panda DataFrame.
+    The zip file is opened independently, so this may run in a worker process.
+    :param zip_path: path to zip file
+    :param filename: name of csv file in zip file
+    :param encoding: encoding to use when reading csv file
+    :param header: header to use
+    :param columns: list of columns to load; None to load all columns
+    :param dtypes: dict of column dtypes
+    :return: panda DataFrame
+    :rtype: panda.DataFrame
+    """
+    with ZipFile(zip_path) as zip_file:
+        with zip_file.open(filename) as csv_file:
+            return pd.read_csv(csv_file, **csv_read_args(encoding, header, columns, dtypes))
+
+
+def read_csv_dict_from_zip(zip_path, pattern, encoding, header, workers=1,
+                           columns=None, dtypes=None):
+    """
+    Read csv files from a zip file into a dictionary of panda DataFrames,
     where the filename matches the specified pattern
-    :param context: execution context
     :param zip_path: path to zip file
     :param pattern: regex pattern to match csv files in zip file
     :param encoding: encoding to use when reading csv files
     :param header: header to use
-    :return: dictionary of panda DataFrames
+    :param workers: number of worker processes to decompress and parse the
+                    csv files in parallel; 1 to load sequentially
+    :param columns: list of columns to load; None to load all columns
+    :param dtypes: dict of column dtypes
+    :return: dictionary of panda DataFrames, in archive order
     :rtype: dict
     """
     # verify zip path
     if not path.exists(zip_path):
         raise ValueError(f'Invalid zip file path: {zip_path}')
 
-    regex = re.compile(pattern)
+    with ZipFile(zip_path) as zip_file:
+        filenames = zip_csv_members(zip_file, pattern)
 
-    # use dictionary comprehension to load all the csv files in the zip file into a pandas data frame
-    zip_file = ZipFile(zip_path)
-    df = {
-        file.filename: pd.read_csv(
-            # Namibia has the country code 'NA' which is treated as Nan by default, so disable default
-            zip_file.open(file.filename), encoding=encoding, names=header, keep_default_na=False)
-        for file in zip_file.infolist()
-        if regex.match(file.filename)
-    }
+    workers = min(workers, len(filenames))
+    if workers > 1:
+        # map() returns results in submission order, so the dictionary is in
+        # archive order regardless of which worker finishes first
+        count = len(filenames)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            frames = executor.map(read_csv_member, [zip_path] * count, filenames,
+                                  [encoding] * count, [header] * count,
+                                  [columns] * count, [dtypes] * count)
+            df = dict(zip(filenames, frames))
+    else:
+        # use dictionary comprehension to load all the csv files in the zip file into a pandas data frame
+        df = {
+            filename: read_csv_member(zip_path, filename, encoding, header,
+                                      columns=columns, dtypes=dtypes)
+            for filename in filenames
+        }
 
-    context.log.info(f'Loaded {len(df)} files')
+    return df
 
+
+def combine_frames(df_dict):
+    """
+    Combine a dictionary of panda DataFrames into a single DataFrame
+    :param df_dict: dictionary of panda DataFrames
+    :return: panda DataFrame or None
+    :rtype: panda.DataFrame
+    """
+    if len(df_dict) == 0:
+        df = None
+    else:
+        # single concatenation, rather than repeatedly copying a growing DataFrame
+        df = concat_frames(df_dict.values())
     return df
 
 
 @solid
+@instrumented
+def load_csv_from_zip(context, zip_path, pattern, encoding, header, workers=1,
+                      columns=None, dtypes=None):
+    """
+    Load csv files from a zip file into a dictionary of panda DataFrames,
+    where the filename matches the specified pattern
+    :param context: execution context
+    :param zip_path: path to zip file
+    :param pattern: regex pattern to match csv files in zip file
+    :param encoding: encoding to use when reading csv files
+    :param header: header to use
+    :param workers: number of worker processes to decompress and parse the
+                    csv files in parallel; 1 to load sequentially
+    :param columns: list of columns to load; None to load all columns
+    :param dtypes: dict of column dtypes, e.g. {'lo': 'category'}
+    :return: dictionary of panda DataFrames, in archive order
+    :rtype: dict
+    """
+    df = read_csv_dict_from_zip(zip_path, pattern, encoding, header,
+                                workers=workers, columns=columns, dtypes=dtypes)
+
+    context.log.info(f'Loaded {len(df)} files using {max(min(workers, len(df)), 1)} worker(s)')
+
+    return df
+
+
+@solid
+@instrumented
 def combine_csv_from_dict(context, df_dict):
     """
     Combine a dictionary of panda DataFrames into a single DataFrame
@@ -70,14 +239,118 @@ def combine_csv_from_dict(context, df_dict):
     :return: panda DataFrame or None
     :rtype: dict
     """
-    df_count = len(df_dict)
-    if df_count == 0:
-        df = None
+    df = combine_frames(df_dict)
+
+    context.log.info(f'Merged {len(df_dict)} DataFrames')
+
+    return df
+
+
+@solid
+@instrumented
+def load_csv_from_zip_cached(context, zip_path, pattern, encoding, header,
+                             cache_dir, workers=1, max_cache_mb=None,
+                             max_age_days=None, columns=None, dtypes=None):
+    """
+    Load csv files from a zip file into a single panda DataFrame, where the
+    filename matches the specified pattern, using a local cache keyed by the
+    zip file content and the parse arguments. A cached release is loaded
+    without parsing the csv files.
+    :param context: execution context
+    :param zip_path: path to zip file
+    :param pattern: regex pattern to match csv files in zip file
+    :param encoding: encoding to use when reading csv files
+    :param header: header to use
+    :param cache_dir: cache directory
+    :param workers: number of worker processes to load the csv files on a miss
+    :param max_cache_mb: maximum size of the cache in megabytes, or None
+    :param max_age_days: maximum age of a cache entry in days, or None
+    :param columns: list of columns to load; None to load all columns
+    :param dtypes: dict of column dtypes, e.g. {'lo': 'category'}
+    :return: panda DataFrame or None
+    :rtype: panda.DataFrame
+    """
+    # verify zip path
+    if not path.exists(zip_path):
+        raise ValueError(f'Invalid zip file path: {zip_path}')
+
+    key = cache_key(zip_path, pattern, encoding, header, columns=columns,
+                    dtypes=dtypes)
+
+    df = load_cached_frame(cache_dir, key)
+    if df is not None:
+        context.log.info(f'Loaded {len(df)} records from cache')
     else:
-        df = pd.DataFrame()
-        for key in df_dict.keys():
-            df = df.append(df_dict[key])
+        df = combine_frames(read_csv_dict_from_zip(zip_path, pattern, encoding,
+                                                   header, workers=workers,
+                                                   columns=columns, dtypes=dtypes))
+        if df is not None:
+            store_cached_frame(cache_dir, key, df)
+            context.log.info(f'Cached {len(df)} records')
+
+    evicted = evict_cache(
+        cache_dir,
+        max_bytes=None if max_cache_mb is None else max_cache_mb * 1024 * 1024,
+        max_age_days=max_age_days)
+    if len(evicted) > 0:
+        context.log.info(f'Evicted {len(evicted)} cache entries')
+
+    return df
+
+
+def read_airports_from_zip(zip_path, pattern, encoding, header,
+                           chunk_size=DEFAULT_CHUNK_SIZE, columns=None,
+                           dtypes=None):
+    """
+    Read the entries required by process_unlocode from csv files in a zip file,
+    in bounded-size chunks
+    :param zip_path: path to zip file
+    :param pattern: regex pattern to match csv files in zip file
+    :param encoding: encoding to use when reading csv files
+    :param header: header to use
+    :param chunk_size: maximum number of rows per chunk
+    :param columns: list of columns to load; None to load all columns
+    :param dtypes: dict of column dtypes, e.g. {'lo': 'category'}
+    :return: tuple of panda DataFrame or None, and the total number of rows read
+    :rtype: tuple
+    """
+    loaded = 0
+    chunks = []
+    for chunk in read_csv_chunks_from_zip(zip_path, pattern, encoding, header,
+                                          chunk_size=chunk_size, columns=columns,
+                                          dtypes=dtypes):
+        loaded += len(chunk)
+        chunks.append(chunk[required_rows_mask(chunk)])
+
+    return concat_frames(chunks) if len(chunks) > 0 else None, loaded
+
+
+@solid
+@instrumented
+def load_airports_from_zip(context, zip_path, pattern, encoding, header,
+                           chunk_size=DEFAULT_CHUNK_SIZE, columns=None,
+                           dtypes=None):
+    """
+    Load the entries required by process_unlocode from csv files in a zip file
+    into a single panda DataFrame, where the filename matches the specified
+    pattern. The files are parsed in bounded-size chunks and each chunk is
+    reduced to the airports and country headings, so the complete data set is
+    never materialised.
+    :param context: execution context
+    :param zip_path: path to zip file
+    :param pattern: regex pattern to match csv files in zip file
+    :param encoding: encoding to use when reading csv files
+    :param header: header to use
+    :param chunk_size: maximum number of rows per chunk
+    :param columns: list of columns to load; None to load all columns
+    :param dtypes: dict of column dtypes, e.g. {'lo': 'category'}
+    :return: panda DataFrame or None
+    :rtype: panda.DataFrame
+    """
+    df, loaded = read_airports_from_zip(zip_path, pattern, encoding, header,
+                                        chunk_size=chunk_size, columns=columns,
+                                        dtypes=dtypes)
 
-    context.log.info(f'Merged {df_count} DataFrames')
+    context.log.info(f'Loaded {0 if df is None else len(df)} of {loaded} records')
 
     return df
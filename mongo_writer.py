@@ -0,0 +1,191 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Batched, concurrent mongoDB writer which adapts the batch size and
+    concurrency to throttling and latency, e.g. when an azure server's
+    throughput (RU/s) is exceeded.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from pymongo.errors import BulkWriteError, OperationFailure
+
+# error codes indicating the request was throttled; 16500 is returned by
+# azure Cosmos DB when the throughput (RU/s) is exceeded
+THROTTLE_CODES: tuple = (16500, 429)
+
+DEFAULT_BATCH_SIZE: int = 1000
+DEFAULT_MAX_WORKERS: int = 4
+
+
+def is_throttle_error(error):
+    """
+    Check if an error code represents a throttled request
+    :param error: error dict or exception
+    :return: True if throttled
+    :rtype: bool
+    """
+    code = error.get('code') if isinstance(error, dict) else \
+        getattr(error, 'code', None)
+    return code in THROTTLE_CODES
+
+
+class MongoBatchWriter:
+    """
+    Writer which inserts records in unordered batches on a bounded thread pool
+    """
+
+    def __init__(self, collection, batch_size=DEFAULT_BATCH_SIZE,
+                 max_workers=DEFAULT_MAX_WORKERS, min_batch_size=100,
+                 max_batch_size=10000, target_latency=1.0, max_retries=10,
+                 backoff=0.1, max_backoff=10.0):
+        """
+        Initialise the writer
+        :param collection: pymongo Collection
+        :param batch_size: initial number of records per batch
+        :param max_workers: maximum number of concurrent batches
+        :param min_batch_size: minimum number of records per batch
+        :param max_batch_size: maximum number of records per batch
+        :param target_latency: batch latency in seconds above which the batch
+                               size is reduced
+        :param max_retries: maximum number of retries of a throttled batch
+        :param backoff: initial back off in seconds after throttling
+        :param max_backoff: maximum back off in seconds
+        """
+        self.collection = collection
+        self.max_workers = max(1, max_workers)
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max(max_batch_size, min_batch_size)
+        self.batch_size = min(max(batch_size, min_batch_size),
+                              self.max_batch_size)
+        self.concurrency = self.max_workers
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.inserted = 0
+        self.failed = 0
+        self.throttled = 0
+        self.elapsed = 0.0
+
+    @property
+    def docs_per_sec(self):
+        """
+        Throughput of the writes completed so far
+        :return: documents per second
+        :rtype: float
+        """
+        return self.inserted / self.elapsed if self.elapsed > 0 else 0.0
+
+    def _insert_batch(self, records):
+        """
+        Insert a batch of records, retrying throttled records with
+        exponential back off
+        :param records: list of records
+        :return: tuple of (inserted count, failed count, throttled flag,
+                 latency in seconds)
+        :rtype: tuple
+        """
+        start = time.perf_counter()
+        inserted = 0
+        failed = 0
+        throttled = False
+        backoff = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = self.collection.insert_many(records, ordered=False)
+                inserted += len(result.inserted_ids)
+                records = []
+            except BulkWriteError as bwe:
+                inserted += bwe.details.get('nInserted', 0)
+                retry = [records[error['index']]
+                         for error in bwe.details.get('writeErrors', [])
+                         if is_throttle_error(error)]
+                # non-throttling errors, e.g. duplicate keys, are not retried
+                failed += len(bwe.details.get('writeErrors', [])) - len(retry)
+                records = retry
+            except OperationFailure as ofe:
+                if not is_throttle_error(ofe):
+                    raise
+
+            if len(records) == 0:
+                break
+
+            throttled = True
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+        # any records still throttled after the maximum retries have failed
+        failed += len(records)
+        return inserted, failed, throttled, time.perf_counter() - start
+
+    def _adapt(self, throttled, latency):
+        """
+        Adapt the batch size and concurrency; additive increase when writes
+        are fast and multiplicative decrease when throttled or slow
+        :param throttled: batch was throttled
+        :param latency: batch latency in seconds
+        """
+        if throttled:
+            self.throttled += 1
+            self.concurrency = max(1, self.concurrency // 2)
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        elif latency > self.target_latency:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        else:
+            self.concurrency = min(self.max_workers, self.concurrency + 1)
+            self.batch_size = min(self.max_batch_size,
+                                  self.batch_size + self.min_batch_size)
+
+    def write(self, df):
+        """
+        Write a DataFrame, generating the records for each batch as required
+        so the full list of records is never held in memory
+        :param df: panda DataFrame
+        :return: number of records inserted
+        :rtype: int
+        """
+        start = time.perf_counter()
+        inserted = self.inserted
+        position = 0
+        in_flight = set()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while position < len(df) or len(in_flight) > 0:
+                while position < len(df) and len(in_flight) < self.concurrency:
+                    records = df.iloc[position:position + self.batch_size] \
+                        .to_dict(orient='records')
+                    position += len(records)
+                    in_flight.add(executor.submit(self._insert_batch, records))
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_inserted, batch_failed, throttled, latency = \
+                        future.result()
+                    self.inserted += batch_inserted
+                    self.failed += batch_failed
+                    self._adapt(throttled, latency)
+
+        self.elapsed += time.perf_counter() - start
+        return self.inserted - inserted
@@ -0,0 +1,273 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Typo-tolerant search of UN/LOCODE place names, using a trigram inverted
+    index over the diacritic and non-diacritic names. Matches are ranked by
+    trigram similarity, with a boost for names starting with the query, which
+    are found from the names in sorted order. Query work is proportional to
+    the lengths of the posting lists of the query trigrams, rather than to the
+    number of names.
+"""
+
+import re
+import unicodedata
+from collections import namedtuple
+
+import numpy as np
+
+from constants import COL_LO, COL_CODE, COL_LOCAL, COL_NAME
+
+# boost added to the similarity of names which start with the query
+PREFIX_BOOST: float = 0.5
+# sorts after any character of normalised text, to find the end of a prefix range
+PREFIX_END: str = '\uffff'
+
+NON_ALNUM_REGEX = re.compile(r'[^0-9a-z]+')
+
+SearchResult = namedtuple('SearchResult',
+                          [COL_LO, COL_CODE, COL_NAME, COL_LOCAL, 'score'])
+
+
+def normalise(text):
+    """
+    Normalise text for searching; diacritics are removed, text is lower case
+    and non-alphanumeric characters are replaced by a space
+    :param text: text to normalise
+    :return: normalised text
+    :rtype: str
+    """
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return NON_ALNUM_REGEX.sub(' ', text.lower()).strip()
+
+
+def trigrams(text):
+    """
+    Get the set of trigrams of normalised text; each word is padded so short
+    words and word starts produce trigrams
+    :param text: normalised text
+    :return: set of trigrams
+    :rtype: set
+    """
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NameSearch:
+    """
+    Trigram inverted index of place names
+    """
+
+    def __init__(self, vocab, offsets, postings, gram_counts, countries, codes,
+                 names, names_local, keys, key_order=None):
+        """
+        Initialise the index
+        :param vocab: sorted array of trigrams
+        :param offsets: array of offsets into postings per trigram, len + 1
+        :param postings: array of document ids, grouped by trigram
+        :param gram_counts: array of number of trigrams per document
+        :param countries: array of country codes per document
+        :param codes: array of location codes per document
+        :param names: array of names per document
+        :param names_local: array of local names per document
+        :param keys: array of normalised names per document, for prefix matches
+        :param key_order: array of document ids in sorted order of keys; default
+                          is to sort the keys
+        """
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings = postings
+        self.gram_counts = gram_counts
+        self.countries = countries
+        self.codes = codes
+        self.names = names
+        self.names_local = names_local
+        self.keys = keys
+
+        # prefix index; documents whose keys start with a query occupy a
+        # contiguous range of the sorted keys
+        if key_order is None:
+            key_order = np.argsort(keys, kind='stable')
+        self.key_order = key_order
+        self.sorted_keys = keys[key_order]
+        self.key_rank = np.empty(len(key_order), dtype=np.int32)
+        self.key_rank[key_order] = np.arange(len(key_order), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.gram_counts)
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Create an index from a DataFrame of UN/LOCODE data; entries without a
+        'code' value (country headings and references) are not indexed
+        :param df: panda DataFrame
+        :return: index
+        :rtype: NameSearch
+        """
+        df = df[df[COL_CODE] != '']
+        names = df[COL_NAME].astype(str).to_numpy()
+        names_local = df[COL_LOCAL].astype(str).to_numpy()
+
+        gram_ids = {}
+        doc_grams = []
+        keys = []
+        for name, name_local in zip(names, names_local):
+            key = normalise(name)
+            keys.append(key)
+            grams = trigrams(key) | trigrams(normalise(name_local))
+            doc_grams.append([gram_ids.setdefault(gram, len(gram_ids))
+                              for gram in grams])
+
+        gram_counts = np.array([len(grams) for grams in doc_grams], dtype=np.int32)
+        doc_ids = np.repeat(np.arange(len(doc_grams), dtype=np.int32), gram_counts)
+        flat_grams = np.fromiter((gram for grams in doc_grams for gram in grams),
+                                 dtype=np.int32, count=int(gram_counts.sum()))
+
+        # renumber trigrams in sorted order so the vocabulary can be searched
+        vocab = np.array(list(gram_ids.keys()), dtype='U3')
+        vocab_order = np.argsort(vocab, kind='stable')
+        rank = np.empty_like(vocab_order)
+        rank[vocab_order] = np.arange(len(vocab_order))
+        flat_grams = rank[flat_grams]
+
+        order = np.argsort(flat_grams, kind='stable')
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(flat_grams, minlength=len(vocab)), out=offsets[1:])
+
+        return cls(vocab[vocab_order], offsets, doc_ids[order], gram_counts,
+                   df[COL_LO].astype(str).to_numpy(dtype='U2'),
+                   df[COL_CODE].astype(str).to_numpy(dtype='U3'),
+                   names.astype(str), names_local.astype(str),
+                   np.array(keys, dtype=str))
+
+    @classmethod
+    def load(cls, search_path):
+        """
+        Load an index saved by save()
+        :param search_path: path to index file
+        :return: index
+        :rtype: NameSearch
+        """
+        with np.load(search_path, allow_pickle=False) as data:
+            return cls(data['vocab'], data['offsets'], data['postings'],
+                       data['gram_counts'], data['countries'], data['codes'],
+                       data['names'], data['names_local'], data['keys'],
+                       key_order=data['key_order'] if 'key_order' in data else None)
+
+    def save(self, search_path):
+        """
+        Save the index
+        :param search_path: path to index file
+        """
+        with open(search_path, 'wb') as fhandle:
+            np.savez(fhandle, vocab=self.vocab, offsets=self.offsets,
+                     postings=self.postings, gram_counts=self.gram_counts,
+                     countries=self.countries, codes=self.codes,
+                     names=self.names, names_local=self.names_local,
+                     keys=self.keys, key_order=self.key_order)
+
+    def search(self, query, limit=10, country=None, min_score=0.0):
+        """
+        Search for place names similar to a query
+        :param query: query text
+        :param limit: maximum number of results
+        :param country: optional country code to restrict results to
+        :param min_score: minimum similarity score
+        :return: list of results, best match first
+        :rtype: list
+        """
+        key = normalise(query)
+        grams = np.array(sorted(trigrams(key)), dtype='U3')
+        if len(grams) == 0:
+            return []
+
+        # posting lists of the query trigrams present in the vocabulary
+        positions = np.searchsorted(self.vocab, grams)
+        valid = positions < len(self.vocab)
+        positions = positions[valid]
+        positions = positions[self.vocab[positions] == grams[valid]]
+        if len(positions) == 0:
+            return []
+        candidates = np.sort(np.concatenate([
+            self.postings[self.offsets[pos]:self.offsets[pos + 1]]
+            for pos in positions]))
+
+        # number of trigrams shared by each candidate, from the runs of the
+        # sorted candidates
+        run_start = np.empty(len(candidates), dtype=bool)
+        run_start[0] = True
+        np.not_equal(candidates[1:], candidates[:-1], out=run_start[1:])
+        starts = np.flatnonzero(run_start)
+        docs = candidates[starts]
+        shared = np.diff(starts, append=len(candidates))
+        if country is not None:
+            in_country = self.countries[docs] == country
+            docs = docs[in_country]
+            shared = shared[in_country]
+
+        # the score of the limit-th best of the most shared candidates is a
+        # lower bound of the limit-th best score; as the similarity is at most
+        # the shared fraction of the query trigrams, other candidates sharing
+        # fewer trigrams can not reach it, other than names starting with the
+        # query, which share all the query trigrams except the end of the last
+        # word
+        first, last = np.searchsorted(self.sorted_keys, [key, key + PREFIX_END])
+        if len(docs) > limit:
+            best = np.argpartition(-shared, limit - 1)[:limit]
+            scores = self._scores(docs[best], shared[best], len(grams), first, last)
+            bound = min(scores.min() * len(grams), len(grams) - 1)
+            ranked = shared >= bound
+            docs = docs[ranked]
+            shared = shared[ranked]
+        scores = self._scores(docs, shared, len(grams), first, last)
+
+        if len(scores) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            docs = docs[top]
+            scores = scores[top]
+        best = np.argsort(-scores, kind='stable')
+        return [SearchResult(str(self.countries[doc]), str(self.codes[doc]),
+                             str(self.names[doc]), str(self.names_local[doc]),
+                             float(score))
+                for doc, score in zip(docs[best], scores[best])
+                if score >= min_score]
+
+    def _scores(self, docs, shared, query_count, first, last):
+        """
+        Score candidates; the jaccard similarity of the trigram sets, boosted
+        for names starting with the query
+        :param docs: array of document ids
+        :param shared: array of number of query trigrams in each document
+        :param query_count: number of query trigrams
+        :param first: first position in the sorted keys starting with the query
+        :param last: position in the sorted keys after those starting with the
+                     query
+        :return: array of scores
+        :rtype: numpy.ndarray
+        """
+        ranks = self.key_rank[docs]
+        return shared / (query_count + self.gram_counts[docs] - shared) \
+            + PREFIX_BOOST * ((ranks >= first) & (ranks < last))
@@ -0,0 +1,278 @@
+# The MIT License (MIT)
+# Copyright (c) 2019-2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from dagster import (
+    pipeline,
+    ModeDefinition
+)
+from load_cvs_node import (
+    load_csv_from_zip,
+    combine_csv_from_dict,
+    load_csv_from_zip_cached,
+    load_airports_from_zip
+)
+from dagster_toolkit.postgres import postgres_warehouse_resource
+from dagster_toolkit.mongo import (
+    mongo_warehouse_resource,
+    download_from_mongo
+)
+from download_node import stream_airports_from_mongo, download_changed_keys
+from async_node import (
+    stream_mongo_to_postgres,
+    async_mongo_settings,
+    async_postgres_settings
+)
+from upload_node import (
+    upload_to_mongo,
+    upload_to_postgres,
+    stream_csv_to_mongo,
+    sync_to_mongo,
+    sync_to_postgres,
+    copy_to_postgres,
+    copy_partitions_to_postgres,
+    ingest_releases
+)
+from process_node import process_unlocode, process_unlocode_by_function
+from index_node import build_geo_index, build_code_lookup, build_name_search
+from export_node import export_airports
+
+"""
+    For information regarding UN/LOCODE, see 
+    https://www.unece.org/cefact/locode/welcome.html
+    For information regarding the data format, see 
+    https://unece.org/DAM/cefact/locode/UNLOCODE_Manual.pdf and 
+    '2021-1 UNLOCODE SecretariatNotes.pdf' in data/loc211csv.zip
+"""
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'mongo_warehouse': mongo_warehouse_resource
+            }
+        )
+    ]
+)
+def csv_to_mongo_pipeline():
+    df_dict = load_csv_from_zip()
+    df = combine_csv_from_dict(df_dict)
+    upload_to_mongo(df)
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'mongo_warehouse': mongo_warehouse_resource
+            }
+        )
+    ]
+)
+def cached_csv_to_mongo_pipeline():
+    df = load_csv_from_zip_cached()
+    upload_to_mongo(df)
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'mongo_warehouse': mongo_warehouse_resource
+            }
+        )
+    ]
+)
+def csv_to_mongo_stream_pipeline():
+    stream_csv_to_mongo()
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'mongo_warehouse': mongo_warehouse_resource
+            }
+        )
+    ]
+)
+def csv_to_mongo_sync_pipeline():
+    df_dict = load_csv_from_zip()
+    df = combine_csv_from_dict(df_dict)
+    sync_to_mongo(df)
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'postgres_warehouse': postgres_warehouse_resource,
+                'mongo_warehouse': mongo_warehouse_resource
+            }
+        )
+    ]
+)
+def mongo_to_postgres_pipeline():
+    processed = stream_airports_from_mongo()
+    upload_to_postgres(processed)
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'postgres_warehouse': postgres_warehouse_resource,
+                'mongo_warehouse': mongo_warehouse_resource
+            }
+        )
+    ]
+)
+def mongo_to_postgres_copy_pipeline():
+    processed = stream_airports_from_mongo()
+    copy_to_postgres(processed)
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'async_mongo_settings': async_mongo_settings,
+                'async_postgres_settings': async_postgres_settings
+            }
+        )
+    ]
+)
+def mongo_to_postgres_async_pipeline():
+    stream_mongo_to_postgres()
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'postgres_warehouse': postgres_warehouse_resource,
+                'mongo_warehouse': mongo_warehouse_resource
+            }
+        )
+    ]
+)
+def mongo_to_postgres_sync_pipeline():
+    processed = stream_airports_from_mongo()
+    sync_to_postgres(processed, download_changed_keys())
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'postgres_warehouse': postgres_warehouse_resource
+            }
+        )
+    ]
+)
+def csv_to_postgres_pipeline():
+    raw = load_airports_from_zip()
+    processed = process_unlocode(raw)
+    copy_to_postgres(processed)
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'postgres_warehouse': postgres_warehouse_resource,
+                'mongo_warehouse': mongo_warehouse_resource
+            }
+        )
+    ]
+)
+def csv_to_postgres_archive_pipeline():
+    raw = load_airports_from_zip()
+    processed = process_unlocode(raw)
+    copy_to_postgres(processed)
+    # archive the raw data to mongoDB in an independent branch
+    stream_csv_to_mongo()
+
+
+@pipeline
+def csv_to_export_pipeline():
+    raw = load_airports_from_zip()
+    processed = process_unlocode(raw)
+    export_airports(processed)
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'postgres_warehouse': postgres_warehouse_resource
+            }
+        )
+    ]
+)
+def csv_to_postgres_by_function_pipeline():
+    df_dict = load_csv_from_zip()
+    raw = combine_csv_from_dict(df_dict)
+    partitions = process_unlocode_by_function(raw)
+    copy_partitions_to_postgres(partitions)
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'postgres_warehouse': postgres_warehouse_resource
+            }
+        )
+    ]
+)
+def releases_to_postgres_pipeline():
+    ingest_releases()
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'mongo_warehouse': mongo_warehouse_resource
+            }
+        )
+    ]
+)
+def mongo_to_indexes_pipeline():
+    raw = download_from_mongo()
+    build_name_search(raw)
+    processed = process_unlocode(raw)
+    build_geo_index(processed)
+    build_code_lookup(processed)
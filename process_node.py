@@ -19,19 +19,366 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
 from dagster import solid
+from instrumentation import instrumented
 from constants import (
-    COL_LO, COL_CODE, COL_LOCAL, COL_FUNCTION, COL_IATA,
-    FUNCTION_AIRPORT
+    COL_LO, COL_CODE, COL_LOCAL, COL_FUNCTION, COL_IATA, COL_COORD,
+    COL_LAT, COL_LON,
+    FUNCTION_AIRPORT, FUNCTION_BITS, FUNCTION_TABLES
 )
 
+# ddmmN dddmmW, ddmmS dddmmE, etc.
+GEO_COORD_REGEX: str = r'^\s*(\d{2})(\d{2})([NS])\s+(\d{3})(\d{2})([EW])\s*$'
+
+
+def parse_geo_coord(coords):
+    """
+    Parse UN/LOCODE geographical coordinates into decimal degrees, in a single
+    vectorised pass. Invalid or missing coordinates result in NaN.
+    :param coords: Series of coordinates, e.g. '4230N 00131E'
+    :return: panda DataFrame with 'latitude' and 'longitude' columns
+    :rtype: panda.DataFrame
+    """
+    parts = coords.astype(object).where(coords.notna(), '') \
+        .astype(str).str.extract(GEO_COORD_REGEX)
+
+    lat_deg = pd.to_numeric(parts[0], errors='coerce').to_numpy(dtype=float)
+    lat_min = pd.to_numeric(parts[1], errors='coerce').to_numpy(dtype=float)
+    lon_deg = pd.to_numeric(parts[3], errors='coerce').to_numpy(dtype=float)
+    lon_min = pd.to_numeric(parts[4], errors='coerce').to_numpy(dtype=float)
+
+    lat = (lat_deg + lat_min / 60) * np.where(parts[2] == 'S', -1, 1)
+    lon = (lon_deg + lon_min / 60) * np.where(parts[5] == 'W', -1, 1)
+
+    # out of range values are invalid
+    lat[(np.abs(lat) > 90) | (lat_min >= 60)] = np.nan
+    lon[(np.abs(lon) > 180) | (lon_min >= 60)] = np.nan
+    invalid = np.isnan(lat) | np.isnan(lon)
+    lat[invalid] = np.nan
+    lon[invalid] = np.nan
+
+    return pd.DataFrame({COL_LAT: lat, COL_LON: lon}, index=coords.index)
+
+
+def required_rows_mask(df, function=FUNCTION_AIRPORT):
+    """
+    Get a mask of the entries required by process_unlocode; entries with the
+    specified function and the country headings. This allows a chunk of data
+    to be reduced before processing.
+    :param df: DataFrame containing data
+    :param function: function classifier code
+    :return: boolean Series
+    :rtype: panda.Series
+    """
+    # country headings have no 'code' value and a name starting with '.'
+    heading = (df[COL_CODE] == '') & df[COL_LOCAL].str.startswith('.')
+    return heading | (df[COL_FUNCTION].str.find(function) >= 0)
+
+
+def function_bitmask(functions):
+    """
+    Decode function classifiers into bit flags, as defined by FUNCTION_BITS.
+    Each distinct classifier is only decoded once, so this is cheap for the
+    small number of classifiers in use.
+    :param functions: Series of function classifiers, e.g. '--34-6--'
+    :return: array of bit flags
+    :rtype: numpy.ndarray
+    """
+    codes, uniques = pd.factorize(functions)
+    uniques = pd.Series(np.asarray(uniques, dtype=object)).fillna('').astype(str)
+    bits = np.zeros(len(uniques) + 1, dtype=np.uint8)
+    for function, bit in FUNCTION_BITS.items():
+        bits[:-1][(uniques.str.find(function) >= 0).to_numpy()] |= bit
+    # missing values have a code of -1, which selects the trailing 0
+    return bits[codes]
+
+
+def country_names(df):
+    """
+    Get the country names from the country headings
+    :param df: DataFrame containing data
+    :return: dict of country names keyed by country code
+    :rtype: dict
+    """
+    # no 'code' value and country name start with '.'
+    cc_df = df[(df[COL_CODE] == '') & df[COL_LOCAL].str.startswith('.')]
+    # remove leading '.' and convert to title case, and create dict with
+    # country code as key and name as value
+    return dict(zip(cc_df[COL_LO], cc_df[COL_LOCAL].str[1:].str.title()))
+
+
+def prepare_entries(context, df):
+    """
+    Perform the processing steps common to all functions; sort, deduplicate,
+    and extract the country names from the country headings
+    :param context: execution context
+    :param df: DataFrame containing data
+    :return: tuple of panda DataFrame of entries and dict of country names
+             keyed by country code
+    :rtype: (panda.DataFrame, dict)
+    """
+    pre_len = len(df)
+
+    # sorting by country code
+    df.sort_values(COL_LO, inplace=True)
+
+    # drop duplicate values
+    df.drop_duplicates(keep='first', inplace=True)
+
+    post_len = len(df)
+    if post_len != pre_len:
+        context.log.info(f'Dropped {pre_len - post_len} duplicates of '
+                         f'{pre_len}')
+
+    # entries with no 'code' value are country headings or names that have
+    # been changed
+    # e.g.
+    # lo code name_local         name               function iata geo_coord
+    # AD      .ANDORRA
+    # AE      Ruwais = Ar Ruways Ruwais = Ar Ruways
+
+    # generate a dict of country ids
+    country_codes = country_names(df)
+
+    # drop no 'code' entries
+    pre_len = len(df)
+    df = df.dropna(subset=[COL_CODE])
+
+    post_len = len(df)
+    if post_len != pre_len:
+        context.log.info(f'Dropped {pre_len - post_len} country headings '
+                         f'from {pre_len}')
+
+    return df, country_codes
+
+
+def finalise_entries(df, country_codes, keep_code=False):
+    """
+    Perform the processing steps common to all functions on the entries of a
+    function; set the iata code, and add the country name and decimal
+    coordinates
+    :param df: DataFrame of entries
+    :param country_codes: dict of country names keyed by country code
+    :param keep_code: retain the 'code' column
+    :return: panda DataFrame
+    :rtype: panda.DataFrame
+    """
+    # copy the un/locode to the iata column if the iata column is not
+    # already set
+    # e.g.
+    # lo code name_local       name             function iata geo_coord
+    # AD ALV  Andorra la Vella Andorra la Vella --34-6-- nan  4230N 00131E
+    df[COL_IATA] = df[COL_IATA].where(df[COL_IATA] != "", df[COL_CODE])
+
+    # drop columns not required
+    df = df.drop(columns=[COL_FUNCTION] if keep_code else
+                 [COL_CODE, COL_FUNCTION])
+
+    # add a country column by mapping country code to country name
+    df['country'] = df[COL_LO].map(country_codes)
+
+    # add numeric latitude/longitude columns parsed from the coordinates
+    coords = parse_geo_coord(df[COL_COORD])
+    df[COL_LAT] = coords[COL_LAT].to_numpy()
+    df[COL_LON] = coords[COL_LON].to_numpy()
+
+    # TODO lookup missing geo coordinates
+
+    return df
+
+
+def process_fused(df, country_codes=None, seen=None, keep_code=False):
+    """
+    Process UN/LOCODE data as per process_unlocode, in a single pass. The row
+    masks are computed on the input columns without modifying or copying the
+    data, only the candidate airports are deduplicated, and the output is
+    materialised once from the selected rows. The input is not modified.
+
+    May be applied to consecutive chunks of the data, in which case the
+    chunks must be in country code order with the country headings before the
+    entries of their country, e.g. sorted by country code and code, and the
+    state shared between chunks is updated in place.
+    :param df: DataFrame containing data
+    :param country_codes: dict of country names keyed by country code, which
+                          is updated with the country headings in the data;
+                          None if the data is complete
+    :param seen: set of hashes of the entries already processed, which is
+                 used to drop duplicates across chunks; None if the data is
+                 complete
+    :param keep_code: retain the 'code' column
+    :return: panda DataFrame in the process_unlocode format, in country code
+             order
+    :rtype: panda.DataFrame
+    """
+    if country_codes is None:
+        country_codes = {}
+
+    codes = df[COL_CODE]
+    # country headings have no 'code' value and a name starting with '.'
+    heading = np.flatnonzero((codes == '').to_numpy(dtype=bool, na_value=False))
+    if len(heading) > 0:
+        names = df[COL_LOCAL].take(heading)
+        is_heading = names.str.startswith('.').to_numpy(dtype=bool, na_value=False)
+        names = names[is_heading]
+        country_codes.update(zip(df[COL_LO].take(heading[is_heading]),
+                                 names.str[1:].str.title()))
+
+    # airports with a 'code' value
+    selected = np.flatnonzero(
+        ((function_bitmask(df[COL_FUNCTION]) & FUNCTION_BITS[FUNCTION_AIRPORT]) != 0) &
+        codes.notna().to_numpy())
+
+    # duplicate entries are identical so are all selected; drop them from the
+    # selection only
+    hashes = pd.util.hash_pandas_object(df.take(selected), index=False).to_numpy()
+    keep = ~pd.Series(hashes).duplicated().to_numpy()
+    if seen is not None:
+        keep &= np.fromiter((value not in seen for value in hashes), dtype=bool,
+                            count=len(hashes))
+        seen.update(hashes[keep])
+    selected = selected[keep]
+
+    # stable sort by country code, keeping the input order within a country
+    order, _ = pd.factorize(df[COL_LO].take(selected), sort=True)
+    selected = selected[np.argsort(order, kind='stable')]
+
+    # materialise the output columns from the selected rows
+    data = {column: df[column].array.take(selected) for column in df.columns
+            if column != COL_FUNCTION and (keep_code or column != COL_CODE)}
+
+    # copy the un/locode to the iata column if the iata column is not set
+    iata = pd.Series(data[COL_IATA])
+    data[COL_IATA] = iata.where(iata != '', pd.Series(codes.array.take(selected))).array
+    data['country'] = pd.Series(data[COL_LO]).map(country_codes).array
+    coords = parse_geo_coord(pd.Series(data[COL_COORD]))
+    data[COL_LAT] = coords[COL_LAT].to_numpy()
+    data[COL_LON] = coords[COL_LON].to_numpy()
+
+    return pd.DataFrame(data, index=df.index.take(selected))
+
+
+def process_batch(df, country_codes, seen, keep_code=False):
+    """
+    Process a batch of UN/LOCODE data to prepare it for upload, as per
+    process_unlocode. The batches must be in country code order with the
+    country headings before the entries of their country, e.g. sorted by
+    country code and code. The state shared between batches is updated in
+    place.
+    :param df: DataFrame containing batch
+    :param country_codes: dict of country names keyed by country code, which
+                          is updated with the country headings in the batch
+    :param seen: set of hashes of the entries already processed, which is
+                 used to drop duplicates across batches
+    :param keep_code: retain the 'code' column
+    :return: panda DataFrame in the process_unlocode format
+    :rtype: panda.DataFrame
+    """
+    return process_fused(df, country_codes=country_codes, seen=seen,
+                         keep_code=keep_code)
+
+
+def partition_by_country(df, partitions):
+    """
+    Split data into partitions of whole countries, of roughly equal size. The
+    partitions are in country code order, and the entries of each country are
+    in their original order.
+    :param df: DataFrame containing data
+    :param partitions: maximum number of partitions
+    :return: list of panda DataFrames
+    :rtype: list
+    """
+    df = df.sort_values(COL_LO, kind='stable')
+    # end position of each country, and the partition boundaries nearest to
+    # equal splits
+    codes, _ = pd.factorize(df[COL_LO])
+    ends = np.append(np.flatnonzero(np.diff(codes)) + 1, len(df))
+    targets = np.arange(1, partitions) * len(df) / partitions
+    cuts = np.unique(ends[np.minimum(np.searchsorted(ends, targets), len(ends) - 1)])
+    bounds = [0] + [cut for cut in cuts if 0 < cut < len(df)] + [len(df)]
+    return [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def process_partition(df, country_codes, keep_code=False):
+    """
+    Process the UN/LOCODE data of a partition of whole countries, as per
+    process_unlocode
+    :param df: DataFrame containing the entries of whole countries
+    :param country_codes: dict of country names keyed by country code
+    :param keep_code: retain the 'code' column
+    :return: panda DataFrame in the process_unlocode format
+    :rtype: panda.DataFrame
+    """
+    df, _ = process_partition_counted(df, country_codes, keep_code=keep_code)
+    return df
+
+
+def process_partition_counted(df, country_codes, keep_code=False):
+    """
+    Process the UN/LOCODE data of a partition of whole countries, as per
+    process_partition, and count the duplicates dropped
+    :param df: DataFrame containing the entries of whole countries
+    :param country_codes: dict of country names keyed by country code
+    :param keep_code: retain the 'code' column
+    :return: tuple of panda DataFrame in the process_unlocode format and
+             number of duplicates dropped
+    :rtype: (panda.DataFrame, int)
+    """
+    pre_len = len(df)
+    # duplicates have the same country code, so are in the same partition
+    df = df.drop_duplicates(keep='first')
+    duplicates = pre_len - len(df)
+    df = df.dropna(subset=[COL_CODE])
+    df = df[df[COL_FUNCTION].str.find(FUNCTION_AIRPORT) >= 0].copy()
+    return finalise_entries(df, country_codes, keep_code=keep_code), duplicates
+
+
+def process_partitioned(df, workers, keep_code=False):
+    """
+    Process UN/LOCODE data as per process_unlocode, with the data partitioned
+    by country and the partitions processed on a pool of processes. The
+    country names are extracted from the complete data beforehand, and the
+    results are merged in country code order.
+    :param df: DataFrame containing data
+    :param workers: number of worker processes
+    :param keep_code: retain the 'code' column
+    :return: tuple of panda DataFrame in the process_unlocode format and
+             number of duplicates dropped
+    :rtype: (panda.DataFrame, int)
+    """
+    country_codes = country_names(df)
+
+    # a few partitions per worker to balance the load
+    partitions = partition_by_country(df, workers * 4)
+    count = len(partitions)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map returns the results in partition order
+        results = list(executor.map(process_partition_counted, partitions,
+                                    [country_codes] * count, [keep_code] * count))
+
+    if len(results) == 0:
+        return df, 0
+    return pd.concat([result for result, _ in results]), \
+        sum(duplicates for _, duplicates in results)
+
 
 @solid
-def process_unlocode(context, df):
+@instrumented
+def process_unlocode(context, df, keep_code=False, workers=1, fused=False):
     """
     Process UN/LOCODE data to prepare it for upload
     :param context: execution context
     :param df: DataFrame containing data
+    :param keep_code: retain the 'code' column, as required to key entries
+                      for incremental synchronisation
+    :param workers: number of worker processes; if greater than 1 the data is
+                    partitioned by country and processed in parallel
+    :param fused: process the data in a single pass with process_fused, which
+                  does not hold intermediate copies of the data; not
+                  applicable if workers is greater than 1
     :return: panda DataFrame with the following format
                 'lo',           # the ISO 3166 alpha-2 Country Code
                 'name_local',   # place name, whenever possible, in their
@@ -44,47 +391,32 @@ def process_unlocode(context, df):
                                 # two last digits refer to minutes and the two
                                 # or three first digits indicate the degrees
                 'country'       # country name
+                'latitude'      # latitude in decimal degrees or NaN
+                'longitude'     # longitude in decimal degrees or NaN
     :rtype: panda.DataFrame
     """
-    pre_len = len(df)
+    if len(df) > 0 and workers > 1:
+        if fused:
+            context.log.warning(f'Fused processing is not applied with '
+                                f'{workers} workers')
 
-    if pre_len > 0:
-        # sorting by country code
-        df.sort_values(COL_LO, inplace=True)
-
-        # drop duplicate values
-        df.drop_duplicates(keep='first', inplace=True)
+        pre_len = len(df)
+        df, duplicates = process_partitioned(df, workers, keep_code=keep_code)
 
-        post_len = len(df)
-        if post_len != pre_len:
-            context.log.info(f'Dropped {pre_len - post_len} duplicates of '
-                             f'{pre_len}')
+        if duplicates > 0:
+            context.log.info(f'Dropped {duplicates} duplicates of {pre_len}')
+        context.log.info(f'Processed data for {len(df)} airports with '
+                         f'{workers} workers')
 
-        # entries with no 'code' value are country headings or names that have
-        # been changed
-        # e.g.
-        # lo code name_local         name               function iata geo_coord
-        # AD      .ANDORRA
-        # AE      Ruwais = Ar Ruways Ruwais = Ar Ruways
-
-        # generate a dict of country ids
-        # no 'code' value dataframe
-        cc_df = df[df[COL_CODE] == '']
-        # country name start with '.'
-        cc_df = cc_df[cc_df[COL_LOCAL].str.startswith('.')]
-        # remove leading '.' and convert to title case
-        cc_df[COL_LOCAL] = cc_df[COL_LOCAL].str[1:].str.title()
-        # create dict with country code as key and name as value
-        country_codes = dict(zip(cc_df[COL_LO], cc_df[COL_LOCAL]))
-
-        # drop no 'code' entries
+    elif len(df) > 0 and fused:
         pre_len = len(df)
-        df = df.dropna(subset=[COL_CODE])
+        df = process_fused(df, keep_code=keep_code)
 
-        post_len = len(df)
-        if post_len != pre_len:
-            context.log.info(f'Dropped {pre_len - post_len} country headings '
-                             f'from {pre_len}')
+        context.log.info(f'Processed data for {len(df)} airports from '
+                         f'{pre_len} entries in a single pass')
+
+    elif len(df) > 0:
+        df, country_codes = prepare_entries(context, df)
 
         # function code 4 represents an airport so remove other entries
         # e.g.
@@ -98,25 +430,51 @@ def process_unlocode(context, df):
             context.log.info(f'Dropped {pre_len - post_len} non-airport entries'
                              f' from {pre_len}')
 
-        # copy the un/locode to the iata column if the iata column is not
-        # already set
-        # e.g.
-        # lo code name_local       name             function iata geo_coord
-        # AD ALV  Andorra la Vella Andorra la Vella --34-6-- nan  4230N 00131E
-        df[COL_IATA] = df[COL_IATA].where(df[COL_IATA] != "", df[COL_CODE])
-
-        # drop columns not required
-        df = df.drop(columns=[COL_CODE, COL_FUNCTION])
-
-        # add a country column by mapping country code to country name
-        df['country'] = df[COL_LO].map(country_codes)
-
-        # TODO lookup missing geo coordinates
+        df = finalise_entries(df, country_codes, keep_code=keep_code)
 
         context.log.info(f'Processed data for {len(df)} airports')
 
     else:
-        context.log.info(f'DataFrame empty')
+        context.log.info('DataFrame empty')
 
     return df
 
+
+@solid
+@instrumented
+def process_unlocode_by_function(context, df, functions=None, keep_code=False):
+    """
+    Process UN/LOCODE data to prepare it for upload, partitioned by function.
+    The data is sorted, deduplicated and the country names extracted once, and
+    the function classifiers are decoded into bit flags in a single pass, from
+    which the entries of each function are selected. An entry with multiple
+    functions appears in the partition of each of its functions.
+    :param context: execution context
+    :param df: DataFrame containing data
+    :param functions: list of function codes to extract, e.g. ['1', '4'];
+                      None to extract all functions in FUNCTION_BITS
+    :param keep_code: retain the 'code' column
+    :return: dict of panda DataFrames, in the format returned by
+             process_unlocode, keyed by function code
+    :rtype: dict
+    """
+    if functions is None:
+        functions = list(FUNCTION_BITS.keys())
+
+    partitions = {}
+    if len(df) > 0:
+        df, country_codes = prepare_entries(context, df)
+
+        bitmask = function_bitmask(df[COL_FUNCTION])
+        for function in functions:
+            entries = df[(bitmask & FUNCTION_BITS[function]) != 0]
+            partitions[function] = finalise_entries(entries.copy(), country_codes,
+                                                    keep_code=keep_code)
+
+            context.log.info(f'Processed data for {len(partitions[function])} '
+                             f'{FUNCTION_TABLES[function]} entries')
+
+    else:
+        context.log.info('DataFrame empty')
+
+    return partitions
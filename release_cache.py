@@ -0,0 +1,164 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Local cache of parsed UN/LOCODE releases, stored in Arrow IPC (Feather)
+    format so that a cached release may be memory-mapped rather than
+    re-parsed from the zipped csv files.
+"""
+
+import hashlib
+import json
+import os
+import os.path as path
+import time
+
+import pyarrow.feather as feather
+
+CACHE_EXT: str = '.feather'
+# version of the parsed format; incremented when parsing changes, so entries
+# parsed by earlier versions are not used
+CACHE_VERSION: int = 2
+HASH_BLOCK_SIZE: int = 1024 * 1024
+
+
+def file_hash(file_path):
+    """
+    Calculate the SHA-256 hash of a file's content
+    :param file_path: path to file
+    :return: hex digest
+    :rtype: str
+    """
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as fhandle:
+        for block in iter(lambda: fhandle.read(HASH_BLOCK_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def cache_key(zip_path, pattern, encoding, header, **kwargs):
+    """
+    Generate the cache key for a release, from the zip file content and the
+    arguments used to parse it
+    :param zip_path: path to zip file
+    :param pattern: regex pattern to match csv files in zip file
+    :param encoding: encoding to use when reading csv files
+    :param header: header to use
+    :param kwargs: any other arguments which affect the parsed result
+    :return: cache key
+    :rtype: str
+    """
+    params = json.dumps({
+        'version': CACHE_VERSION,
+        'zip': file_hash(zip_path),
+        'pattern': pattern,
+        'encoding': encoding,
+        'header': list(header),
+        **kwargs
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(params.encode('utf-8')).hexdigest()
+
+
+def cache_path(cache_dir, key):
+    """
+    Get the path of a cache entry
+    :param cache_dir: cache directory
+    :param key: cache key
+    :return: path
+    :rtype: str
+    """
+    return path.join(cache_dir, f'{key}{CACHE_EXT}')
+
+
+def load_cached_frame(cache_dir, key):
+    """
+    Load a DataFrame from the cache
+    :param cache_dir: cache directory
+    :param key: cache key
+    :return: panda DataFrame or None if not cached
+    :rtype: panda.DataFrame
+    """
+    entry = cache_path(cache_dir, key)
+    if not path.exists(entry):
+        return None
+
+    table = feather.read_table(entry, memory_map=True)
+    # update access time so the entry is treated as recently used on eviction
+    os.utime(entry)
+    return table.to_pandas()
+
+
+def store_cached_frame(cache_dir, key, df):
+    """
+    Save a DataFrame to the cache
+    :param cache_dir: cache directory
+    :param key: cache key
+    :param df: panda DataFrame
+    :return: path of cache entry
+    :rtype: str
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = cache_path(cache_dir, key)
+    # write to a temporary file and rename, so a partial entry is never read
+    tmp_entry = f'{entry}.{os.getpid()}.tmp'
+    # uncompressed so the entry can be memory-mapped
+    feather.write_feather(df.reset_index(drop=True), tmp_entry,
+                          compression='uncompressed')
+    os.replace(tmp_entry, entry)
+    return entry
+
+
+def evict_cache(cache_dir, max_bytes=None, max_age_days=None):
+    """
+    Evict cache entries which are older than the maximum age, and then the
+    least recently used entries until the cache is within the maximum size
+    :param cache_dir: cache directory
+    :param max_bytes: maximum total size of the cache in bytes, or None
+    :param max_age_days: maximum age of an entry in days, or None
+    :return: list of evicted paths
+    :rtype: list
+    """
+    if not path.isdir(cache_dir):
+        return []
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(CACHE_EXT):
+            entry = path.join(cache_dir, name)
+            stat = os.stat(entry)
+            entries.append((stat.st_mtime, stat.st_size, entry))
+    # most recently used first
+    entries.sort(reverse=True)
+
+    evicted = []
+    now = time.time()
+    total = 0
+    for mtime, size, entry in entries:
+        expired = max_age_days is not None and \
+            (now - mtime) > max_age_days * 24 * 60 * 60
+        oversize = max_bytes is not None and (total + size) > max_bytes
+        if expired or oversize:
+            os.remove(entry)
+            evicted.append(entry)
+        else:
+            total += size
+
+    return evicted
@@ -0,0 +1,272 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Versioned Postgres store of multiple UN/LOCODE releases. Each version of
+    an airport entry is stored once, with the interval of releases for which
+    it is valid. Loading a release dedups and hashes every entry, copies the
+    whole release to a staging table and anti-joins it against the current
+    versions, so the load cost scales with the size of the release; only the
+    writes, i.e. inserting the entries which are new or changed and closing
+    the intervals of those which changed or were removed, scale with the
+    changes. The snapshot as of a release is a range query on the validity
+    intervals. Validity intervals are in load order, so releases can only be
+    appended; an earlier release can't be loaded after a later one.
+"""
+
+import hashlib
+import io
+import re
+
+import pandas as pd
+
+from delta_sync import coded_entries, dedup_by_key
+from constants import (
+    COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_IATA, COL_COORD, COL_LAT, COL_LON
+)
+
+VERSIONS_TABLE: str = 'airport_code_versions'
+RELEASES_TABLE: str = 'unlocode_releases'
+# DataFrame columns hashed to detect changed entries
+HASH_COLUMNS: list = [COL_LOCAL, COL_NAME, COL_IATA, COL_COORD, 'country']
+# DataFrame columns in the order of the versions table columns
+STORE_COLUMNS: list = [COL_LO, COL_CODE] + HASH_COLUMNS + [COL_LAT, COL_LON]
+# versions table columns corresponding to STORE_COLUMNS
+TABLE_COLUMNS: list = ['country_code', 'code', 'name_local', 'name', 'iata',
+                       'geo_coord', 'country', 'latitude', 'longitude']
+# release zip file name, e.g. loc211csv.zip for release 2021-1
+RELEASE_REGEX: str = r'loc(\d{2})(\d)csv'
+
+
+def release_from_path(zip_path):
+    """
+    Get the release from the name of a UN/LOCODE zip file
+    :param zip_path: path to zip file, e.g. 'data/loc211csv.zip'
+    :return: release, e.g. '2021-1', or None if not recognised
+    :rtype: str
+    """
+    match = re.search(RELEASE_REGEX, zip_path)
+    return f'20{match.group(1)}-{match.group(2)}' if match else None
+
+
+def release_order(release):
+    """
+    Get the sort key of a release
+    :param release: release, e.g. '2021-1'
+    :return: tuple of year and issue
+    :rtype: tuple
+    """
+    return tuple(int(part) for part in release.split('-'))
+
+
+def row_hashes(df):
+    """
+    Get a hash of the normalised values of each entry
+    :param df: DataFrame in the process_unlocode format
+    :return: Series of hex digests
+    :rtype: panda.Series
+    """
+    values = [df[column].astype(object).where(df[column].notna(), '')
+              .astype(str).str.strip() for column in HASH_COLUMNS]
+    joined = values[0].str.cat(values[1:], sep='\x1f')
+    return joined.map(lambda value: hashlib.md5(value.encode('utf-8')).hexdigest())
+
+
+def create_store_sql():
+    """
+    Get the statements to create the store, if it does not exist
+    :return: list of statements
+    :rtype: list
+    """
+    return [
+        f'''CREATE TABLE IF NOT EXISTS {RELEASES_TABLE} (
+                id           SERIAL    PRIMARY KEY,
+                release      TEXT      NOT NULL UNIQUE,
+                loaded_at    TIMESTAMP NOT NULL DEFAULT now(),
+                added        INTEGER,
+                closed       INTEGER
+                ); ''',
+        f'''CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (
+                id           SERIAL  PRIMARY KEY,
+                country_code TEXT    NOT NULL,
+                code         TEXT    NOT NULL,
+                name_local   TEXT    NOT NULL,
+                name         TEXT    NOT NULL,
+                iata         TEXT    NOT NULL,
+                geo_coord    TEXT,
+                country      TEXT,
+                latitude     DOUBLE PRECISION,
+                longitude    DOUBLE PRECISION,
+                row_hash     TEXT    NOT NULL,
+                valid_from   INTEGER NOT NULL REFERENCES {RELEASES_TABLE} (id),
+                valid_to     INTEGER REFERENCES {RELEASES_TABLE} (id)
+                ); ''',
+        # at most one current version of an entry
+        f'CREATE UNIQUE INDEX IF NOT EXISTS {VERSIONS_TABLE}_current_idx '
+        f'ON {VERSIONS_TABLE} (country_code, code) WHERE valid_to IS NULL',
+        f'CREATE INDEX IF NOT EXISTS {VERSIONS_TABLE}_validity_idx '
+        f'ON {VERSIONS_TABLE} (valid_from, valid_to)',
+    ]
+
+
+def pending_releases(releases, stored):
+    """
+    Get the releases to load, in release order, skipping those already stored
+    :param releases: iterable of releases to load, e.g. ['2021-1', '2020-2']
+    :param stored: list of releases in the store, in load order
+    :return: list of releases
+    :rtype: list
+    :raises ValueError: if a release not in the store is earlier than the
+                        latest release in the store
+    """
+    pending = sorted(set(releases) - set(stored), key=release_order)
+    if len(pending) > 0 and len(stored) > 0 \
+            and release_order(pending[0]) < release_order(stored[-1]):
+        earlier = [release for release in pending
+                   if release_order(release) < release_order(stored[-1])]
+        raise ValueError(f'Releases {", ".join(earlier)} are earlier than the '
+                         f'latest release in the store, {stored[-1]}, and '
+                         f'can not be backfilled')
+    return pending
+
+
+def loaded_releases(cursor):
+    """
+    Get the releases in the store
+    :param cursor: database cursor
+    :return: list of releases in load order
+    :rtype: list
+    """
+    cursor.execute(f'SELECT release FROM {RELEASES_TABLE} ORDER BY id')
+    return [row[0] for row in cursor.fetchall()]
+
+
+def load_release(cursor, df, release):
+    """
+    Load a release into the store. Releases must be loaded in release order,
+    and a release which is already in the store is skipped. Every entry of
+    the release is deduped, hashed, copied to a staging table and compared
+    with the current versions; only the writes scale with the number of
+    changes. Entries are identified by 'lo' + 'code', so entries without a
+    'code' value are not stored. The caller is responsible for committing
+    the transaction.
+    :param cursor: database cursor
+    :param df: DataFrame in the process_unlocode format, with the 'code' column
+    :param release: release, e.g. '2021-1'
+    :return: dict of the number of versions added and closed, or None if the
+             release is already in the store
+    :rtype: dict
+    :raises ValueError: if the release is earlier than the latest release in
+                        the store
+    """
+    if len(pending_releases([release], loaded_releases(cursor))) == 0:
+        return None
+
+    cursor.execute(f'INSERT INTO {RELEASES_TABLE} (release) VALUES (%s) '
+                   f'RETURNING id', (release,))
+    release_id = cursor.fetchone()[0]
+
+    df = dedup_by_key(coded_entries(df))
+    values = df[STORE_COLUMNS].copy()
+    values['row_hash'] = row_hashes(df)
+
+    # stage the release; empty values are loaded as empty strings as per
+    # copy_to_postgres, missing country names and coordinates as NULL
+    cursor.execute(f'DROP TABLE IF EXISTS {VERSIONS_TABLE}_release')
+    cursor.execute(f'''CREATE TEMP TABLE {VERSIONS_TABLE}_release (
+                    country_code TEXT NOT NULL,
+                    code         TEXT NOT NULL,
+                    name_local   TEXT NOT NULL,
+                    name         TEXT NOT NULL,
+                    iata         TEXT NOT NULL,
+                    geo_coord    TEXT,
+                    country      TEXT,
+                    latitude     DOUBLE PRECISION,
+                    longitude    DOUBLE PRECISION,
+                    row_hash     TEXT NOT NULL
+                    ) ON COMMIT DROP''')
+    buffer = io.StringIO()
+    values.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(f'''COPY {VERSIONS_TABLE}_release (
+                    {', '.join(TABLE_COLUMNS)}, row_hash
+                    ) FROM STDIN WITH (
+                        FORMAT csv,
+                        FORCE_NOT_NULL (country_code, code, name_local, name,
+                                        iata, geo_coord)
+                    )''', buffer)
+    buffer.close()
+    cursor.execute(f'ANALYZE {VERSIONS_TABLE}_release')
+
+    # close the current versions of entries which changed or were removed
+    cursor.execute(f'''UPDATE {VERSIONS_TABLE} v SET valid_to = %s
+                    WHERE v.valid_to IS NULL AND NOT EXISTS (
+                        SELECT 1 FROM {VERSIONS_TABLE}_release s
+                        WHERE s.country_code = v.country_code AND s.code = v.code
+                          AND s.row_hash = v.row_hash
+                    )''', (release_id,))
+    closed = cursor.rowcount
+
+    # add the entries which are new or changed, i.e. have no current version
+    cursor.execute(f'''INSERT INTO {VERSIONS_TABLE} (
+                    {', '.join(TABLE_COLUMNS)}, row_hash, valid_from
+                    )
+                    SELECT {', '.join(f's.{column}' for column in TABLE_COLUMNS)},
+                           s.row_hash, %s
+                    FROM {VERSIONS_TABLE}_release s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM {VERSIONS_TABLE} v
+                        WHERE v.valid_to IS NULL
+                          AND v.country_code = s.country_code AND v.code = s.code
+                    )''', (release_id,))
+    added = cursor.rowcount
+
+    cursor.execute(f'UPDATE {RELEASES_TABLE} SET added = %s, closed = %s '
+                   f'WHERE id = %s', (added, closed, release_id))
+
+    return {'added': added, 'closed': closed}
+
+
+def as_of_sql():
+    """
+    Get the query selecting the snapshot of the store as of a release; the
+    release is the query parameter
+    :return: query
+    :rtype: str
+    """
+    return f'''SELECT {', '.join(f'v.{column}' for column in TABLE_COLUMNS)}
+                FROM {VERSIONS_TABLE} v
+                JOIN {RELEASES_TABLE} r ON r.release = %s
+                WHERE v.valid_from <= r.id
+                  AND (v.valid_to IS NULL OR v.valid_to > r.id)
+                ORDER BY v.country_code, v.code'''
+
+
+def snapshot_as_of(cursor, release):
+    """
+    Get the snapshot of the store as of a release
+    :param cursor: database cursor
+    :param release: release, e.g. '2021-1'
+    :return: panda DataFrame with the STORE_COLUMNS columns
+    :rtype: panda.DataFrame
+    """
+    cursor.execute(as_of_sql(), (release,))
+    return pd.DataFrame.from_records(cursor.fetchall(), columns=STORE_COLUMNS)
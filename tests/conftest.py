@@ -0,0 +1,88 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Shared fixtures. Tests which require a Postgres server run against the
+    throwaway server specified by a connection string in the environment
+    variable AC_TEST_POSTGRES, e.g. 'dbname=test user=postgres host=localhost',
+    and are skipped if it is not set. Each test runs in a transaction which is
+    rolled back.
+"""
+
+import os
+import os.path as path
+
+import pytest
+
+from constants import (
+    COL_CHANGE, COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_DIVISION,
+    COL_FUNCTION, COL_STATUS, COL_DATE, COL_IATA, COL_COORD, COL_REMARK,
+    PROCESS_COLUMNS
+)
+
+POSTGRES_ENV: str = 'AC_TEST_POSTGRES'
+UNLOCODE_ZIP: str = path.join(path.dirname(path.dirname(path.abspath(__file__))),
+                              'data', 'loc211csv.zip')
+UNLOCODE_PATTERN: str = r'.*UNLOCODE CodeListPart\d*\.csv'
+UNLOCODE_ENCODING: str = 'latin_1'
+UNLOCODE_HEADER: tuple = (
+    COL_CHANGE, COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_DIVISION,
+    COL_FUNCTION, COL_STATUS, COL_DATE, COL_IATA, COL_COORD, COL_REMARK
+)
+
+
+@pytest.fixture(scope='session')
+def raw_release():
+    """
+    The bundled UN/LOCODE release, as loaded by combine_csv_from_dict
+    """
+    from load_cvs_node import read_csv_dict_from_zip, combine_frames
+
+    return combine_frames(read_csv_dict_from_zip(UNLOCODE_ZIP, UNLOCODE_PATTERN,
+                                                 UNLOCODE_ENCODING, UNLOCODE_HEADER))
+
+
+@pytest.fixture(scope='session')
+def processed_release(raw_release):
+    """
+    The bundled UN/LOCODE release, as produced by process_unlocode with
+    keep_code set
+    """
+    from process_node import process_fused
+
+    return process_fused(raw_release[PROCESS_COLUMNS], keep_code=True)
+
+
+@pytest.fixture
+def postgres_connection():
+    """
+    Connection to the test Postgres server; changes are rolled back
+    """
+    if POSTGRES_ENV not in os.environ:
+        pytest.skip(f'{POSTGRES_ENV} not set')
+    import psycopg2
+
+    connection = psycopg2.connect(os.environ[POSTGRES_ENV])
+    try:
+        yield connection
+    finally:
+        connection.rollback()
+        connection.close()
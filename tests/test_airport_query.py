@@ -0,0 +1,101 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from airport_query import AirportQuery
+from conftest import POSTGRES_ENV
+from constants import COL_LO, COL_CODE, COL_IATA, LOAD_CHANNEL
+from upload_node import copy_frame_to_table
+
+TABLE: str = 'airport_query_test'
+
+
+@pytest.fixture
+def airport_table(postgres_connection, processed_release):
+    # lookups use their own connections, so the table is committed
+    cursor = postgres_connection.cursor()
+    copy_frame_to_table(cursor, processed_release, TABLE)
+    postgres_connection.commit()
+    try:
+        yield postgres_connection
+    finally:
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+        postgres_connection.commit()
+
+
+def test_concurrent_lookups(airport_table, processed_release):
+    query = AirportQuery({'dsn': os.environ[POSTGRES_ENV]}, max_connections=3,
+                         table=TABLE)
+    try:
+        iatas = processed_release[COL_IATA].drop_duplicates().tolist()[:300]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(query.by_iata, iatas))
+        for iata, airports in zip(iatas, results):
+            assert len(airports) > 0
+            assert all(airport.iata == iata for airport in airports)
+        # connections stay open, so statements are prepared once per connection
+        assert len(query._prepared) == 3
+    finally:
+        query.close()
+
+
+def test_batch_lookups(airport_table, processed_release):
+    query = AirportQuery({'dsn': os.environ[POSTGRES_ENV]}, max_connections=1,
+                         table=TABLE)
+    try:
+        locodes = [tuple(key) for key in processed_release[[COL_LO, COL_CODE]]
+                   .drop_duplicates().values[:50].tolist()]
+        results = query.by_locodes(locodes + [('ZZ', 'ZZZ')])
+        assert results[('ZZ', 'ZZZ')] == []
+        for locode in locodes:
+            assert results[locode] == query.by_locode(*locode)
+            assert len(results[locode]) > 0
+    finally:
+        query.close()
+
+
+def test_cache_invalidated_by_load(airport_table):
+    query = AirportQuery({'dsn': os.environ[POSTGRES_ENV]}, max_connections=1,
+                         cache_size=100, table=TABLE)
+    try:
+        airport = query.by_locode('IE', 'DUB')[0]
+
+        cursor = airport_table.cursor()
+        cursor.execute(f"UPDATE {TABLE} SET name = 'Renamed' "
+                       f"WHERE country_code = 'IE' AND code = 'DUB'")
+        airport_table.commit()
+        # cached until a load is notified
+        assert query.by_locode('IE', 'DUB')[0] == airport
+
+        cursor.execute(f'NOTIFY {LOAD_CHANNEL}')
+        airport_table.commit()
+        for _ in range(50):
+            if query.by_locode('IE', 'DUB')[0].name == 'Renamed':
+                break
+            time.sleep(0.1)
+        assert query.by_locode('IE', 'DUB')[0].name == 'Renamed'
+    finally:
+        query.close()
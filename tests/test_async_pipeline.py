@@ -0,0 +1,148 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    The asynchronous mongoDB to Postgres path, against stand-ins for the motor
+    collection and asyncpg connection; the documents are served by mongomock.
+"""
+
+import asyncio
+
+import pytest
+
+from async_pipeline import NOT_NULL_COLUMNS, mongo_to_postgres, postgres_connection
+from constants import COL_CHANGE, COL_DIVISION, COL_STATUS, COL_DATE, COL_REMARK
+from upload_node import POSTGRES_COLUMNS, postgres_tuples
+
+mongomock = pytest.importorskip('mongomock')
+
+PROJECTION: dict = {'_id': 0, COL_CHANGE: 0, COL_DIVISION: 0, COL_STATUS: 0,
+                    COL_DATE: 0, COL_REMARK: 0}
+
+
+class AsyncCursor:
+    """ Stand-in for a motor cursor """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.iterator = None
+
+    def sort(self, key):
+        self.cursor = self.cursor.sort(key)
+        return self
+
+    def __aiter__(self):
+        self.iterator = iter(self.cursor)
+        return self
+
+    async def __anext__(self):
+        # yield to the other stages, as a network read would
+        await asyncio.sleep(0)
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncCollection:
+    """ Stand-in for a motor collection """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, sel_filter, projection=None, batch_size=None):
+        return AsyncCursor(self.collection.find(sel_filter, projection))
+
+
+class Transaction:
+    """ Stand-in for an asyncpg transaction """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def start(self):
+        self.connection.state = 'started'
+
+    async def commit(self):
+        self.connection.state = 'committed'
+
+    async def rollback(self):
+        self.connection.state = 'rolled back'
+
+
+class Connection:
+    """ Stand-in for an asyncpg connection, recording the copied records """
+
+    def __init__(self, fail_after=None):
+        self.state = None
+        self.statements = []
+        self.records = []
+        self.fail_after = fail_after
+
+    def transaction(self):
+        return Transaction(self)
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+
+    async def copy_records_to_table(self, table, records=None, columns=None):
+        if self.fail_after is not None and len(self.records) >= self.fail_after:
+            raise ConnectionError('connection lost')
+        self.records.extend(records)
+
+
+@pytest.fixture(scope='module')
+def collection(raw_release):
+    collection = mongomock.MongoClient().db.airport_codes
+    collection.insert_many(raw_release.to_dict('records'))
+    return AsyncCollection(collection)
+
+
+def expected_records(df):
+    # as loaded by PostgresStagingSink
+    values = df[POSTGRES_COLUMNS].astype(object)
+    values[NOT_NULL_COLUMNS] = values[NOT_NULL_COLUMNS].fillna('')
+    return sorted(map(str, postgres_tuples(values, POSTGRES_COLUMNS)))
+
+
+def test_mongo_to_postgres(collection, processed_release):
+    connection = Connection()
+    stats = asyncio.run(mongo_to_postgres(collection, connection, PROJECTION,
+                                          batch_size=500, queue_size=2))
+
+    assert connection.state == 'committed'
+    assert stats['written'] == len(processed_release)
+    assert sorted(map(str, connection.records)) == expected_records(processed_release)
+
+
+def test_mongo_to_postgres_rollback(collection):
+    connection = Connection(fail_after=1000)
+    with pytest.raises(ConnectionError):
+        asyncio.run(mongo_to_postgres(collection, connection, PROJECTION,
+                                      batch_size=500, queue_size=2))
+
+    assert connection.state == 'rolled back'
+    assert not any(statement.startswith('NOTIFY') for statement in connection.statements)
+
+
+def test_postgres_connection_config():
+    with pytest.raises(ValueError, match='dbname'):
+        asyncio.run(postgres_connection({'user': 'myuser', 'password': 'mypassword'}))
@@ -0,0 +1,39 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from constants import COL_LO
+from upload_node import copy_frame_to_table
+
+TABLE: str = 'airport_codes_copy_test'
+
+
+def test_copy_unknown_country(postgres_connection, processed_release):
+    # an entry whose country code has no country heading
+    df = processed_release.copy()
+    df.loc[df.index[0], COL_LO] = 'XX'
+    df.loc[df.index[0], 'country'] = None
+
+    cursor = postgres_connection.cursor()
+    uploaded = copy_frame_to_table(cursor, df, TABLE)
+
+    assert uploaded == len(df)
+    cursor.execute(f"SELECT country FROM {TABLE} WHERE country_code = 'XX'")
+    assert cursor.fetchall() == [(None,)]
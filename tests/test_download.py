@@ -0,0 +1,89 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pytest
+from dagster import build_solid_context
+
+from constants import COL_CHANGE, COL_DIVISION, COL_STATUS, COL_DATE, COL_REMARK
+from download_node import stream_airports_from_mongo
+
+mongomock = pytest.importorskip('mongomock')
+
+PROJECTION: dict = {'_id': 0, COL_CHANGE: 0, COL_DIVISION: 0, COL_STATUS: 0,
+                    COL_DATE: 0, COL_REMARK: 0}
+
+
+class MongomockClient:
+    """ Stand-in for the db_toolkit mongoDB client """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get_collection(self):
+        return self.collection
+
+    def close_connection(self):
+        pass
+
+
+class MongomockResource:
+    """ Stand-in for the mongo_warehouse resource """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get_connection(self, context):
+        return MongomockClient(self.collection)
+
+
+def download(collection, **kwargs):
+    context = build_solid_context(resources={'mongo_warehouse': MongomockResource(collection)})
+    output = stream_airports_from_mongo(context, projection=PROJECTION, keep_code=True,
+                                        **kwargs)
+    # instrumented solids return an Output
+    return getattr(output, 'value', output)
+
+
+def rows(df):
+    return sorted(map(str, df.astype(object).where(df.notna(), None).values.tolist()))
+
+
+def test_download_no_documents(processed_release):
+    df = download(mongomock.MongoClient().db.empty)
+
+    assert len(df) == 0
+    assert list(df.columns) == list(processed_release.columns)
+
+
+@pytest.fixture(scope='module')
+def collection(raw_release):
+    collection = mongomock.MongoClient().db.airport_codes
+    collection.insert_many(raw_release.to_dict('records'))
+    return collection
+
+
+@pytest.mark.parametrize('server_filter', [True, False])
+def test_download_airports(collection, processed_release, server_filter):
+    df = download(collection, server_filter=server_filter, batch_size=1000)
+
+    # as per process_unlocode of the complete data
+    assert list(df.columns) == list(processed_release.columns)
+    assert rows(df) == rows(processed_release)
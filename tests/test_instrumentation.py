@@ -0,0 +1,80 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+from dagster import build_solid_context
+
+from constants import METRICS_FILE_ENV
+from instrumentation import instrumented, METRIC_PREFIX
+
+MB: int = 1024 * 1024
+
+
+@instrumented
+def allocate(context, size_mb):
+    # touch the pages so they are resident
+    return int(np.ones(size_mb * MB, dtype=np.uint8).sum())
+
+
+def spin(count):
+    return sum(range(count))
+
+
+@instrumented
+def pool_work(context, count):
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        return sum(executor.map(spin, [count] * 4))
+
+
+@pytest.fixture
+def metrics(tmp_path, monkeypatch):
+    metrics_file = tmp_path / 'metrics.prom'
+    monkeypatch.setenv(METRICS_FILE_ENV, str(metrics_file))
+
+    def read(solid_name, name):
+        match = re.search(rf'^{METRIC_PREFIX}_{name}{{solid="{solid_name}"}} (\S+)$',
+                          metrics_file.read_text(), re.MULTILINE)
+        return float(match.group(1))
+    return read
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='peak RSS can only be reset on linux')
+def test_peak_rss_after_heavier_solid(metrics):
+    context = build_solid_context()
+    allocate(context, 200)
+    assert metrics('allocate', 'peak_rss_increase_bytes') > 150 * MB
+
+    allocate(context, 50)
+    # not masked by the peak of the heavier solid
+    assert 40 * MB < metrics('allocate', 'peak_rss_increase_bytes') < 150 * MB
+
+
+def test_cpu_includes_workers(metrics):
+    pool_work(build_solid_context(), 2_000_000)
+
+    assert metrics('pool_work', 'child_cpu_seconds') > 0
+    assert metrics('pool_work', 'cpu_seconds') >= metrics('pool_work', 'child_cpu_seconds')
@@ -0,0 +1,55 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pytest
+
+from constants import COL_DATE
+from conftest import UNLOCODE_ZIP, UNLOCODE_PATTERN, UNLOCODE_ENCODING, UNLOCODE_HEADER
+from load_cvs_node import read_csv_chunks_from_zip
+from mongo_writer import MongoBatchWriter
+
+
+def records(docs):
+    return sorted(tuple(str(doc[column]) for column in UNLOCODE_HEADER) for doc in docs)
+
+
+def test_chunks_are_strings():
+    for chunk in read_csv_chunks_from_zip(UNLOCODE_ZIP, UNLOCODE_PATTERN, UNLOCODE_ENCODING,
+                                          UNLOCODE_HEADER, chunk_size=5000):
+        for column in UNLOCODE_HEADER:
+            assert chunk[column].map(type).eq(str).all(), column
+
+
+def test_streamed_documents_match_full_read(raw_release):
+    mongomock = pytest.importorskip('mongomock')
+    collection = mongomock.MongoClient().db.collection
+
+    # as per stream_csv_to_mongo
+    writer = MongoBatchWriter(collection)
+    for chunk in read_csv_chunks_from_zip(UNLOCODE_ZIP, UNLOCODE_PATTERN, UNLOCODE_ENCODING,
+                                          UNLOCODE_HEADER, chunk_size=5000):
+        writer.write(chunk)
+
+    streamed = list(collection.find({}, projection={'_id': 0}))
+    assert len(streamed) == len(raw_release)
+    # dates such as '0501' retain their leading zero
+    assert any(doc[COL_DATE].startswith('0') for doc in streamed)
+    assert records(streamed) == records(raw_release.to_dict(orient='records'))
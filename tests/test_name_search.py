@@ -0,0 +1,77 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+import pytest
+
+from name_search import NameSearch, normalise, trigrams, PREFIX_BOOST
+
+QUERIES: list = ['s', 'san', 'Billy', 'Dublin', 'dubln', 'Saint-Ouen-la-Rouerie', 'New Yo',
+                 'Magilligan Point Ferry Terminal, Lough Foyle', 'Konge', 'zzzz']
+
+
+@pytest.fixture(scope='module')
+def name_search(raw_release):
+    return NameSearch.from_frame(raw_release)
+
+
+def exhaustive_scores(index, query, country=None):
+    # score every indexed name
+    key = normalise(query)
+    grams = trigrams(key)
+    positions = [np.searchsorted(index.vocab, gram) for gram in grams]
+    postings = [index.postings[index.offsets[pos]:index.offsets[pos + 1]]
+                for gram, pos in zip(grams, positions)
+                if pos < len(index.vocab) and index.vocab[pos] == gram]
+    shared = np.bincount(np.concatenate(postings + [np.array([], dtype=np.int32)]),
+                         minlength=len(index))
+    scores = shared / (len(grams) + index.gram_counts - shared) \
+        + PREFIX_BOOST * np.char.startswith(index.keys, key)
+    scores[shared == 0] = -1
+    if country is not None:
+        scores[index.countries != country] = -1
+    return np.sort(scores[scores >= 0])[::-1]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_search_ranking(name_search, query):
+    results = name_search.search(query, limit=10)
+    expected = exhaustive_scores(name_search, query)[:10]
+
+    assert [result.score for result in results] == pytest.approx(expected.tolist())
+
+
+def test_search_country(name_search):
+    results = name_search.search('dubln', limit=5, country='IE')
+    expected = exhaustive_scores(name_search, 'dubln', country='IE')[:5]
+
+    assert all(result.lo == 'IE' for result in results)
+    assert results[0].name == 'Dublin'
+    assert [result.score for result in results] == pytest.approx(expected.tolist())
+
+
+def test_save_load(name_search, tmp_path):
+    search_path = tmp_path / 'name_search.npz'
+    name_search.save(search_path)
+    loaded = NameSearch.load(search_path)
+
+    for query in QUERIES:
+        assert loaded.search(query) == name_search.search(query)
@@ -0,0 +1,110 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pytest
+
+from constants import COL_LO, COL_CODE, COL_NAME, PROCESS_COLUMNS, PROCESS_DTYPES
+from conftest import UNLOCODE_ZIP, UNLOCODE_PATTERN, UNLOCODE_ENCODING, UNLOCODE_HEADER
+from delta_sync import coded_entries, dedup_by_key
+from load_cvs_node import read_airports_from_zip
+from process_node import country_names, process_partition
+from release_store import (
+    create_store_sql, load_release, loaded_releases, pending_releases,
+    release_from_path, snapshot_as_of, VERSIONS_TABLE, RELEASES_TABLE
+)
+
+
+def read_release():
+    # as per ingest_releases
+    df, _ = read_airports_from_zip(UNLOCODE_ZIP, UNLOCODE_PATTERN,
+                                   UNLOCODE_ENCODING, UNLOCODE_HEADER,
+                                   columns=PROCESS_COLUMNS, dtypes=PROCESS_DTYPES)
+    return process_partition(df, country_names(df), keep_code=True)
+
+
+def keys(df):
+    return sorted(map(tuple, df[[COL_LO, COL_CODE]].astype(str).values.tolist()))
+
+
+def create_store(cursor):
+    cursor.execute(f'DROP TABLE IF EXISTS {VERSIONS_TABLE}, {RELEASES_TABLE}')
+    for statement in create_store_sql():
+        cursor.execute(statement)
+
+
+def test_load_bundled_release(postgres_connection):
+    cursor = postgres_connection.cursor()
+    create_store(cursor)
+    df = read_release()
+    release = release_from_path(UNLOCODE_ZIP)
+
+    counts = load_release(cursor, df, release)
+    expected = dedup_by_key(coded_entries(df))
+    assert counts == {'added': len(expected), 'closed': 0}
+    assert loaded_releases(cursor) == [release]
+    assert keys(snapshot_as_of(cursor, release)) == keys(expected)
+
+
+def test_load_later_release(postgres_connection):
+    cursor = postgres_connection.cursor()
+    create_store(cursor)
+    df = read_release()
+    load_release(cursor, df, '2021-1')
+
+    # a later release with one entry renamed and one removed
+    coded = dedup_by_key(coded_entries(df))
+    renamed, removed = coded.index[0], coded.index[1]
+    later = df.drop(index=removed)
+    later.loc[renamed, COL_NAME] = 'Renamed'
+
+    counts = load_release(cursor, later, '2021-2')
+    assert counts == {'added': 1, 'closed': 2}
+
+    previous = snapshot_as_of(cursor, '2021-1')
+    current = snapshot_as_of(cursor, '2021-2')
+    assert keys(previous) == keys(coded)
+    assert keys(current) == keys(coded.drop(index=removed))
+    key = tuple(coded.loc[renamed, [COL_LO, COL_CODE]])
+    assert current.set_index([COL_LO, COL_CODE]).loc[key, COL_NAME] == 'Renamed'
+
+
+def test_pending_releases():
+    # loaded in release order, skipping stored releases
+    assert pending_releases(['2021-1', '2020-1', '2020-2'], []) == \
+        ['2020-1', '2020-2', '2021-1']
+    assert pending_releases(['2021-1', '2020-2', '2021-2'], ['2020-2', '2021-1']) == \
+        ['2021-2']
+    # earlier releases can't be backfilled
+    with pytest.raises(ValueError):
+        pending_releases(['2020-1', '2021-2'], ['2021-1'])
+
+
+def test_load_stored_release(postgres_connection):
+    cursor = postgres_connection.cursor()
+    create_store(cursor)
+    df = read_release()
+    load_release(cursor, df, '2021-1')
+
+    # reloading is skipped, loading an earlier release is rejected
+    assert load_release(cursor, df, '2021-1') is None
+    with pytest.raises(ValueError):
+        load_release(cursor, df, '2020-2')
+    assert loaded_releases(cursor) == ['2021-1']
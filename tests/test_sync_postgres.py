@@ -0,0 +1,105 @@
+# The MIT License (MIT)
+# Copyright (c) 2021 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pandas as pd
+
+from constants import COL_CHANGE, COL_LO, COL_CODE, CHANGE_REMOVED
+from delta_sync import coded_entries, dedup_by_key
+from upload_node import sync_frame_to_table, copy_frame_to_table
+
+
+def table_keys(cursor):
+    cursor.execute('SELECT country_code, code FROM airport_codes')
+    return sorted(cursor.fetchall())
+
+
+def release_keys(df):
+    return sorted(map(tuple, dedup_by_key(coded_entries(df))[[COL_LO, COL_CODE]]
+                      .values.tolist()))
+
+
+def test_release_has_uncoded_entries(processed_release):
+    # references such as 'Cayenne = GF CAY' have no code and must be excluded
+    assert (processed_release[COL_CODE] == '').sum() > 0
+    keys = dedup_by_key(coded_entries(processed_release))[[COL_LO, COL_CODE]]
+    assert not keys.duplicated().any()
+
+
+def test_sync_bundled_release(postgres_connection, processed_release):
+    cursor = postgres_connection.cursor()
+    cursor.execute('DROP TABLE IF EXISTS airport_codes')
+
+    counts = sync_frame_to_table(cursor, processed_release)
+    expected = release_keys(processed_release)
+    assert counts['upserted'] == len(expected)
+    assert counts['deleted'] == 0
+    assert table_keys(cursor) == expected
+
+    # a second sync of the same release changes nothing
+    counts = sync_frame_to_table(cursor, processed_release)
+    assert counts == {'upserted': 0, 'deleted': 0, 'duplicates': 0}
+    assert table_keys(cursor) == expected
+
+
+def test_sync_bulk_loaded_table(postgres_connection, processed_release):
+    cursor = postgres_connection.cursor()
+    cursor.execute('DROP TABLE IF EXISTS airport_codes')
+
+    # a bulk load keeps uncoded entries and duplicate keys
+    copied = copy_frame_to_table(cursor, processed_release, 'airport_codes')
+    assert copied == len(processed_release)
+
+    counts = sync_frame_to_table(cursor, processed_release)
+    expected = release_keys(processed_release)
+    assert counts['duplicates'] > 0
+    assert table_keys(cursor) == expected
+
+    # every key holds the content of the release entry
+    release = dedup_by_key(coded_entries(processed_release)).set_index([COL_LO, COL_CODE])
+    cursor.execute('SELECT country_code, code, name FROM airport_codes')
+    for country_code, code, name in cursor.fetchall():
+        assert release.loc[(country_code, code), 'name'] == name
+
+
+def test_sync_changes_only(postgres_connection, processed_release):
+    cursor = postgres_connection.cursor()
+    cursor.execute('DROP TABLE IF EXISTS airport_codes')
+    sync_frame_to_table(cursor, processed_release)
+    expected = release_keys(processed_release)
+
+    # next release: one entry removed, one removal of an entry which was never
+    # stored, and one modified entry which is no longer an airport
+    removed, lost = expected[0], expected[1]
+    release = dedup_by_key(coded_entries(processed_release))
+    release = release[(release[COL_LO] != lost[0]) | (release[COL_CODE] != lost[1])].copy()
+    release[COL_CHANGE] = ''
+    release.loc[(release[COL_LO] == removed[0]) & (release[COL_CODE] == removed[1]),
+                COL_CHANGE] = CHANGE_REMOVED
+    never_stored = release.iloc[[0]].copy()
+    never_stored[COL_CODE] = 'ZZZZZ'
+    never_stored[COL_CHANGE] = CHANGE_REMOVED
+    release = pd.concat([release, never_stored], ignore_index=True)
+    changed_keys = pd.DataFrame([lost], columns=[COL_LO, COL_CODE])
+
+    counts = sync_frame_to_table(cursor, release, changes_only=True,
+                                 changed_keys=changed_keys)
+    assert counts == {'upserted': 0, 'deleted': 2, 'duplicates': 0}
+    assert table_keys(cursor) == [key for key in expected if key not in (removed, lost)]
@@ -19,19 +19,180 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import io
+
 from dagster import solid
+from instrumentation import instrumented
 from db_toolkit.postgres.postgresdb_sql import does_table_exist_sql
 from db_toolkit.postgres.postgresdb_sql import count_sql
 from db_toolkit.postgres.postgresdb_sql import estimate_count_sql
 from psycopg2.extras import execute_values
+from pymongo import ReplaceOne, DeleteOne, ASCENDING
+from load_cvs_node import (
+    read_csv_chunks_from_zip, read_airports_from_zip, DEFAULT_CHUNK_SIZE
+)
+from process_node import country_names, process_partition
+from release_store import (
+    create_store_sql, loaded_releases, load_release, pending_releases,
+    release_from_path, release_order
+)
+from delta_sync import split_delta, coded_entries, entry_key, entry_filter
+from mongo_writer import MongoBatchWriter, DEFAULT_BATCH_SIZE, DEFAULT_MAX_WORKERS
+from constants import (
+    COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_FUNCTION, COL_IATA, COL_COORD,
+    COL_LAT, COL_LON, FUNCTION_TABLES, PROCESS_COLUMNS, PROCESS_DTYPES,
+    LOAD_CHANNEL
+)
+
+# number of operations per mongoDB bulk write
+MONGO_BULK_SIZE: int = 1000
+# DataFrame columns in the order of the airport_codes table columns
+POSTGRES_COLUMNS: list = [COL_LO, COL_CODE, COL_LOCAL, COL_NAME, COL_IATA,
+                          COL_COORD, 'country', COL_LAT, COL_LON]
+# column definitions of the airport_codes table; the country name is NULL if
+# there is no heading for the country code
+AIRPORT_TABLE_COLUMNS: str = '''
+                id           SERIAL PRIMARY KEY,
+                country_code TEXT   NOT NULL,
+                code         TEXT   NOT NULL,
+                name_local   TEXT   NOT NULL,
+                name         TEXT   NOT NULL,
+                iata         TEXT   NOT NULL,
+                geo_coord    TEXT,
+                country      TEXT,
+                latitude     DOUBLE PRECISION,
+                longitude    DOUBLE PRECISION
+                '''
+
+
+def create_mongo_indexes(collection):
+    """
+    Create the indexes supporting server-side filtering of airports and country
+    headings, and the 'lo' + 'code' key
+    :param collection: pymongo Collection
+    :return: list of index names
+    :rtype: list
+    """
+    return [
+        collection.create_index([(COL_FUNCTION, ASCENDING)]),
+        collection.create_index([(COL_CODE, ASCENDING), (COL_LOCAL, ASCENDING)]),
+        collection.create_index([(COL_LO, ASCENDING), (COL_CODE, ASCENDING)]),
+    ]
+
+
+def lookup_index_sql(table):
+    """
+    Get the statements to create the indexes supporting lookups of a table,
+    by iata code, by country code and code, and by coordinates
+    :param table: table name
+    :return: list of tuples of index name and statement
+    :rtype: list
+    """
+    return [(f'{table}_{name}_idx',
+             f'CREATE INDEX IF NOT EXISTS {table}_{name}_idx ON {table} ({columns})')
+            for name, columns in [('iata', 'iata'),
+                                  ('country_code_code', 'country_code, code'),
+                                  ('lat_lon', 'latitude, longitude')]]
+
+
+def trigram_index_sql(table):
+    """
+    Get the statements to create pg_trgm indexes on the name columns of a
+    table, to support similarity and ILIKE searches
+    :param table: table name
+    :return: list of tuples of index name and statement
+    :rtype: list
+    """
+    return [(f'{table}_{column}_trgm_idx',
+             f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm_idx '
+             f'ON {table} USING gin ({column} gin_trgm_ops)')
+            for column in [COL_NAME, COL_LOCAL]]
+
+
+def create_trigram_indexes(cursor, table):
+    """
+    Create pg_trgm indexes on the name columns of a table, to support
+    similarity and ILIKE searches
+    :param cursor: database cursor
+    :param table: table name
+    :return: list of index names
+    :rtype: list
+    """
+    cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    indexes = []
+    for index, statement in trigram_index_sql(table):
+        cursor.execute(statement)
+        indexes.append(index)
+    return indexes
+
+
+def staging_table_sql(table):
+    """
+    Get the statements to create the staging table of a table, ready for
+    loading
+    :param table: table name
+    :return: list of statements
+    :rtype: list
+    """
+    staging = f'{table}_staging'
+    return [
+        f'DROP TABLE IF EXISTS {staging}',
+        f'CREATE TABLE {staging} ({AIRPORT_TABLE_COLUMNS})',
+    ]
+
+
+def staging_swap_sql(table, trigram_indexes=False):
+    """
+    Get the statements to index a loaded staging table, and replace the table
+    with it. The dependent objects of the staging table are renamed to the
+    standard names so the next load can reuse the staging names.
+    :param table: table name
+    :param trigram_indexes: create pg_trgm indexes on the name columns
+    :return: list of statements
+    :rtype: list
+    """
+    staging = f'{table}_staging'
+    statements = []
+    indexes = lookup_index_sql(staging)
+    if trigram_indexes:
+        statements.append('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        indexes += trigram_index_sql(staging)
+    statements += [statement for _, statement in indexes]
+    statements += [
+        f'ANALYZE {staging}',
+        f'DROP TABLE IF EXISTS {table}',
+        f'ALTER TABLE {staging} RENAME TO {table}',
+    ]
+    statements += [f'ALTER INDEX {index} RENAME TO {index.replace(staging, table)}'
+                   for index in [f'{staging}_pkey'] + [name for name, _ in indexes]]
+    statements.append(f'ALTER SEQUENCE {staging}_id_seq RENAME TO {table}_id_seq')
+    return statements
+
+
+def postgres_tuples(df, columns):
+    """
+    Convert the specified columns of a panda DataFrame to a list of tuples for
+    insertion, with missing values as None
+    :param df: DataFrame
+    :param columns: list of columns
+    :return: list of tuples
+    :rtype: list
+    """
+    values = df[columns].astype(object)
+    values = values.where(values.notna(), None)
+    return [tuple(x) for x in values.values]
 
 
 @solid(required_resource_keys={'mongo_warehouse'})
-def upload_to_mongo(context, df):
+@instrumented
+def upload_to_mongo(context, df, batch_size=DEFAULT_BATCH_SIZE,
+                    max_workers=DEFAULT_MAX_WORKERS):
     """
     Upload panda DataFrame to mongoDB server
     :param context: execution context
     :param df: DataFrame
+    :param batch_size: initial number of records per batch
+    :param max_workers: maximum number of concurrent batches
     :return: dictionary of panda DataFrames
     :rtype: dict
     """
@@ -39,31 +200,79 @@ def upload_to_mongo(context, df):
     client = context.resources.mongo_warehouse.get_connection(context)
 
     if client is not None:
-        # convert the DataFrame to a list like [{column -> value}, … , {column -> value}]
-        # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.to_dict.html
-        entries = df.to_dict(orient='records')
+        context.log.info('Record upload in progress')
 
-        context.log.info(f'Record upload in progress')
-
-        # use the insert_many() method on the MongoDb client rather than the collection, as if an azure server is
-        # being used there might be a BulkWriteError if the throughput (RU/s) is exceeded.
-        # MongoDb.insert_many() will attempt to continue in a slower batch mode
-        result = client.insert_many(entries)
+        # the records for each batch are generated as required, and written in unordered batches on a bounded
+        # thread pool. If an azure server is being used there might be a BulkWriteError if the throughput (RU/s)
+        # is exceeded, in which case the writer backs off and reduces the batch size and concurrency
+        writer = MongoBatchWriter(client.get_collection(), batch_size=batch_size,
+                                  max_workers=max_workers)
+        try:
+            uploaded = writer.write(df)
+            create_mongo_indexes(client.get_collection())
 
-        context.log.info(f'Uploaded {len(result.inserted_ids)} records')
+            context.log.info(f'Uploaded {uploaded} records, {writer.docs_per_sec:.0f} docs/sec, '
+                             f'{writer.throttled} throttled batches, {writer.failed} failed')
 
-        # tidy up
-        client.close_connection()
+        finally:
+            # tidy up
+            client.close_connection()
 
     return df
 
 
+@solid(required_resource_keys={'mongo_warehouse'})
+@instrumented
+def stream_csv_to_mongo(context, zip_path, pattern, encoding, header,
+                        chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                        max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Stream csv files from a zip file to mongoDB server, in bounded-size chunks,
+    without materialising the complete data set
+    :param context: execution context
+    :param zip_path: path to zip file
+    :param pattern: regex pattern to match csv files in zip file
+    :param encoding: encoding to use when reading csv files
+    :param header: header to use
+    :param chunk_size: maximum number of rows per chunk
+    :param batch_size: initial number of records per batch
+    :param max_workers: maximum number of concurrent batches
+    :return: number of records uploaded
+    :rtype: int
+    """
+    uploaded = 0
+
+    client = context.resources.mongo_warehouse.get_connection(context)
+
+    if client is not None:
+        context.log.info('Record upload in progress')
+
+        writer = MongoBatchWriter(client.get_collection(), batch_size=batch_size,
+                                  max_workers=max_workers)
+        try:
+            for chunk in read_csv_chunks_from_zip(zip_path, pattern, encoding, header,
+                                                  chunk_size=chunk_size):
+                uploaded += writer.write(chunk)
+            create_mongo_indexes(client.get_collection())
+
+            context.log.info(f'Uploaded {uploaded} records, {writer.docs_per_sec:.0f} docs/sec, '
+                             f'{writer.throttled} throttled batches, {writer.failed} failed')
+
+        finally:
+            # tidy up
+            client.close_connection()
+
+    return uploaded
+
+
 @solid(required_resource_keys={'postgres_warehouse'})
-def upload_to_postgres(context, df):
+@instrumented
+def upload_to_postgres(context, df, trigram_indexes=False):
     """
     Upload panda DataFrame to Postgres server
     :param context: execution context
-    :param df: DataFrame
+    :param df: DataFrame, as produced by process_unlocode with keep_code set
+    :param trigram_indexes: create pg_trgm indexes on the name columns
     :return: dictionary of panda DataFrames
     :rtype: dict
     """
@@ -79,26 +288,24 @@ def upload_to_postgres(context, df):
             cursor.execute('DROP TABLE IF EXISTS airport_codes')
 
             # create table
-            create_table_query = '''CREATE TABLE IF NOT EXISTS airport_codes (
-                        id           SERIAL PRIMARY KEY,
-                        country_code TEXT   NOT NULL,
-                        name_local   TEXT   NOT NULL,
-                        name         TEXT   NOT NULL,
-                        iata         TEXT   NOT NULL,
-                        geo_coord    TEXT,
-                        country      TEXT   NOT NULL
-                        ); '''
-            cursor.execute(create_table_query)
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS airport_codes ({AIRPORT_TABLE_COLUMNS})')
+            for _, statement in lookup_index_sql('airport_codes'):
+                cursor.execute(statement)
+            if trigram_indexes:
+                create_trigram_indexes(cursor, 'airport_codes')
 
             insert_query = """ INSERT INTO airport_codes (
                             country_code,
+                            code,
                             name_local,
                             name,
                             iata,
                             geo_coord,
-                            country
+                            country,
+                            latitude,
+                            longitude
                             ) VALUES %s"""
-            tuples = [tuple(x) for x in df.values]
+            tuples = postgres_tuples(df, POSTGRES_COLUMNS)
 
             # psycopg2.extras.execute_values() doesn't return much, so calc existing & post-insert count
             # airport_codes won't be big, so use count_sql, for big tables estimate using estimate_count_sql
@@ -107,6 +314,7 @@ def upload_to_postgres(context, df):
             pre_len = result[0]
 
             execute_values(cursor, insert_query, tuples)
+            cursor.execute(f'NOTIFY {LOAD_CHANNEL}')
             client.commit()
 
             cursor.execute(count_sql('airport_codes'))
@@ -122,3 +330,424 @@ def upload_to_postgres(context, df):
 
     return df
 
+
+@solid(required_resource_keys={'mongo_warehouse'})
+@instrumented
+def sync_to_mongo(context, df, changes_only=False):
+    """
+    Incrementally synchronise panda DataFrame to mongoDB server, upserting
+    new and modified entries and deleting removed entries, keyed on 'lo' and
+    'code'
+    :param context: execution context
+    :param df: DataFrame
+    :param changes_only: only apply entries with a change indicator; the
+                         stored data must be the previous release
+    :return: panda DataFrame
+    :rtype: panda.DataFrame
+    """
+
+    client = context.resources.mongo_warehouse.get_connection(context)
+
+    if client is not None:
+        try:
+            collection = client.get_collection()
+            create_mongo_indexes(collection)
+
+            upserts, deletes = split_delta(df, changes_only=changes_only)
+
+            # current content, keyed on 'lo' + 'code'
+            stored = {
+                entry_key(doc): doc
+                for doc in collection.find({}, projection={'_id': 0})
+            }
+
+            requests = []
+            for entry in upserts.to_dict(orient='records'):
+                if stored.pop(entry_key(entry), None) != entry:
+                    requests.append(ReplaceOne(entry_filter(entry), entry,
+                                               upsert=True))
+            upsert_count = len(requests)
+
+            delete_entries = deletes.to_dict(orient='records')
+            if not changes_only:
+                # anything not in the release is also removed
+                delete_entries.extend(stored.values())
+            requests.extend([DeleteOne(entry_filter(entry))
+                             for entry in delete_entries])
+
+            context.log.info(f'Synchronising {upsert_count} upserts and '
+                             f'{len(requests) - upsert_count} deletes')
+
+            modified = upserted = deleted = 0
+            for start in range(0, len(requests), MONGO_BULK_SIZE):
+                result = collection.bulk_write(
+                    requests[start:start + MONGO_BULK_SIZE], ordered=False)
+                modified += result.modified_count
+                upserted += result.upserted_count
+                deleted += result.deleted_count
+
+            context.log.info(f'Inserted {upserted}, updated {modified} and '
+                             f'deleted {deleted} records')
+
+        finally:
+            # tidy up
+            client.close_connection()
+
+    return df
+
+
+def sync_frame_to_table(cursor, df, changes_only=False, changed_keys=None):
+    """
+    Incrementally synchronise panda DataFrame to the airport_codes table,
+    upserting new and modified entries and deleting removed entries, keyed on
+    'lo' and 'code'. Entries without a 'code' value are not keyed so are not
+    synchronised. The caller is responsible for committing the transaction.
+    :param cursor: database cursor
+    :param df: DataFrame, as produced by process_unlocode with keep_code set
+    :param changes_only: only apply entries with a change indicator; the
+                         stored data must be the previous release
+    :param changed_keys: DataFrame of the 'lo' and 'code' of all the release
+                         entries marked as added or modified, irrespective of
+                         function; in changes_only mode, those not in `df`
+                         have lost the airport function and are deleted. If
+                         None, such entries can't be identified so are not
+                         deleted
+    :return: dict of the number of records upserted and deleted, and the
+             number of duplicate key records removed from a bulk loaded table
+    :rtype: dict
+    """
+    upserts, deletes = split_delta(coded_entries(df), changes_only=changes_only)
+
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS airport_codes ({AIRPORT_TABLE_COLUMNS})')
+    cursor.execute('ALTER TABLE airport_codes ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION')
+    cursor.execute('ALTER TABLE airport_codes ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION')
+    # tables created by earlier versions have no 'code' column, so
+    # their entries can't be matched and are replaced; bulk loaded tables
+    # may hold entries without a 'code' value, which aren't synchronised
+    cursor.execute('ALTER TABLE airport_codes ADD COLUMN IF NOT EXISTS code TEXT')
+    cursor.execute("DELETE FROM airport_codes WHERE code IS NULL OR code = ''")
+    for _, statement in lookup_index_sql('airport_codes'):
+        cursor.execute(statement)
+
+    cursor.execute('DROP TABLE IF EXISTS airport_codes_delta')
+    cursor.execute('''CREATE TEMP TABLE airport_codes_delta (
+                country_code TEXT,
+                code         TEXT,
+                name_local   TEXT,
+                name         TEXT,
+                iata         TEXT,
+                geo_coord    TEXT,
+                country      TEXT,
+                latitude     DOUBLE PRECISION,
+                longitude    DOUBLE PRECISION
+                ) ON COMMIT DROP''')
+    execute_values(cursor, 'INSERT INTO airport_codes_delta VALUES %s',
+                   postgres_tuples(upserts, POSTGRES_COLUMNS))
+
+    # bulk loaded tables may hold several records of a key; those of keys in
+    # the delta are removed and replaced by the upsert, and of any other keys
+    # only the first record is kept, so the key can be made unique
+    cursor.execute('''DELETE FROM airport_codes a
+                    WHERE EXISTS (
+                        SELECT 1 FROM airport_codes b
+                        WHERE b.country_code = a.country_code
+                        AND b.code = a.code AND b.id <> a.id)
+                    AND (EXISTS (
+                        SELECT 1 FROM airport_codes_delta d
+                        WHERE d.country_code = a.country_code
+                        AND d.code = a.code)
+                    OR EXISTS (
+                        SELECT 1 FROM airport_codes b
+                        WHERE b.country_code = a.country_code
+                        AND b.code = a.code AND b.id < a.id))''')
+    duplicates = cursor.rowcount
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS airport_codes_lo_code_idx '
+                   'ON airport_codes (country_code, code)')
+
+    # only rows whose content has changed are written
+    cursor.execute('''INSERT INTO airport_codes (
+                    country_code, code, name_local, name, iata,
+                    geo_coord, country, latitude, longitude)
+                SELECT country_code, code, name_local, name, iata,
+                    geo_coord, country, latitude, longitude
+                FROM airport_codes_delta
+                ON CONFLICT (country_code, code) DO UPDATE SET
+                    name_local = EXCLUDED.name_local,
+                    name = EXCLUDED.name,
+                    iata = EXCLUDED.iata,
+                    geo_coord = EXCLUDED.geo_coord,
+                    country = EXCLUDED.country,
+                    latitude = EXCLUDED.latitude,
+                    longitude = EXCLUDED.longitude
+                WHERE (airport_codes.name_local, airport_codes.name,
+                       airport_codes.iata, airport_codes.geo_coord,
+                       airport_codes.country)
+                    IS DISTINCT FROM
+                      (EXCLUDED.name_local, EXCLUDED.name,
+                       EXCLUDED.iata, EXCLUDED.geo_coord,
+                       EXCLUDED.country)''')
+    upserted = cursor.rowcount
+
+    if changes_only:
+        delete_keys = {tuple(x) for x in deletes[[COL_LO, COL_CODE]].values}
+        if changed_keys is not None:
+            # modified entries which are no longer airports
+            retained = {tuple(x) for x in coded_entries(df)[[COL_LO, COL_CODE]].values}
+            delete_keys.update(
+                key for key in map(tuple, coded_entries(changed_keys)[[COL_LO, COL_CODE]].values)
+                if key not in retained)
+        deleted = 0
+        if len(delete_keys) > 0:
+            execute_values(cursor,
+                           'DELETE FROM airport_codes WHERE (country_code, code) IN (VALUES %s)',
+                           sorted(delete_keys), page_size=len(delete_keys))
+            deleted = cursor.rowcount
+    else:
+        # anything not in the release is also removed
+        cursor.execute('''DELETE FROM airport_codes a
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM airport_codes_delta d
+                        WHERE d.country_code = a.country_code
+                        AND d.code = a.code)''')
+        deleted = cursor.rowcount
+
+    return {'upserted': upserted, 'deleted': deleted, 'duplicates': duplicates}
+
+
+@solid(required_resource_keys={'postgres_warehouse'})
+@instrumented
+def sync_to_postgres(context, df, changed_keys=None, changes_only=False):
+    """
+    Incrementally synchronise panda DataFrame to Postgres server, upserting
+    new and modified entries and deleting removed entries, keyed on 'lo' and
+    'code'. All changes are applied in a single transaction, so the table is
+    never empty.
+    :param context: execution context
+    :param df: DataFrame, as produced by process_unlocode with keep_code set
+    :param changed_keys: DataFrame of the 'lo' and 'code' of all the release
+                         entries marked as added or modified, as per
+                         sync_frame_to_table
+    :param changes_only: only apply entries with a change indicator; the
+                         stored data must be the previous release
+    :return: panda DataFrame
+    :rtype: panda.DataFrame
+    """
+
+    client = context.resources.postgres_warehouse.get_connection(context)
+
+    if client is not None:
+
+        cursor = client.cursor()
+
+        try:
+            counts = sync_frame_to_table(cursor, df, changes_only=changes_only,
+                                         changed_keys=changed_keys)
+
+            cursor.execute(f'NOTIFY {LOAD_CHANNEL}')
+            client.commit()
+
+            if counts['duplicates'] > 0:
+                context.log.info(f"Removed {counts['duplicates']} duplicate key "
+                                 f"records of a bulk loaded table")
+            context.log.info(f"Upserted {counts['upserted']} and deleted "
+                             f"{counts['deleted']} records")
+
+        finally:
+            # tidy up
+            cursor.close()
+            client.close_connection()
+
+    return df
+
+
+def copy_frame_to_table(cursor, df, table, trigram_indexes=False):
+    """
+    Bulk load panda DataFrame to a Postgres table using COPY. The data is
+    loaded and indexed in a staging table, which then replaces the existing
+    table. The caller is responsible for committing the transaction.
+    :param cursor: database cursor
+    :param df: DataFrame, as produced by process_unlocode with keep_code set
+    :param table: table name
+    :param trigram_indexes: create pg_trgm indexes on the name columns
+    :return: number of records uploaded
+    :rtype: int
+    """
+    for statement in staging_table_sql(table):
+        cursor.execute(statement)
+
+    # stream the DataFrame through an in-memory csv buffer; empty
+    # values are loaded as empty strings, other than country names of
+    # unknown country codes and coordinates, which are NULL
+    buffer = io.StringIO()
+    df[POSTGRES_COLUMNS].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(f'''COPY {table}_staging (
+                    country_code,
+                    code,
+                    name_local,
+                    name,
+                    iata,
+                    geo_coord,
+                    country,
+                    latitude,
+                    longitude
+                    ) FROM STDIN WITH (
+                        FORMAT csv,
+                        FORCE_NOT_NULL (country_code, code, name_local,
+                                        name, iata, geo_coord)
+                    )''', buffer)
+    # rowcount is set from the COPY command status
+    uploaded = cursor.rowcount
+    buffer.close()
+
+    for statement in staging_swap_sql(table, trigram_indexes=trigram_indexes):
+        cursor.execute(statement)
+
+    return uploaded
+
+
+@solid(required_resource_keys={'postgres_warehouse'})
+@instrumented
+def copy_to_postgres(context, df, trigram_indexes=False):
+    """
+    Bulk load panda DataFrame to Postgres server using COPY. The data is
+    loaded and indexed in a staging table, which then replaces the existing
+    table in a single transaction, so readers never see a missing or partially
+    loaded table.
+    :param context: execution context
+    :param df: DataFrame, as produced by process_unlocode with keep_code set
+    :param trigram_indexes: create pg_trgm indexes on the name columns
+    :return: panda DataFrame
+    :rtype: panda.DataFrame
+    """
+
+    client = context.resources.postgres_warehouse.get_connection(context)
+
+    if client is not None:
+
+        cursor = client.cursor()
+
+        try:
+            uploaded = copy_frame_to_table(cursor, df, 'airport_codes',
+                                           trigram_indexes=trigram_indexes)
+            cursor.execute(f'NOTIFY {LOAD_CHANNEL}')
+
+            client.commit()
+
+            context.log.info(f'Uploaded {uploaded} records')
+
+        finally:
+            # tidy up
+            cursor.close()
+            client.close_connection()
+
+    return df
+
+
+@solid(required_resource_keys={'postgres_warehouse'})
+@instrumented
+def copy_partitions_to_postgres(context, df_dict, trigram_indexes=False):
+    """
+    Bulk load panda DataFrames partitioned by function to Postgres server
+    using COPY, one table per function as defined by FUNCTION_TABLES. All
+    tables are replaced in a single transaction.
+    :param context: execution context
+    :param df_dict: dict of DataFrames keyed by function code, as produced by
+                    process_unlocode_by_function with keep_code set
+    :param trigram_indexes: create pg_trgm indexes on the name columns
+    :return: dict of panda DataFrames
+    :rtype: dict
+    """
+
+    client = context.resources.postgres_warehouse.get_connection(context)
+
+    if client is not None:
+
+        cursor = client.cursor()
+
+        try:
+            for function, df in df_dict.items():
+                table = FUNCTION_TABLES[function]
+                uploaded = copy_frame_to_table(cursor, df, table,
+                                               trigram_indexes=trigram_indexes)
+
+                context.log.info(f'Uploaded {uploaded} records to {table}')
+
+            cursor.execute(f'NOTIFY {LOAD_CHANNEL}')
+            client.commit()
+
+        finally:
+            # tidy up
+            cursor.close()
+            client.close_connection()
+
+    return df_dict
+
+
+@solid(required_resource_keys={'postgres_warehouse'})
+@instrumented
+def ingest_releases(context, zip_paths, pattern, encoding, header,
+                    chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Load UN/LOCODE releases into the versioned release store on Postgres
+    server. The releases are identified from the zip file names, and are
+    loaded in release order; releases already in the store are skipped, and
+    each release is loaded in its own transaction. Releases earlier than the
+    latest release in the store are rejected before any release is loaded.
+    :param context: execution context
+    :param zip_paths: list of paths to release zip files, e.g.
+                      ['data/loc202csv.zip', 'data/loc211csv.zip']
+    :param pattern: regex pattern to match csv files in zip file
+    :param encoding: encoding to use when reading csv files
+    :param header: header to use
+    :param chunk_size: maximum number of rows per chunk
+    :return: list of releases loaded
+    :rtype: list
+    """
+    releases = {}
+    for zip_path in zip_paths:
+        release = release_from_path(zip_path)
+        if release is None:
+            raise ValueError(f'Unable to identify release of {zip_path}')
+        releases[release] = zip_path
+
+    loaded = []
+
+    client = context.resources.postgres_warehouse.get_connection(context)
+
+    if client is not None:
+
+        cursor = client.cursor()
+
+        try:
+            for statement in create_store_sql():
+                cursor.execute(statement)
+            client.commit()
+
+            stored = loaded_releases(cursor)
+            pending = pending_releases(releases.keys(), stored)
+            for release in sorted(set(releases.keys()) & set(stored),
+                                  key=release_order):
+                context.log.info(f'Release {release} already loaded')
+
+            for release in pending:
+                df, _ = read_airports_from_zip(releases[release], pattern,
+                                               encoding, header,
+                                               chunk_size=chunk_size,
+                                               columns=PROCESS_COLUMNS,
+                                               dtypes=PROCESS_DTYPES)
+                df = process_partition(df, country_names(df), keep_code=True)
+
+                counts = load_release(cursor, df, release)
+                client.commit()
+                loaded.append(release)
+
+                context.log.info(f'Loaded release {release}; {counts["added"]} '
+                                 f'versions added, {counts["closed"]} closed')
+
+        finally:
+            # tidy up
+            cursor.close()
+            client.close_connection()
+
+    return loaded